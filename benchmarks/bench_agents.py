@@ -0,0 +1,169 @@
+"""Benchmark end-to-end entity creation of the demo agents offline.
+
+Runs `create_linked_entity` of demo_iterative_agent and
+demo_advanced_agent (and `acreate_entity`, the concurrent variant of the
+advanced agent) against the replay providers: LLM responses come from
+`--cassette` or are synthetic schema-valid dummies, embeddings are hash
+based and OSL pages are served from memory (see README, Offline Runs).
+The wall time therefore measures the agents' own overhead (schema
+export / modification, prompt building, parsing, vector store lookups)
+plus `--latency-ms` simulated latency per LLM call.
+
+    python -m benchmarks.bench_agents
+    python -m benchmarks.bench_agents --latency-ms 200 --repeat 5 \
+        --output agents.json
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import statistics
+import tempfile
+import time
+
+from benchmarks.common import print_table, write_results
+
+DESCRIPTION = (
+    "A laboratory process to document an experiment "
+    "created by Dr. Jane Doe, Example Lab Corp., "
+    "starting at 05.03.2025 and ending at 06.03.2025, "
+    "status in finished."
+)
+
+
+def configure_replay(args, directory: str):
+    """point all providers to the offline replay, must run before the
+    agents (and the modules they import) are imported"""
+    os.environ.update({
+        "API_PROVIDER": "replay",
+        "REPLAY_MODE": "replay",
+        "REPLAY_CASSETTE": args.cassette or "",
+        "REPLAY_LATENCY_MS": str(args.latency_ms),
+        "REPLAY_LATENCY_JITTER_MS": "0",
+        "EMBEDDING_API_PROVIDER": "replay",
+        "EMBEDDING_REPLAY_MODE": "replay",
+        "EMBEDDING_REPLAY_CASSETTE": "",
+        "EMBEDDING_REPLAY_LATENCY_MS": "0",
+        "EMBEDDING_CACHE_PATH": "",
+        "OSW_PROVIDER": "replay",
+        "VECTOR_STORE_PATH": os.path.join(directory, "vector_store"),
+        # every run has to call the (replayed) LLM
+        "LLM_CACHE_PATH": "",
+    })
+    os.environ.pop("TRACE_PATH", None)
+
+
+def get_agents() -> dict:
+    """run functions of the agents by name, each resetting the agent's
+    global entity log first"""
+    import demo_advanced_agent
+    import demo_iterative_agent
+
+    def run_iterative(param):
+        demo_iterative_agent.entitites.clear()
+        demo_iterative_agent.entitity_requests.clear()
+        demo_iterative_agent.create_linked_entity(param)
+        return len(demo_iterative_agent.entitites)
+
+    def run_advanced(param):
+        demo_advanced_agent.entities.clear()
+        demo_advanced_agent.entity_requests.clear()
+        demo_advanced_agent.create_linked_entity(param)
+        return len(demo_advanced_agent.entities)
+
+    def run_advanced_async(param):
+        demo_advanced_agent.entities.clear()
+        demo_advanced_agent.entity_requests.clear()
+        asyncio.run(demo_advanced_agent.acreate_entity(param))
+        return len(demo_advanced_agent.entities)
+
+    return {
+        "iterative": (run_iterative, demo_iterative_agent.CreateParam),
+        "advanced": (run_advanced, demo_advanced_agent.CreateParam),
+        "advanced_async": (
+            run_advanced_async, demo_advanced_agent.CreateParam
+        ),
+    }
+
+
+def run_agent(run, param_cls, repeat: int, verbose: bool) -> dict:
+    """time `repeat` runs, counting LLM calls, tokens and retries of
+    invalid responses in a span"""
+    from tracing import span
+
+    times, entities, llm_calls, tokens = [], [], [], []
+    validation_errors, response_retries = [], []
+    for _ in range(repeat):
+        param = param_cls(
+            parent_id="_root_",
+            property_name="_",
+            schema_id="LaboratoryProcess",
+            schema_name="LaboratoryProcess",
+            entity_description=DESCRIPTION,
+        )
+        output = contextlib.nullcontext() if verbose else (
+            contextlib.redirect_stdout(io.StringIO())
+        )
+        with output, span("bench_agents") as run_span:
+            start = time.perf_counter()
+            entities.append(run(param))
+            times.append(time.perf_counter() - start)
+        totals = run_span.get_totals()
+        llm_calls.append(totals["llm_calls"])
+        tokens.append(totals["total_tokens"])
+        validation_errors.append(totals["validation_errors"])
+        response_retries.append(totals["response_retries"])
+    return {
+        "min_s": min(times),
+        "median_s": statistics.median(times),
+        "entities": statistics.median(entities),
+        "llm_calls": statistics.median(llm_calls),
+        "tokens": statistics.median(tokens),
+        "validation_errors": statistics.median(validation_errors),
+        "response_retries": statistics.median(response_retries),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--agents", nargs="+",
+        default=["iterative", "advanced", "advanced_async"],
+    )
+    parser.add_argument(
+        "--cassette", help="recorded LLM responses (default: synthetic)"
+    )
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--verbose", action="store_true", help="show the agents' output"
+    )
+    parser.add_argument("--output", help="write results as JSON")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        configure_replay(args, directory)
+        agents = get_agents()
+        rows = []
+        for name in args.agents:
+            run, param_cls = agents[name]
+            # first run builds the vector store and imports the models
+            run_agent(run, param_cls, 1, args.verbose)
+            rows.append({
+                "agent": name,
+                "llm_latency": args.latency_ms,
+                **run_agent(run, param_cls, args.repeat, args.verbose),
+            })
+
+    print_table(rows, [
+        "agent", "llm_latency", "min_s", "median_s",
+        "entities", "llm_calls", "tokens",
+        "validation_errors", "response_retries",
+    ])
+    if args.output:
+        write_results(args.output, "agents", rows)
+
+
+if __name__ == "__main__":
+    main()
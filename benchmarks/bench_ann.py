@@ -0,0 +1,120 @@
+"""Benchmark recall@k and latency of the IVF index against exact search.
+
+Uses synthetic clustered unit vectors (a gaussian mixture, closer to real
+embeddings than uniform noise) and queries that are perturbed copies of
+stored vectors.
+
+    python -m benchmarks.bench_ann
+    python -m benchmarks.bench_ann --size 1000000 --nprobe 4 16 64
+"""
+import argparse
+import time
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from benchmarks.common import measure, print_table, write_results
+from vector_store import NumpyVectorStore
+
+
+def clustered_vectors(rng, n, dim, n_clusters):
+    centers = rng.standard_normal((n_clusters, dim), dtype=np.float32)
+    labels = rng.integers(0, n_clusters, n)
+    vectors = centers[labels] + 0.5 * rng.standard_normal(
+        (n, dim), dtype=np.float32
+    )
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def top_ids(store, queries, k):
+    return [
+        [
+            doc.id for doc, _ in
+            store.similarity_search_with_score_by_vector(q, k=k)
+        ]
+        for q in queries
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--clusters", type=int, default=1000)
+    parser.add_argument("--nlist", type=int, default=None)
+    parser.add_argument(
+        "--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32]
+    )
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="write results as JSON")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    vectors = clustered_vectors(rng, args.size, args.dim, args.clusters)
+    queries = vectors[rng.choice(args.size, args.queries, replace=False)]
+    queries = queries + 0.1 * rng.standard_normal(
+        queries.shape, dtype=np.float32
+    )
+    documents = [
+        Document(id=f"doc-{i}", page_content="") for i in range(args.size)
+    ]
+
+    embedding = DeterministicFakeEmbedding(size=args.dim)
+    exact = NumpyVectorStore(embedding)
+    exact.add_vectors(vectors, documents)
+    ivf = NumpyVectorStore(embedding, index="ivf", nlist=args.nlist)
+    ivf.add_vectors(vectors, documents)
+    start = time.perf_counter()
+    ivf.index.train(ivf._vectors[:len(ivf)])
+    train_s = time.perf_counter() - start
+    print(
+        f"Trained IVF index with {len(ivf.index.centroids)} lists "
+        f"in {train_s:.2f}s"
+    )
+
+    expected = top_ids(exact, queries, args.k)
+    timing = measure(
+        lambda: top_ids(exact, queries, args.k), repeat=args.repeat
+    )
+    exact_ms = timing["median_s"] / args.queries * 1000
+    rows = [{
+        "index": "exact",
+        "size": args.size,
+        "recall": 1.0,
+        "query_ms": exact_ms,
+        "speedup": 1.0,
+    }]
+    for nprobe in args.nprobe:
+        ivf.index.nprobe = nprobe
+        found = top_ids(ivf, queries, args.k)
+        recall = np.mean([
+            len(set(e) & set(f)) / args.k for e, f in zip(expected, found)
+        ])
+        timing = measure(
+            lambda: top_ids(ivf, queries, args.k), repeat=args.repeat
+        )
+        query_ms = timing["median_s"] / args.queries * 1000
+        rows.append({
+            "index": f"ivf nprobe={nprobe}",
+            "size": args.size,
+            "nlist": len(ivf.index.centroids),
+            "train_s": train_s,
+            "recall": float(recall),
+            "query_ms": query_ms,
+            "speedup": exact_ms / query_ms,
+        })
+
+    print_table(
+        rows,
+        ["index", "size", "nlist", "recall", "query_ms", "speedup"],
+    )
+    if args.output:
+        write_results(args.output, "ann", rows)
+
+
+if __name__ == "__main__":
+    main()
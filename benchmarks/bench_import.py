@@ -0,0 +1,89 @@
+"""Benchmark the import time of the helper modules without network access.
+
+Each module is imported in a fresh interpreter with `socket.connect`
+patched to fail, so an import that logs into OSL, builds a client or
+syncs the vector store fails instead of being measured.
+The default instances (`llm_init.llm`, `osl_init.osl_client`,
+`schema_catalog.source_code` / `source_markdown`) are created on
+first access only.
+
+    python -m benchmarks.bench_import
+    python -m benchmarks.bench_import --repeat 10 --output import.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from benchmarks.common import print_table, write_results
+
+MODULES = ["util", "llm_init", "osl_init", "schema_catalog"]
+
+# run in a fresh interpreter, prints the import time as JSON
+SCRIPT = """
+import json, socket, sys, time
+
+def connect(*args, **kwargs):
+    raise OSError("network access during import")
+
+socket.socket.connect = connect
+socket.socket.connect_ex = connect
+socket.create_connection = connect
+start = time.perf_counter()
+for name in sys.argv[1:]:
+    __import__(name)
+print(json.dumps({"import_ms": (time.perf_counter() - start) * 1000}))
+"""
+
+
+def time_import(modules: list[str], preload: list[str]) -> dict:
+    """import `modules` in a new interpreter after `preload`,
+    return the import time or the error"""
+    # preloaded modules (e.g. pydantic) are imported before the timer
+    # starts to separate the cost of dependencies from our own modules
+    script = "".join(f"import {name}\n" for name in preload) + SCRIPT
+    process = subprocess.run(
+        [sys.executable, "-c", script, *modules],
+        capture_output=True,
+        text=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    if process.returncode != 0:
+        error = process.stderr.strip().splitlines() or ["unknown error"]
+        return {"error": error[-1]}
+    return json.loads(process.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--preload", nargs="*", default=[],
+        help="modules imported before timing, e.g. pydantic dotenv",
+    )
+    parser.add_argument("--output", help="write results as JSON")
+    args = parser.parse_args()
+
+    rows = []
+    for modules in [[name] for name in MODULES] + [MODULES]:
+        results = [
+            time_import(modules, args.preload) for _ in range(args.repeat)
+        ]
+        errors = [r["error"] for r in results if "error" in r]
+        times = [r["import_ms"] for r in results if "import_ms" in r]
+        rows.append({
+            "modules": ", ".join(modules),
+            "min_ms": min(times) if times else None,
+            "median_ms": statistics.median(times) if times else None,
+            "error": errors[0] if errors else "",
+        })
+
+    print_table(rows, ["modules", "min_ms", "median_ms", "error"])
+    if args.output:
+        write_results(args.output, "import", rows)
+
+
+if __name__ == "__main__":
+    main()
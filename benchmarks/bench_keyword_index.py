@@ -0,0 +1,159 @@
+"""Benchmark the BM25 keyword index and hybrid search of NumpyVectorStore.
+
+Uses synthetic person / process documents shaped like OSL jsondata
+(ORCIDs, ISO dates, OSW ids) and a fake embedding, so it measures index
+build time, query latency and exact-identifier hit rate, not the ranking
+quality of a real embedding model. `outside_projection_hit@1` checks that
+the identifier ranking of the entity lookup keeps a true match whose
+ORCID is not part of the indexed (projected) text.
+
+    python -m benchmarks.bench_keyword_index --sizes 1000 10000 50000
+"""
+import argparse
+import json
+import random
+import time
+import uuid
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from benchmarks.common import measure, print_table, write_results
+from keyword_index import BM25Index
+from vector_store import NumpyVectorStore
+
+FIRST_NAMES = ["Jane", "John", "Alex", "Maria", "Wei", "Aisha", "Lars"]
+LAST_NAMES = ["Doe", "Smith", "Müller", "Chen", "Khan", "Olsen", "Rossi"]
+
+
+def random_orcid(rng):
+    digits = "".join(rng.choice("0123456789") for _ in range(15))
+    return f"{digits[:4]}-{digits[4:8]}-{digits[8:12]}-{digits[12:15]}X"
+
+
+def random_documents(rng, n):
+    documents = []
+    for i in range(n):
+        osw_id = "Item:OSW" + uuid.UUID(int=rng.getrandbits(128)).hex
+        if i % 2:
+            jsondata = {
+                "type": ["Category:Person"],
+                "first_name": rng.choice(FIRST_NAMES),
+                "surname": rng.choice(LAST_NAMES),
+                "orcid": random_orcid(rng),
+            }
+        else:
+            jsondata = {
+                "type": ["Category:LaboratoryProcess"],
+                "name": f"Process {i}",
+                "start_date_time": f"2025-{rng.randint(1, 12):02d}-"
+                                   f"{rng.randint(1, 28):02d}",
+                "status": rng.choice(["in progress", "finished"]),
+            }
+        documents.append(Document(
+            id=osw_id,
+            page_content=json.dumps({"jsondata": jsondata}),
+        ))
+    return documents
+
+
+def get_projection_hit_rate(documents, queries, embedding) -> float:
+    """share of lookups that keep the true match as first candidate when
+    its ORCID is not part of the indexed text (outside of the document
+    projection) - osl_init.rank_candidates must not drop it"""
+    from osl_init import rank_candidates
+    projected = []
+    for doc in documents:
+        jsondata = json.loads(doc.page_content)["jsondata"]
+        jsondata.pop("orcid", None)
+        projected.append(Document(
+            id=doc.id, page_content=json.dumps({"jsondata": jsondata})
+        ))
+    store = NumpyVectorStore(embedding, keyword_index=True)
+    store.add_documents(projected)
+    by_id = {doc.id: doc for doc in projected}
+    hits = 0
+    for doc_id, orcid in queries:
+        # the true match is the best vector candidate
+        results = [(by_id[doc_id], 0.9)] + [
+            (doc, 0.5) for doc in projected[:4] if doc.id != doc_id
+        ]
+        ranked = rank_candidates(
+            store, f"Person with ORCID {orcid}", results
+        )
+        hits += ranked[0][0].id == doc_id
+    return hits / len(queries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[1000, 10000, 50000]
+    )
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="write results as JSON")
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    embedding = DeterministicFakeEmbedding(size=64)
+    rows = []
+    for size in args.sizes:
+        documents = random_documents(rng, size)
+        persons = [d for d in documents if "orcid" in d.page_content]
+        queries = [
+            (doc.id, json.loads(doc.page_content)["jsondata"]["orcid"])
+            for doc in rng.sample(persons, min(args.queries, len(persons)))
+        ]
+
+        index = BM25Index()
+        start = time.perf_counter()
+        for doc in documents:
+            index.add(doc.id, doc.page_content)
+        build_s = time.perf_counter() - start
+        hits = sum(
+            index.search(f"Person with ORCID {orcid}", k=1)[0][0] == doc_id
+            for doc_id, orcid in queries
+        )
+        bm25 = measure(
+            lambda: [index.search(orcid, k=20) for _, orcid in queries],
+            repeat=args.repeat,
+        )
+
+        store = NumpyVectorStore(embedding, keyword_index=True)
+        store.add_documents(documents)
+        vector = measure(
+            lambda: [
+                store.similarity_search_with_score(orcid, k=5)
+                for _, orcid in queries
+            ],
+            repeat=args.repeat,
+        )
+        hybrid = measure(
+            lambda: [
+                store.hybrid_search_with_score(orcid, k=5)
+                for _, orcid in queries
+            ],
+            repeat=args.repeat,
+        )
+        stats = index.get_stats()
+        rows.append({
+            "size": size,
+            "terms": stats["terms"],
+            "build_s": build_s,
+            "bm25_ms": bm25["median_s"] / len(queries) * 1000,
+            "vector_ms": vector["median_s"] / len(queries) * 1000,
+            "hybrid_ms": hybrid["median_s"] / len(queries) * 1000,
+            "orcid_hit@1": hits / len(queries),
+            "outside_projection_hit@1": get_projection_hit_rate(
+                documents, queries, embedding
+            ),
+        })
+
+    print_table(rows)
+    if args.output:
+        write_results(args.output, "keyword_index", rows)
+
+
+if __name__ == "__main__":
+    main()
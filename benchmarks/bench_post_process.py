@@ -0,0 +1,114 @@
+"""Benchmark the cleanup of LLM responses, post_process_llm_json_response.
+
+Compares the previous three recursive passes (`remove_nulls`,
+`remove_empty`, `remove_auto_defined_fields`, each building a full copy)
+with the single iterative pass of `post_process_llm_json_response` on
+large synthetic responses of the agents (see bench_schema) and on deeply
+nested responses, which exceed the recursion limit of the three passes.
+
+    python -m benchmarks.bench_post_process
+    python -m benchmarks.bench_post_process --sizes 1000 10000 \
+        --depths 100 5000 --output post_process.json
+"""
+import argparse
+import json
+import random
+
+from benchmarks.bench_schema import random_payload
+from benchmarks.common import measure, print_table, write_results
+
+
+def three_pass(response_json):
+    """the previous implementation"""
+    from util import remove_auto_defined_fields, remove_empty, remove_nulls
+    cleaned_response = remove_nulls(response_json)
+    cleaned_response = remove_empty(cleaned_response)
+    return remove_auto_defined_fields(cleaned_response)
+
+
+def nested_payload(depth) -> dict:
+    """response with `depth` nested sub-entities"""
+    payload = {"uuid": "0", "name": "Leaf", "description": None}
+    for i in range(depth):
+        payload = {
+            "uuid": f"{i:032x}",
+            "type": ["Category:Item"],
+            "name": f"Entity {i}",
+            "label": [{"text": f"Entity {i}", "lang": "en"}, None],
+            "parts": [payload, ""],
+        }
+    return payload
+
+
+def get_size_kb(payload) -> float | None:
+    try:
+        return len(json.dumps(payload)) / 1024
+    except RecursionError:
+        return None  # json.dumps is recursive as well
+
+
+def compare(case: str, payload: dict, repeat: int) -> list[dict]:
+    from util import post_process_llm_json_response
+
+    rows = []
+    results = {}
+    for name, fn in [
+        ("three_pass", three_pass),
+        ("single_pass", post_process_llm_json_response),
+    ]:
+        row = {
+            "case": case,
+            "implementation": name,
+            "size_kb": get_size_kb(payload),
+        }
+        try:
+            results[name] = fn(payload)
+        except RecursionError:
+            row["error"] = "RecursionError"
+            rows.append(row)
+            continue
+        timing = measure(lambda: fn(payload), repeat)
+        row["min_ms"] = timing["min_s"] * 1000
+        row["median_ms"] = timing["median_s"] * 1000
+        rows.append(row)
+    if len(results) == 2:
+        assert results["three_pass"] == results["single_pass"]
+        rows[1]["speedup"] = rows[0]["median_ms"] / rows[1]["median_ms"]
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[100, 1000, 10000],
+        help="entries of the synthetic responses",
+    )
+    parser.add_argument(
+        "--depths", type=int, nargs="+", default=[100, 2000],
+        help="nesting of the deeply nested responses",
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="write results as JSON")
+    args = parser.parse_args()
+
+    rows = []
+    rng = random.Random(42)
+    for size in args.sizes:
+        rows += compare(
+            f"{size} entries", random_payload(rng, size), args.repeat
+        )
+    for depth in args.depths:
+        rows += compare(
+            f"depth {depth}", nested_payload(depth), args.repeat
+        )
+
+    print_table(rows, [
+        "case", "implementation", "size_kb",
+        "min_ms", "median_ms", "speedup", "error",
+    ])
+    if args.output:
+        write_results(args.output, "post_process", rows)
+
+
+if __name__ == "__main__":
+    main()
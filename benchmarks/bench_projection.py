@@ -0,0 +1,150 @@
+"""Benchmark the size of projected document text vs. the full page slots.
+
+Compares `json.dumps(page._slots)` with the compact jsondata projection
+of document_projection: characters, tokens (tiktoken cl100k_base if
+available, otherwise estimated as characters / 4), string memory and the
+size of an LLM judge prompt with k candidates.
+Uses synthetic person / process pages shaped like OSL pages unless
+`--slots-file` points to a JSON list of real page slots.
+
+    python -m benchmarks.bench_projection
+    python -m benchmarks.bench_projection --slots-file slots.json
+"""
+import argparse
+import json
+import random
+import sys
+import uuid
+
+from benchmarks.common import measure, print_table, write_results
+from document_projection import TYPE_FIELDS, get_document_text
+
+PERSON = "Category:OSW44deaa5b806d41a2a88594f562b110e9"
+PROCESS = "Category:OSW0e7fab2262fb4427ad0fa454bc868a0d"
+FIRST_NAMES = ["Jane", "John", "Alex", "Maria", "Wei", "Aisha", "Lars"]
+LAST_NAMES = ["Doe", "Smith", "Müller", "Chen", "Khan", "Olsen", "Rossi"]
+
+
+def random_osw_id(rng, namespace="Item"):
+    return f"{namespace}:OSW" + uuid.UUID(int=rng.getrandbits(128)).hex
+
+
+def random_slots(rng, i):
+    page_uuid = str(uuid.UUID(int=rng.getrandbits(128)))
+    name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+    jsondata = {
+        "uuid": page_uuid,
+        "label": [{"text": name if i % 2 else f"PCR run {i}", "lang": "en"}],
+        "description": [{
+            "text": "Imported from the electronic lab notebook.",
+            "lang": "en",
+        }],
+        "meta": {
+            "uuid": str(uuid.UUID(int=rng.getrandbits(128))),
+            "wiki_page": {"title": "OSW" + page_uuid.replace("-", "")},
+            "change_id": [str(uuid.UUID(int=rng.getrandbits(128)))],
+        },
+        "statements": [],
+        "attachments": [],
+        "based_on": [],
+        "access_policy": None,
+    }
+    if i % 2:
+        first_name, surname = name.split()
+        jsondata.update({
+            "type": [PERSON],
+            "name": name.replace(" ", ""),
+            "first_name": first_name,
+            "surname": surname,
+            "orcid": "-".join(
+                f"{rng.randrange(10000):04d}" for _ in range(4)
+            ),
+            "email": f"{first_name.lower()}@example.org",
+            "organization": [random_osw_id(rng)],
+        })
+    else:
+        jsondata.update({
+            "type": [PROCESS],
+            "name": f"PcrRun{i}",
+            "creator": [random_osw_id(rng)],
+            "start_date_time": f"2025-{rng.randint(1, 12):02d}-"
+                               f"{rng.randint(1, 28):02d}T09:00:00",
+            "status": rng.choice(["in progress", "finished"]),
+            "tool": [random_osw_id(rng) for _ in range(2)],
+            "parameters": [],
+        })
+    return {
+        "main": "",
+        "jsondata": jsondata,
+        "header": "{{#invoke:Entity|header}}",
+        "footer": "{{#invoke:Entity|footer}}",
+        "header_template": None,
+        "footer_template": None,
+    }
+
+
+def get_token_counter():
+    try:
+        import tiktoken
+        # downloads the encoding on first use
+        encoding = tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return "chars/4", lambda text: len(text) // 4
+    return "cl100k_base", lambda text: len(encoding.encode(text))
+
+
+def judge_prompt(texts):
+    return "\n".join(
+        f"- OSW-ID: Item:OSW{i}, Data: {text}" for i, text in enumerate(texts)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=2000)
+    parser.add_argument("--slots-file", help="JSON list of page slots")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="write results as JSON")
+    args = parser.parse_args()
+
+    if args.slots_file:
+        with open(args.slots_file, encoding="utf-8") as f:
+            pages = json.load(f)
+    else:
+        rng = random.Random(42)
+        pages = [random_slots(rng, i) for i in range(args.size)]
+    tokenizer, count_tokens = get_token_counter()
+    print(f"{len(pages)} pages, tokens counted with {tokenizer}")
+
+    rows = []
+    for mode, projections in [("slots", None), ("projection", TYPE_FIELDS)]:
+        texts = [get_document_text(slots, projections) for slots in pages]
+        timing = measure(
+            lambda: [get_document_text(s, projections) for s in pages],
+            repeat=args.repeat,
+        )
+        tokens = sum(count_tokens(text) for text in texts)
+        rows.append({
+            "text": mode,
+            "pages": len(pages),
+            "chars": sum(len(text) for text in texts),
+            "tokens": tokens,
+            "tokens_per_page": tokens / len(pages),
+            "memory_mb": sum(sys.getsizeof(text) for text in texts) / 2**20,
+            "judge_tokens": count_tokens(judge_prompt(texts[:args.k])),
+            "render_ms": timing["median_s"] * 1000,
+        })
+    for key in ["tokens", "memory_mb", "judge_tokens"]:
+        rows[1][f"{key}_saved"] = 1 - rows[1][key] / rows[0][key]
+
+    print_table(rows, [
+        "text", "pages", "chars", "tokens", "tokens_per_page",
+        "memory_mb", "judge_tokens", "render_ms", "tokens_saved",
+    ])
+    if args.output:
+        write_results(args.output, "projection", rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""Benchmark the $ref expansion of modify_schema under different budgets.
+
+Runs `modify_schema` on the exported schemas of the largest
+opensemantic.lab data models without a budget (every reference expanded
+once per definition and shared), with DEFAULT_SCHEMA_BUDGET, with the
+budget configured by SCHEMA_MAX_CHARS / SCHEMA_MAX_REF_DEPTH if it
+differs and with `--depth` / `--chars` limits, and reports the time, the
+size of the resulting schema (which drives the prompt tokens of the
+agents), its object nesting and number of properties and the expansion
+counters.
+
+Characters (object nesting, properties) of the processed schemas before
+the $defs were expanded and now, without and with the default budget:
+
+    class              before             unlimited            default
+    LaboratoryProcess  13037 (2, 47)      94543 (8, 418)       12859 (2, 47)
+    Person             11920 (2, 39)      93426 (8, 410)       10828 (2, 35)
+    ChemicalSubstance  31794 (4, 106)     367670 (10, 1619)    11200 (2, 35)
+    Sampling           62167 (4, 209)     565640 (9, 2484)     13770 (2, 50)
+
+    python -m benchmarks.bench_ref_expansion
+    python -m benchmarks.bench_ref_expansion --top 5 --depth 2 \
+        --chars 30000 --output expansion.json
+"""
+import argparse
+import contextlib
+import io
+import json
+
+from benchmarks.bench_schema import get_lab_classes
+from benchmarks.common import measure, print_table, write_results
+
+
+def get_budgets(args) -> dict:
+    from util import DEFAULT_SCHEMA_BUDGET, get_schema_budget
+    budgets = {
+        "unlimited": {"max_chars": 0, "max_depth": 0},
+        "default": DEFAULT_SCHEMA_BUDGET,
+    }
+    if get_schema_budget() != DEFAULT_SCHEMA_BUDGET:
+        budgets["configured"] = get_schema_budget()
+    budgets[f"depth {args.depth}"] = {"max_chars": 0, "max_depth": args.depth}
+    budgets[f"{args.chars} chars"] = {"max_chars": args.chars, "max_depth": 0}
+    return budgets
+
+
+def get_nesting(schema) -> int:
+    """levels of nested object schemas"""
+    if isinstance(schema, list):
+        return max((get_nesting(item) for item in schema), default=0)
+    if not isinstance(schema, dict):
+        return 0
+    nested = max((get_nesting(value) for value in schema.values()), default=0)
+    return nested + ("properties" in schema)
+
+
+def count_properties(schema) -> int:
+    """properties of all object schemas"""
+    if isinstance(schema, list):
+        return sum(count_properties(item) for item in schema)
+    if not isinstance(schema, dict):
+        return 0
+    properties = schema.get("properties")
+    return (len(properties) if isinstance(properties, dict) else 0) + sum(
+        count_properties(value) for value in schema.values()
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--top", type=int, default=3,
+        help="number of largest opensemantic.lab classes",
+    )
+    parser.add_argument(
+        "--classes", nargs="*", default=["LaboratoryProcess"],
+        help="opensemantic.lab classes measured in addition",
+    )
+    parser.add_argument("--depth", type=int, default=2)
+    parser.add_argument("--chars", type=int, default=30000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="write results as JSON")
+    args = parser.parse_args()
+
+    from util import RefExpansion, modify_schema
+
+    schemas = {}
+    for name, cls in get_lab_classes().items():
+        with contextlib.redirect_stdout(io.StringIO()):
+            try:
+                schemas[name] = cls.export_schema()
+            except Exception as e:
+                print(f"Skipping {name}: {e}")
+    largest = sorted(
+        schemas, key=lambda name: len(json.dumps(schemas[name])),
+        reverse=True,
+    )[:args.top]
+    largest += [name for name in args.classes if name not in largest]
+
+    rows = []
+    for name in largest:
+        schema = schemas[name]
+        for budget_name, budget in get_budgets(args).items():
+            def run():
+                expansion = RefExpansion(schema, **budget)
+                return modify_schema(schema, expansion=expansion), expansion
+            # modify_schema prints a warning per property without type
+            with contextlib.redirect_stdout(io.StringIO()):
+                result, expansion = run()
+                timing = measure(run, args.repeat)
+            report = expansion.get_report(result)
+            rows.append({
+                "case": name,
+                "implementation": budget_name,
+                "median_ms": timing["median_s"] * 1000,
+                "chars": report["chars"],
+                "nesting": get_nesting(result),
+                "properties": count_properties(result),
+                "expanded": report["expanded"],
+                "reused": report["reused"],
+                "cycles": report["cycles"],
+                "budget_cuts": report["budget_cuts"],
+            })
+
+    print_table(rows, [
+        "case", "implementation", "median_ms", "chars", "nesting",
+        "properties", "expanded", "reused", "cycles", "budget_cuts",
+    ])
+    if args.output:
+        write_results(args.output, "ref_expansion", rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""Benchmark the schema and response processing helpers of util.
+
+Measures `modify_schema` and `merge_all_of` on the `export_schema()`
+output of the opensemantic.lab data models (each call on a fresh copy,
+as earlier versions modified their input) and
+`post_process_llm_json_response` on synthetic LLM responses with null,
+empty and auto-defined values.
+
+    python -m benchmarks.bench_schema
+    python -m benchmarks.bench_schema --classes LaboratoryProcess \
+        --payload-sizes 1000 10000 --output schema.json
+"""
+import argparse
+import contextlib
+import copy
+import inspect
+import io
+import json
+import random
+
+from benchmarks.common import measure, print_table, write_results
+
+
+def get_lab_classes(names: list[str] = None) -> dict:
+    """data model classes defined in opensemantic.lab by name"""
+    import opensemantic.lab.v1 as lab
+    from opensemantic.core.v1 import Entity
+    classes = {
+        name: obj for name, obj in vars(lab).items()
+        if inspect.isclass(obj) and issubclass(obj, Entity)
+        and obj.__module__.startswith("opensemantic.lab")
+    }
+    if names:
+        return {name: classes[name] for name in names}
+    return classes
+
+
+def random_payload(rng, n) -> dict:
+    """LLM response with `n` linked entries, shaped like the structured
+    output of the agents: nulls for unknown values, empty strings,
+    ':null' strings and auto-defined uuid / type fields"""
+    def entry(i):
+        return {
+            "uuid": f"{rng.getrandbits(128):032x}",
+            "type": ["Category:OSW" + f"{rng.getrandbits(128):032x}"],
+            "name": f"Entry {i}",
+            "description": rng.choice([None, "", ":null", f"Step {i}"]),
+            "label": [{"text": f"Entry {i}", "lang": "en"}, None],
+            "start_date_time": rng.choice([None, "2025-03-05T10:00:00"]),
+            "keywords": rng.choice([[], [None], ["buffer", "pH"]]),
+            "parameters": {
+                "temperature": rng.choice([None, 21.5]),
+                "unit": rng.choice([None, "", "°C"]),
+                "notes": {"text": None, "lang": None},
+            },
+        }
+    return {
+        "uuid": f"{rng.getrandbits(128):032x}",
+        "type": ["Category:LaboratoryProcess"],
+        "name": "Process",
+        "status": None,
+        "steps": [entry(i) for i in range(n)],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--classes", nargs="*",
+        help="opensemantic.lab class names (default: all)",
+    )
+    parser.add_argument(
+        "--payload-sizes", type=int, nargs="+", default=[100, 1000, 10000]
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="write results as JSON")
+    args = parser.parse_args()
+
+    from util import (
+        merge_all_of,
+        modify_schema,
+        post_process_llm_json_response,
+    )
+
+    rows = []
+    for name, cls in get_lab_classes(args.classes).items():
+        # modify_schema prints a warning per property without type
+        with contextlib.redirect_stdout(io.StringIO()):
+            schema = cls.export_schema()
+            cases = {
+                "modify_schema": measure(
+                    modify_schema, args.repeat,
+                    setup=lambda: copy.deepcopy(schema),
+                ),
+                "merge_all_of": measure(
+                    merge_all_of, args.repeat,
+                    setup=lambda: copy.deepcopy(schema),
+                ),
+            }
+        for case, timing in cases.items():
+            rows.append({
+                "case": case,
+                "input": name,
+                "size_kb": len(json.dumps(schema)) / 1024,
+                "min_ms": timing["min_s"] * 1000,
+                "median_ms": timing["median_s"] * 1000,
+            })
+
+    rng = random.Random(42)
+    for size in args.payload_sizes:
+        payload = random_payload(rng, size)
+        timing = measure(
+            post_process_llm_json_response, args.repeat,
+            setup=lambda: copy.deepcopy(payload),
+        )
+        rows.append({
+            "case": "post_process_llm_json_response",
+            "input": f"{size} entries",
+            "size_kb": len(json.dumps(payload)) / 1024,
+            "min_ms": timing["min_s"] * 1000,
+            "median_ms": timing["median_s"] * 1000,
+        })
+
+    print_table(rows, ["case", "input", "size_kb", "min_ms", "median_ms"])
+    if args.output:
+        write_results(args.output, "schema", rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Benchmark the schema pipeline of the advanced agent with and without
+deep copies.
+
+`deep_copy` is the previous approach: modify_schema changed its input,
+so the exported schema was deep copied before filtering it.
+`copy_on_write` filters and modifies the exported schema directly, only
+changed dicts / lists are copied and unchanged subschemas are shared.
+Measures the time and the peak memory (tracemalloc) of
+filter + modify_schema on the largest opensemantic.lab data models with
+a random half of their properties kept.
+
+    python -m benchmarks.bench_schema_copies
+    python -m benchmarks.bench_schema_copies --top 5 --output copies.json
+"""
+import argparse
+import contextlib
+import copy
+import io
+import json
+import random
+import tracemalloc
+
+from benchmarks.bench_schema import get_lab_classes
+from benchmarks.common import measure, print_table, write_results
+
+
+def get_pipelines(schema: dict, properties: list[str]) -> dict:
+    from util import filter_properties, modify_schema
+    return {
+        "deep_copy": lambda: modify_schema(
+            filter_properties(copy.deepcopy(schema), properties)
+        ),
+        "copy_on_write": lambda: modify_schema(
+            filter_properties(schema, properties)
+        ),
+    }
+
+
+def get_peak_kb(fn) -> float:
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1] / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--top", type=int, default=3,
+        help="number of largest opensemantic.lab classes",
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="write results as JSON")
+    args = parser.parse_args()
+
+    schemas = {}
+    for name, cls in get_lab_classes().items():
+        with contextlib.redirect_stdout(io.StringIO()):
+            schemas[name] = cls.export_schema()
+    largest = sorted(
+        schemas, key=lambda name: len(json.dumps(schemas[name])),
+        reverse=True,
+    )[:args.top]
+
+    rng = random.Random(42)
+    rows = []
+    for name in largest:
+        schema = schemas[name]
+        properties = rng.sample(
+            list(schema["properties"]), len(schema["properties"]) // 2
+        )
+        before = json.dumps(schema)
+        results = {}
+        # modify_schema prints a warning per property without type
+        with contextlib.redirect_stdout(io.StringIO()):
+            for pipeline, fn in get_pipelines(schema, properties).items():
+                results[pipeline] = json.dumps(fn())
+                rows.append({
+                    "case": name,
+                    "implementation": pipeline,
+                    "size_kb": len(before) / 1024,
+                    "median_ms": measure(fn, args.repeat)["median_s"] * 1000,
+                    "peak_kb": get_peak_kb(fn),
+                })
+        assert len(set(results.values())) == 1, "pipelines differ"
+        assert json.dumps(schema) == before, "input schema was modified"
+
+    print_table(rows, [
+        "case", "implementation", "size_kb", "median_ms", "peak_kb",
+    ])
+    if args.output:
+        write_results(args.output, "schema_copies", rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""Benchmark util.unique_array, the deduplication of merge_deep.
+
+The exported schemas of single data models are already flattened, so
+the benchmark composes the largest opensemantic.lab data models with
+allOf, as a schema inheriting from several categories, records the
+arrays deduplicated while `merge_all_of` merges them (required lists,
+enums, default properties, anyOf branches) and compares `unique_array`
+(== scan for short arrays, canonical hash keys for long ones) with the
+previous pairwise `deep_equal` version on them and on synthetic arrays
+of growing length. The `scan` and `hash` rows use only one of the two
+paths of `unique_array` for all lengths, their crossover justifies
+UNIQUE_ARRAY_HASH_MIN_LENGTH.
+
+    python -m benchmarks.bench_unique_array
+    python -m benchmarks.bench_unique_array --top 5 --sizes 100 1000 5000
+"""
+import argparse
+import contextlib
+import copy
+import io
+import json
+import random
+
+from benchmarks.bench_schema import get_lab_classes
+from benchmarks.common import measure, print_table, write_results
+
+
+def unique_array_pairwise(array):
+    """the previous implementation, O(n²) deep_equal calls"""
+    from util import deep_equal
+    result = []
+    for item in array:
+        add = True
+        for added_item in result:
+            if deep_equal(added_item, item):
+                add = False
+                break
+        if add:
+            result.append(item)
+    return result
+
+
+@contextlib.contextmanager
+def record_unique_array_calls(arrays: list):
+    """append the input of every util.unique_array call to `arrays`"""
+    import util
+    unique_array = util.unique_array
+
+    def recording_unique_array(array):
+        arrays.append(array)
+        return unique_array(array)
+
+    util.unique_array = recording_unique_array
+    try:
+        yield
+    finally:
+        util.unique_array = unique_array
+
+
+@contextlib.contextmanager
+def hash_min_length(length):
+    """run util.unique_array with another UNIQUE_ARRAY_HASH_MIN_LENGTH,
+    unchanged if None"""
+    import util
+    default = util.UNIQUE_ARRAY_HASH_MIN_LENGTH
+    if length is not None:
+        util.UNIQUE_ARRAY_HASH_MIN_LENGTH = length
+    try:
+        yield
+    finally:
+        util.UNIQUE_ARRAY_HASH_MIN_LENGTH = default
+
+
+def random_array(rng, n) -> list:
+    """`n` anyOf-like subschemas, about half of them duplicates with
+    reordered keys"""
+    items = []
+    for i in range(n):
+        if i and rng.random() < 0.5:
+            item = copy.deepcopy(rng.choice(items))
+            item = dict(reversed(list(item.items())))
+        else:
+            item = {
+                "type": rng.choice(["string", "integer", "object"]),
+                "title": f"Option {i}",
+                "enum": [f"Item:OSW{rng.getrandbits(64):016x}"],
+                "required": ["uuid", "type", "name"],
+            }
+        items.append(item)
+    return items
+
+
+def compare(case: str, arrays: list[list], repeat: int) -> list[dict]:
+    from util import unique_array
+
+    def dedup_all(fn, length):
+        def run():
+            with hash_min_length(length):
+                return [fn(array) for array in arrays]
+        return run
+
+    implementations = [
+        ("pairwise", unique_array_pairwise, None),
+        ("unique_array", unique_array, None),
+        # each path of unique_array for all lengths
+        ("scan", unique_array, float("inf")),
+        ("hash", unique_array, 0),
+    ]
+
+    for array in arrays:
+        assert unique_array(array) == unique_array_pairwise(array)
+    rows = []
+    for name, fn, length in implementations:
+        timing = measure(dedup_all(fn, length), repeat)
+        rows.append({
+            "case": case,
+            "implementation": name,
+            "arrays": len(arrays),
+            "items": sum(len(array) for array in arrays),
+            "min_ms": timing["min_s"] * 1000,
+            "median_ms": timing["median_s"] * 1000,
+        })
+    for row in rows[1:]:
+        row["speedup"] = rows[0]["median_ms"] / row["median_ms"]
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--top", type=int, default=3,
+        help="number of largest opensemantic.lab classes",
+    )
+    parser.add_argument(
+        "--sizes", type=int, nargs="+",
+        default=[100, 300, 500, 1000, 3000],
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="write results as JSON")
+    args = parser.parse_args()
+
+    from util import merge_all_of
+
+    schemas = {}
+    for name, cls in get_lab_classes().items():
+        with contextlib.redirect_stdout(io.StringIO()):
+            schemas[name] = copy.deepcopy(cls.export_schema())
+    largest = sorted(
+        schemas, key=lambda name: len(json.dumps(schemas[name])),
+        reverse=True,
+    )[:args.top]
+
+    rows = []
+    for n in range(2, len(largest) + 1):
+        case = "allOf " + " + ".join(largest[:n])
+        composed = {"allOf": [schemas[name] for name in largest[:n]]}
+        arrays = []
+        with record_unique_array_calls(arrays):
+            merge_all_of(composed)
+        rows += compare(case, arrays, args.repeat)
+        timing = measure(lambda: merge_all_of(composed), args.repeat)
+        rows.append({
+            "case": case,
+            "implementation": "merge_all_of",
+            "min_ms": timing["min_s"] * 1000,
+            "median_ms": timing["median_s"] * 1000,
+        })
+
+    rng = random.Random(42)
+    for size in args.sizes:
+        rows += compare(
+            f"{size} items", [random_array(rng, size)], args.repeat
+        )
+
+    print_table(rows, [
+        "case", "implementation", "arrays", "items",
+        "min_ms", "median_ms", "speedup",
+    ])
+    if args.output:
+        write_results(args.output, "unique_array", rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Benchmark the compiled validation of structured responses.
+
+Compiles the processed schemas (export_schema + modify_schema) of the
+largest opensemantic.lab data models with schema_validation and
+validates schema-valid responses (the synthetic responses of the replay
+provider) and invalid ones (every string replaced by a number), which
+report a violation with JSON path per string. `throughput` is the number
+of validations of the valid response per second.
+
+    python -m benchmarks.bench_validation
+    python -m benchmarks.bench_validation --top 5 --output validation.json
+"""
+import argparse
+import contextlib
+import io
+import json
+
+from benchmarks.bench_schema import get_lab_classes
+from benchmarks.common import measure, print_table, write_results
+
+
+def invalidate(value):
+    """`value` with every string replaced by a number"""
+    if isinstance(value, dict):
+        return {key: invalidate(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [invalidate(item) for item in value]
+    if isinstance(value, str):
+        return len(value)
+    return value
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--top", type=int, default=3,
+        help="number of largest opensemantic.lab classes",
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="write results as JSON")
+    args = parser.parse_args()
+
+    from replay import get_dummy_value
+    from schema_validation import SchemaValidator
+    from util import modify_schema
+
+    schemas = {}
+    for name, cls in get_lab_classes().items():
+        # modify_schema prints a warning per property without type
+        with contextlib.redirect_stdout(io.StringIO()):
+            try:
+                schemas[name] = modify_schema(cls.export_schema())
+            except Exception as e:
+                print(f"Skipping {name}: {e}")
+    largest = sorted(
+        schemas, key=lambda name: len(json.dumps(schemas[name])),
+        reverse=True,
+    )[:args.top]
+
+    rows = []
+    for name in largest:
+        schema = schemas[name]
+        valid = get_dummy_value(schema)
+        invalid = invalidate(valid)
+        validator = SchemaValidator(schema)
+        assert validator.is_valid(valid), validator.validate(valid)
+        compile_timing = measure(lambda: SchemaValidator(schema), args.repeat)
+        valid_timing = measure(
+            lambda: validator.validate(valid), args.repeat * 20
+        )
+        invalid_timing = measure(
+            lambda: validator.validate(invalid), args.repeat * 20
+        )
+        rows.append({
+            "case": name,
+            "schema_kb": len(json.dumps(schema)) / 1024,
+            "response_kb": len(json.dumps(valid)) / 1024,
+            "compile_ms": compile_timing["median_s"] * 1000,
+            "valid_ms": valid_timing["median_s"] * 1000,
+            "invalid_ms": invalid_timing["median_s"] * 1000,
+            "errors": len(validator.validate(invalid)),
+            "throughput": 1 / valid_timing["median_s"],
+        })
+
+    print_table(rows, [
+        "case", "schema_kb", "response_kb", "compile_ms",
+        "valid_ms", "invalid_ms", "errors", "throughput",
+    ])
+    if args.output:
+        write_results(args.output, "validation", rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""Benchmark NumpyVectorStore against langchain's InMemoryVectorStore.
+
+Uses random unit vectors instead of real embeddings, so only storage
+and scoring are measured (no embedding API calls).
+
+    python -m benchmarks.bench_vector_store
+    python -m benchmarks.bench_vector_store --sizes 10000 100000 --dim 3072
+"""
+import argparse
+import time
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.vectorstores import InMemoryVectorStore
+
+from benchmarks.common import measure, print_table, write_results
+from vector_store import NumpyVectorStore
+
+
+def random_vectors(rng, n, dim):
+    vectors = rng.standard_normal((n, dim), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def build_numpy_store(vectors):
+    store = NumpyVectorStore(DeterministicFakeEmbedding(size=vectors.shape[1]))
+    documents = [
+        Document(id=f"doc-{i}", page_content="") for i in range(len(vectors))
+    ]
+    store.add_vectors(vectors, documents)
+    return store
+
+
+def build_in_memory_store(vectors):
+    store = InMemoryVectorStore(
+        DeterministicFakeEmbedding(size=vectors.shape[1])
+    )
+    # fill the internal dict directly to skip embedding
+    for i, vector in enumerate(vectors):
+        store.store[f"doc-{i}"] = {
+            "id": f"doc-{i}",
+            "vector": vector.tolist(),
+            "text": "",
+            "metadata": {},
+        }
+    return store
+
+
+def run_queries(store, queries, k):
+    return [
+        store.similarity_search_with_score_by_vector(q.tolist(), k=k)
+        for q in queries
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[10000, 100000, 1000000]
+    )
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument(
+        "--baseline-max", type=int, default=100000,
+        help="skip InMemoryVectorStore above this corpus size "
+             "(it keeps every vector as a python list)"
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="write results as JSON")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    queries = random_vectors(rng, args.queries, args.dim)
+    rows = []
+    for size in args.sizes:
+        vectors = random_vectors(rng, size, args.dim)
+
+        stores = {}
+        start = time.perf_counter()
+        stores["numpy"] = build_numpy_store(vectors)
+        build_s = {"numpy": time.perf_counter() - start}
+        if size <= args.baseline_max:
+            start = time.perf_counter()
+            stores["in_memory"] = build_in_memory_store(vectors)
+            build_s["in_memory"] = time.perf_counter() - start
+
+        results = {}
+        for name, store in stores.items():
+            timing = measure(
+                lambda: run_queries(store, queries, args.k),
+                repeat=args.repeat,
+            )
+            results[name] = run_queries(store, queries[:1], args.k)[0]
+            rows.append({
+                "store": name,
+                "size": size,
+                "dim": args.dim,
+                "build_s": build_s[name],
+                "query_ms": timing["median_s"] / args.queries * 1000,
+            })
+
+        if "in_memory" in results:
+            numpy_ids = [doc.id for doc, _ in results["numpy"]]
+            baseline_ids = [doc.id for doc, _ in results["in_memory"]]
+            if numpy_ids != baseline_ids:
+                print(f"Warning: top-{args.k} differs at size {size}")
+            speedup = rows[-1]["query_ms"] / rows[-2]["query_ms"]
+            rows[-2]["speedup"] = speedup
+        del stores, vectors
+
+    print_table(
+        rows, ["store", "size", "dim", "build_s", "query_ms", "speedup"]
+    )
+    if args.output:
+        write_results(args.output, "vector_store", rows)
+
+
+if __name__ == "__main__":
+    main()
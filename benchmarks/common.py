@@ -0,0 +1,68 @@
+import json
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+
+
+def measure(fn, repeat=5, warmup=1, setup=None) -> dict:
+    """call `fn` `warmup` + `repeat` times and return timing statistics
+    of the measured calls in seconds. If given, `setup` is called
+    untimed before each call and its result passed to `fn`, e.g. a fresh
+    copy of an input that `fn` modifies."""
+    def call():
+        if setup is None:
+            start = time.perf_counter()
+            fn()
+        else:
+            arg = setup()
+            start = time.perf_counter()
+            fn(arg)
+        return time.perf_counter() - start
+
+    for _ in range(warmup):
+        call()
+    times = [call() for _ in range(repeat)]
+    return {
+        "min_s": min(times),
+        "median_s": statistics.median(times),
+        "mean_s": statistics.fmean(times),
+        "repeat": repeat,
+    }
+
+
+def print_table(rows: list[dict], columns: list[str] = None):
+    """print a list of result dicts as an aligned text table"""
+    if not rows:
+        return
+    columns = columns or list(rows[0].keys())
+
+    def fmt(value):
+        if isinstance(value, float):
+            return f"{value:.6g}"
+        return str(value)
+
+    cells = [[fmt(row.get(col, "")) for col in columns] for row in rows]
+    widths = [
+        max(len(col), *(len(line[i]) for line in cells))
+        for i, col in enumerate(columns)
+    ]
+    print("  ".join(col.ljust(w) for col, w in zip(columns, widths)))
+    print("  ".join("-" * w for w in widths))
+    for line in cells:
+        print("  ".join(cell.ljust(w) for cell, w in zip(line, widths)))
+
+
+def write_results(path: str, name: str, results: list[dict]):
+    """write benchmark results together with environment info as JSON"""
+    data = {
+        "benchmark": name,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "results": results,
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    print(f"Results written to {path}")
@@ -0,0 +1,208 @@
+"""Run the benchmark suite and compare the results with a baseline.
+
+Each benchmark runs in its own interpreter (`python -m benchmarks.<name>`
+with the arguments of SUITE, sized to finish in a few minutes offline),
+the results are merged into one JSON file together with the git commit.
+Timings (`*_s`, `*_ms`) of matching rows that are slower than the
+baseline by more than `--threshold` are reported as regressions and
+make the command exit with status 1.
+
+    python -m benchmarks.suite --output results.json
+    python -m benchmarks.suite --baseline results.json --threshold 0.3
+    python -m benchmarks.suite --only bench_schema bench_agents
+    python -m benchmarks.suite --compare baseline.json results.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+from datetime import datetime, timezone
+
+from benchmarks.common import print_table
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# benchmark module and arguments, run in this order
+SUITE = [
+    ("bench_import", ["--repeat", "3"]),
+    ("bench_schema", ["--repeat", "3"]),
+    ("bench_unique_array", ["--repeat", "3"]),
+    ("bench_schema_copies", ["--repeat", "3"]),
+    ("bench_ref_expansion", ["--repeat", "3"]),
+    ("bench_post_process", ["--repeat", "3"]),
+    ("bench_validation", ["--repeat", "3"]),
+    ("bench_vector_store", ["--sizes", "1000", "10000", "50000"]),
+    ("bench_keyword_index", ["--sizes", "1000", "10000"]),
+    ("bench_ann", ["--size", "20000", "--clusters", "200"]),
+    ("bench_projection", []),
+    ("bench_agents", ["--repeat", "3"]),
+]
+
+
+def get_git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True, text=True, cwd=ROOT, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(name: str, args: list[str], directory: str) -> dict:
+    """run a benchmark module, return its results or the error"""
+    path = os.path.join(directory, f"{name}.json")
+    print(f"\n=== {name} {' '.join(args)} ===", flush=True)
+    process = subprocess.run(
+        [sys.executable, "-m", f"benchmarks.{name}", *args, "--output", path],
+        cwd=ROOT,
+    )
+    if process.returncode != 0 or not os.path.isfile(path):
+        return {"error": f"exit status {process.returncode}", "results": []}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def is_timing(key: str) -> bool:
+    return key.endswith("_s") or key.endswith("_ms")
+
+
+# result columns identifying a row across runs, e.g. the case name and
+# input size (other measurements, like recall or token counts, are
+# compared on equal inputs)
+IDENTITY_KEYS = [
+    "agent", "case", "implementation", "input", "index", "modules",
+    "store", "text", "size", "dim", "pages", "llm_latency",
+]
+
+
+def get_row_key(row: dict) -> tuple:
+    return tuple(
+        (key, row[key]) for key in IDENTITY_KEYS if key in row
+    )
+
+
+def compare(baseline: dict, results: dict, threshold: float) -> list[dict]:
+    """timings of matching rows of all benchmarks in both runs,
+    `regression` is set where the ratio exceeds 1 + threshold"""
+    comparison = []
+    for name, benchmark in results["benchmarks"].items():
+        previous = baseline.get("benchmarks", {}).get(name)
+        if previous is None:
+            continue
+        previous_rows = {
+            get_row_key(row): row for row in previous.get("results", [])
+        }
+        for row in benchmark.get("results", []):
+            key = get_row_key(row)
+            previous_row = previous_rows.get(key)
+            if previous_row is None:
+                continue
+            for metric, value in row.items():
+                before = previous_row.get(metric)
+                if (
+                    not is_timing(metric)
+                    or not isinstance(value, (int, float))
+                    or not isinstance(before, (int, float))
+                    or before <= 0
+                ):
+                    continue
+                ratio = value / before
+                comparison.append({
+                    "benchmark": name,
+                    "row": ", ".join(str(v) for _, v in key),
+                    "metric": metric,
+                    "baseline": before,
+                    "current": value,
+                    "ratio": ratio,
+                    "regression": ratio > 1 + threshold,
+                })
+    return comparison
+
+
+def report(comparison: list[dict]) -> bool:
+    """print the comparison, return True if there is any regression"""
+    regressions = [c for c in comparison if c["regression"]]
+    print(f"\n=== Comparison ({len(comparison)} timings) ===")
+    print_table(comparison, [
+        "benchmark", "row", "metric", "baseline", "current", "ratio",
+        "regression",
+    ])
+    if regressions:
+        print(f"\n{len(regressions)} regression(s):")
+        print_table(regressions, [
+            "benchmark", "row", "metric", "baseline", "current", "ratio",
+        ])
+    else:
+        print("\nNo regressions")
+    return bool(regressions)
+
+
+def load(path: str) -> dict:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--only", nargs="+", help="benchmark modules to run (default: all)"
+    )
+    parser.add_argument("--output", help="write the merged results as JSON")
+    parser.add_argument("--baseline", help="results to compare with")
+    parser.add_argument(
+        "--threshold", type=float, default=0.2,
+        help="relative slowdown reported as regression (default: 0.2)",
+    )
+    parser.add_argument(
+        "--compare", nargs=2, metavar=("BASELINE", "RESULTS"),
+        help="only compare two result files",
+    )
+    args = parser.parse_args()
+
+    if args.compare:
+        baseline, results = (load(path) for path in args.compare)
+        sys.exit(1 if report(
+            compare(baseline, results, args.threshold)
+        ) else 0)
+
+    results = {
+        "suite": "osl-eln-demo",
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_commit": get_git_commit(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "benchmarks": {},
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        for name, bench_args in SUITE:
+            if args.only and name not in args.only:
+                continue
+            results["benchmarks"][name] = run_benchmark(
+                name, bench_args, directory
+            )
+
+    failed = [
+        name for name, benchmark in results["benchmarks"].items()
+        if "error" in benchmark
+    ]
+    if failed:
+        print(f"\nFailed benchmarks: {', '.join(failed)}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    regression = False
+    if args.baseline:
+        regression = report(
+            compare(load(args.baseline), results, args.threshold)
+        )
+    sys.exit(1 if failed or regression else 0)
+
+
+if __name__ == "__main__":
+    main()
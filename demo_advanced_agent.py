@@ -1,4 +1,6 @@
+import asyncio
 import uuid
+from os import environ
 from langchain.agents import create_agent
 from langchain.agents.structured_output import ProviderStrategy, ToolStrategy
 
@@ -15,19 +17,36 @@ import opensemantic.lab.v1  # noqa: F401 needed for eval
 from pydantic import BaseModel, Field
 
 from util import (
-    modify_schema,
+    get_json_size,
     post_process_llm_json_response,
-    deep_copy,
 )
 
 import json
 
-from llm_init import get_llm, model_supports_structured_output
-from schema_catalog import lookup_exact_schema
+from llm_cache import llm_cache_step
+from llm_init import (
+    get_llm,
+    get_llm_cache,
+    model_supports_structured_output,
+)
+from rate_limit import get_rate_limit_stats
+from replay import get_replay_stats
+from tracing import (
+    add_to_span,
+    export_traces,
+    get_summary,
+    set_span_attributes,
+    span,
+    traced,
+)
+from schema_catalog import alookup_exact_schema, lookup_exact_schema
+from schema_cache import get_exported_schema, get_schema_cache
+from schema_validation import get_validation_feedback, validate_response
 from osw.core import OSW
 from osl_init import (
-    build_vector_store,
+    get_vector_store,
     get_osl_client,
+    alookup_excact_matching_entity,
     lookup_excact_matching_entity,
 )
 
@@ -71,20 +90,13 @@ class ComparisonResult(BaseModel):
 
 entities = {}
 entity_requests = {}
-vector_store = build_vector_store()
 
 
-def identify_fillable_properties(
+def get_fillable_properties_prompt(
     entity_description: str,
     schema: dict,
-    llm
-) -> list[str]:
-    """Step 3: Ask LLM to identify which properties can actually be filled
-    based on the provided description without inventing data.
-    Returns list of property names that can be filled.
-    """
-    print("\n>> Identifying fillable properties...")
-
+) -> str:
+    """prompt asking which schema properties can be filled"""
     properties = schema.get("properties", {})
     property_descriptions = {
         prop: {
@@ -95,7 +107,7 @@ def identify_fillable_properties(
         for prop, props in properties.items()
     }
 
-    prompt = f"""Given the following entity description:
+    return f"""Given the following entity description:
 "{entity_description}"
 
 And the following schema properties:
@@ -109,7 +121,11 @@ Return your answer as a JSON array of property names,
 e.g.: ["property1", "property2"]
 """
 
-    response = llm.invoke(prompt)
+
+def parse_fillable_properties(response, schema: dict) -> list[str]:
+    """extract the property names from the llm response,
+    falls back to all properties"""
+    properties = schema.get("properties", {})
     try:
         # Extract JSON array from response
         content = (
@@ -134,35 +150,33 @@ e.g.: ["property1", "property2"]
         return list(properties.keys())
 
 
-def filter_schema_properties(
-    schema: dict, fillable_properties: list[str]
-) -> dict:
-    """Step 4: Remove properties that cannot be filled from the schema.
-    Always keeps required properties even if not in fillable list."""
-    print(
-        "\n>> Filtering schema to only include fillable properties..."
-    )
-
-    filtered_schema = deep_copy(schema)
-
-    if "properties" in filtered_schema:
-        required_props = filtered_schema.get("required", [])
-
-        # Keep fillable properties AND required properties
-        properties_to_keep = set(fillable_properties) | set(required_props)
-
-        filtered_schema["properties"] = {
-            prop: props
-            for prop, props in filtered_schema["properties"].items()
-            if prop in properties_to_keep
-        }
+def identify_fillable_properties(
+    entity_description: str,
+    schema: dict,
+    llm
+) -> list[str]:
+    """Step 3: Ask LLM to identify which properties can actually be filled
+    based on the provided description without inventing data.
+    Returns list of property names that can be filled.
+    """
+    print("\n>> Identifying fillable properties...")
+    prompt = get_fillable_properties_prompt(entity_description, schema)
+    with llm_cache_step("identify_fillable_properties"):
+        response = llm.invoke(prompt)
+    return parse_fillable_properties(response, schema)
 
-        # Keep all required fields unchanged
-        # (they are required by the schema)
 
-    num_props = len(filtered_schema.get('properties', {}))
-    print(f"Filtered schema has {num_props} properties")
-    return filtered_schema
+async def aidentify_fillable_properties(
+    entity_description: str,
+    schema: dict,
+    llm
+) -> list[str]:
+    """async variant of identify_fillable_properties"""
+    print("\n>> Identifying fillable properties...")
+    prompt = get_fillable_properties_prompt(entity_description, schema)
+    with llm_cache_step("identify_fillable_properties"):
+        response = await llm.ainvoke(prompt)
+    return parse_fillable_properties(response, schema)
 
 
 def extract_range_properties(schema: dict) -> dict:
@@ -197,40 +211,8 @@ def compare_with_previous_requests(param: CreateParam) -> str | None:
     return None
 
 
-def create_linked_entity(param: CreateParam) -> str | None:
-    """Advanced approach: Create a linked entity with property filtering
-    and post-processing of range properties.
-
-    Steps:
-    1. Lookup schema
-    2. Compare with previous requests (early comparison)
-    3. Identify fillable properties
-    4. Filter schema
-    5. Create entity with structured output (range props as strings)
-    6. Post-process range properties
-    7. Compare with existing entities
-    8. Store and return
-    """
-    print((
-        f"\n\n>> Lookup or create entity for "
-        f"parent entity '{param.parent_id}', "
-        f"property '{param.property_name}', "
-        f"range '{param.schema_id}, {param.schema_name}' "
-        f"based on description {param.entity_description}"
-    ))
-
-    entity_uuid = uuid.uuid4()
-    entity_id = "Item:OSW" + entity_uuid.hex
-
-    # Step 2: Early comparison with previous requests
-    existing_from_log = compare_with_previous_requests(param)
-    if existing_from_log is not None:
-        return existing_from_log
-
-    # Store this request
-    entity_requests[entity_id] = param
-
-    # Step 1: Lookup schema
+def get_schema_lookup_prompt(param: CreateParam) -> str:
+    """Step 1 prompt: describe the requested entity for the schema lookup"""
     prompt = ""
     if param.schema_id != "":
         prompt = "The schema id is " + param.schema_id + ". "
@@ -239,8 +221,12 @@ def create_linked_entity(param: CreateParam) -> str | None:
     if param.entity_description != "":
         prompt += "The entity I want to describe: "
         prompt += param.entity_description + ". "
+    return prompt
 
-    schema_name = lookup_exact_schema(prompt)
+
+def get_schema_class(schema_name: str, param: CreateParam):
+    """resolve the class path returned by the schema lookup and export
+    its schema. Returns (schema_cls, target_schema) or None"""
     print(f"LLM returned class path: {schema_name}")
 
     # Get the class from the path
@@ -257,51 +243,65 @@ def create_linked_entity(param: CreateParam) -> str | None:
 
     # Export the schema (without modification yet)
     try:
-        target_schema = schema_cls.export_schema()
+        target_schema = get_exported_schema(schema_cls)
     except Exception as e:
         print(f"Error exporting schema for {param.schema_name}: {e}")
         return None
+    return schema_cls, target_schema
 
-    model = get_llm()
 
-    # Step 3: Identify fillable properties
-    fillable_properties = identify_fillable_properties(
-        param.entity_description,
-        target_schema,
-        model
-    )
-
-    # Step 4: Filter schema to only fillable properties
-    filtered_schema = filter_schema_properties(
-        target_schema, fillable_properties
+def get_filtered_schema(
+    schema_cls, fillable_properties: list[str]
+) -> dict | None:
+    """Step 4: Remove properties that cannot be filled from the schema
+    and modify it, None on error. Always keeps required properties even
+    if not in fillable list. Cached per class and fillable properties."""
+    print(
+        "\n>> Filtering schema to only include fillable properties..."
     )
-
-    # Modify schema after filtering
     try:
-        filtered_schema = modify_schema(filtered_schema)
+        report = {}
+        schema = get_schema_cache().get(
+            schema_cls, fillable_properties, report=report
+        )
     except Exception as e:
         print(f"Error modifying filtered schema: {e}")
         return None
 
-    # Extract range properties before creating entity
-    range_properties = extract_range_properties(filtered_schema)
-    print(f"Range properties to process: {range_properties}")
+    num_props = len(schema.get('properties', {}))
+    print(f"Filtered schema has {num_props} properties")
+    if report:
+        set_span_attributes(
+            schema_chars=report["chars"],
+            schema_budget_cuts=report["budget_cuts"],
+        )
+    else:
+        # cached, the budget cuts were reported when it was processed
+        set_span_attributes(
+            schema_chars=get_json_size(schema), schema_cached=True
+        )
+    return schema
+
+
+# Step 5: Create entity with structured output
+# Range properties will be filled as strings with descriptions
+ENTITY_SYSTEM_PROMPT = (
+    "You are an expert laboratory assistant. "
+    "You always answer in valid JSON according to the provided schema. "
+    "Fill ONLY the properties that you have actual information for. "
+    "Do not invent any new information that is not provided in "
+    "the prompt. "
+    "For properties with a 'range' annotation, provide a textual "
+    "description of the linked entity (if you have information), "
+    "not an ID. "
+    "If you do not have enough information for a field, leave it "
+    "empty or null. "
+)
 
-    # Step 5: Create entity with structured output
-    # Range properties will be filled as strings with descriptions
-    sys_prompt = (
-        "You are an expert laboratory assistant. "
-        "You always answer in valid JSON according to the provided schema. "
-        "Fill ONLY the properties that you have actual information for. "
-        "Do not invent any new information that is not provided in "
-        "the prompt. "
-        "For properties with a 'range' annotation, provide a textual "
-        "description of the linked entity (if you have information), "
-        "not an ID. "
-        "If you do not have enough information for a field, leave it "
-        "empty or null. "
-    )
 
+def get_entity_agent(filtered_schema: dict):
+    """Step 5 agent: fill the filtered schema with structured output"""
+    model = get_llm()
     if model_supports_structured_output(model, tools=[]):
         effective_response_format = ProviderStrategy(
             schema=filtered_schema,
@@ -312,36 +312,185 @@ def create_linked_entity(param: CreateParam) -> str | None:
             schema=filtered_schema
         )
 
-    if hasattr(model, "max_retries"):
-        model.max_retries = 1
-
-    agent = create_agent(
-        model=model,
+    return create_agent(
+        model=get_llm(max_retries=1),
         response_format=effective_response_format,
         tools=[],  # No tools for this step
     )
 
-    user_prompt = (
+
+def get_entity_user_prompt(param: CreateParam, filtered_schema: dict) -> str:
+    return (
         f"Create a JSON document based on the following description:\n"
         f"{param.entity_description}\n\n"
         f"Use the following schema:\n{json.dumps(filtered_schema, indent=2)}"
     )
 
+
+def get_entity_messages(user_prompt: str, feedback: str = None) -> list:
+    """Step 5 messages, with the problems of the previous response on
+    retries"""
+    messages = [
+        {"role": "system", "content": ENTITY_SYSTEM_PROMPT},
+        {"role": "user", "content": user_prompt}
+    ]
+    if feedback is not None:
+        messages.append({"role": "user", "content": feedback})
+    return messages
+
+
+def get_linked_params(
+    result: dict, range_properties: dict, entity_id: str
+) -> dict[str, CreateParam]:
+    """Step 6: requests for the linked entities of all range properties
+    that contain a description instead of an ID"""
+    linked_params = {}
+    for prop_name, range_schema_id in range_properties.items():
+        if prop_name in result and result[prop_name]:
+            description = result[prop_name]
+
+            # Skip if already an ID
+            is_already_id = (
+                isinstance(description, str) and
+                description.startswith("Item:OSW")
+            )
+            if is_already_id:
+                continue
+
+            print(
+                f"\n>> Processing range property '{prop_name}' "
+                f"with description: {description}"
+            )
+
+            schema_name = (
+                range_schema_id.split(":")[-1]
+                if ":" in range_schema_id
+                else range_schema_id
+            )
+            linked_params[prop_name] = CreateParam(
+                parent_id=entity_id,
+                property_name=prop_name,
+                schema_id=range_schema_id,
+                schema_name=schema_name,
+                entity_description=str(description)
+            )
+    return linked_params
+
+
+def set_linked_entity(result: dict, prop_name: str, linked_entity_id):
+    """replace the description of a range property with the ID of the
+    linked entity or remove the property if there is none"""
+    if linked_entity_id:
+        result[prop_name] = linked_entity_id
+        print(
+            f"Replaced '{prop_name}' description with "
+            f"ID: {linked_entity_id}"
+        )
+    else:
+        # Could not create linked entity, remove the property
+        result.pop(prop_name, None)
+        print(
+            f"Could not create linked entity for '{prop_name}', "
+            f"removing property"
+        )
+
+
+def get_comparison_schema_id(
+    param: CreateParam, data_instance: OswBaseModel
+) -> list[str]:
+    """only compare with entities of the requested range category
+    or the category of the created entity"""
+    return [
+        param.schema_id,
+        *(getattr(data_instance, "type", None) or [])
+    ]
+
+
+@traced("create_linked_entity")
+def create_linked_entity(param: CreateParam) -> str | None:
+    """Advanced approach: Create a linked entity with property filtering
+    and post-processing of range properties.
+
+    Steps:
+    1. Lookup schema
+    2. Compare with previous requests (early comparison)
+    3. Identify fillable properties
+    4. Filter schema
+    5. Create entity with structured output (range props as strings)
+    6. Post-process range properties
+    7. Compare with existing entities
+    8. Store and return
+    """
+    print((
+        f"\n\n>> Lookup or create entity for "
+        f"parent entity '{param.parent_id}', "
+        f"property '{param.property_name}', "
+        f"range '{param.schema_id}, {param.schema_name}' "
+        f"based on description {param.entity_description}"
+    ))
+    set_span_attributes(
+        property_name=param.property_name, schema_id=param.schema_id
+    )
+
+    entity_uuid = uuid.uuid4()
+    entity_id = "Item:OSW" + entity_uuid.hex
+
+    # Step 2: Early comparison with previous requests
+    with span("early_comparison"):
+        existing_from_log = compare_with_previous_requests(param)
+    if existing_from_log is not None:
+        return existing_from_log
+
+    # Store this request
+    entity_requests[entity_id] = param
+
+    # Step 1: Lookup schema
+    with span("schema_lookup"):
+        schema_name = lookup_exact_schema(get_schema_lookup_prompt(param))
+        schema = get_schema_class(schema_name, param)
+    if schema is None:
+        return None
+    schema_cls, target_schema = schema
+
+    # Step 3: Identify fillable properties
+    with span("fillable_properties"):
+        fillable_properties = identify_fillable_properties(
+            param.entity_description,
+            target_schema,
+            get_llm()
+        )
+
+    # Step 4: Filter schema to only fillable properties
+    with span("filter_schema"):
+        filtered_schema = get_filtered_schema(
+            schema_cls, fillable_properties
+        )
+    if filtered_schema is None:
+        return None
+
+    # Extract range properties before creating entity
+    range_properties = extract_range_properties(filtered_schema)
+    print(f"Range properties to process: {range_properties}")
+
+    # Step 5: Create entity with structured output
+    agent = get_entity_agent(filtered_schema)
+    user_prompt = get_entity_user_prompt(param, filtered_schema)
+
     max_retries = 3
     retry_count = 0
     result = None
+    # problems of the previous response, sent with the retry
+    feedback = None
 
     while retry_count < max_retries:
         attempt_num = retry_count + 1
         print(f"Invoking agent for entity creation (attempt {attempt_num})...")
 
         try:
-            result = agent.invoke({
-                "messages": [
-                    {"role": "system", "content": sys_prompt},
-                    {"role": "user", "content": user_prompt}
-                ]
-            })
+            with span("create_entity", attempt=attempt_num):
+                result = agent.invoke({
+                    "messages": get_entity_messages(user_prompt, feedback)
+                })
         except Exception as e:
             print(f"Error invoking agent: {e}")
             return None
@@ -354,23 +503,26 @@ def create_linked_entity(param: CreateParam) -> str | None:
             return None
 
         result = post_process_llm_json_response(result["structured_response"])
+        # Validate the supplied (not null or empty) values against the
+        # schema they were requested with
+        errors = validate_response(filtered_schema, result)
         result["uuid"] = str(entity_uuid)
 
         print(f"Structured Response for {param.schema_name}:")
         print(json.dumps(result, indent=2))
 
-        # Try to create instance to validate
-        try:
-            # Don't create final instance yet - we need to process
-            # range properties
+        # Don't create the instance yet - range properties are
+        # processed first
+        if not errors:
             break
-        except Exception as e:
-            print(f"Error in response format: {e}")
-            user_prompt += f"\n\nThe previous response had an error: {e}"
-            retry_count += 1
-            if retry_count >= max_retries:
-                print("Max retries reached, aborting.")
-                return None
+        print(f"Error in response format: {errors}")
+        retry_count += 1
+        if retry_count >= max_retries:
+            # the data model decides on the last response
+            print("Max retries reached, continuing with the last response.")
+            break
+        feedback = get_validation_feedback(errors)
+        add_to_span(response_retries=1)
 
     if result is None:
         return None
@@ -378,52 +530,176 @@ def create_linked_entity(param: CreateParam) -> str | None:
     # Step 6: Post-process range properties
     # For each range property, recursively lookup/create the linked entity
     print("\n>> Post-processing range properties...")
-    for prop_name, range_schema_id in range_properties.items():
-        if prop_name in result and result[prop_name]:
-            description = result[prop_name]
+    linked_params = get_linked_params(result, range_properties, entity_id)
+    with span("range_properties", count=len(linked_params)):
+        for prop_name, linked_param in linked_params.items():
+            # Recursively create/lookup the linked entity
+            linked_entity_id = create_linked_entity(linked_param)
+            set_linked_entity(result, prop_name, linked_entity_id)
 
-            # Skip if already an ID
-            is_already_id = (
-                isinstance(description, str) and
-                description.startswith("Item:OSW")
-            )
-            if is_already_id:
-                continue
+    # Now create the actual data instance
+    try:
+        data_instance: OswBaseModel = schema_cls(**result)
+    except Exception as e:
+        print(f"Error creating data instance after range processing: {e}")
+        return None
 
-            print(
-                f"\n>> Processing range property '{prop_name}' "
-                f"with description: {description}"
+    # Step 7: Compare with existing entities
+    print("\n>> Comparing with existing entities in database...")
+    with span("db_comparison"):
+        existing_entity = lookup_excact_matching_entity(
+            vector_store=get_vector_store(),
+            description=data_instance.json(),
+            llm_judge=True,
+            schema_id=get_comparison_schema_id(param, data_instance),
+        )
+    if existing_entity is not None:
+        print(f"Found existing entity match: {existing_entity}")
+        return existing_entity
+
+    # Step 8: Store and return
+    with span("store"):
+        entities[data_instance.get_iri()] = data_instance
+    print(f">> RETURN: {data_instance.get_iri()}")
+    return data_instance.get_iri()
+
+
+@traced("create_linked_entity")
+async def acreate_linked_entity(
+    param: CreateParam,
+    semaphore: asyncio.Semaphore,
+) -> str | None:
+    """async variant of create_linked_entity that resolves the range
+    properties of an entity concurrently.
+    `semaphore` caps the number of concurrent LLM calls of the whole tree.
+    """
+    print((
+        f"\n\n>> Lookup or create entity for "
+        f"parent entity '{param.parent_id}', "
+        f"property '{param.property_name}', "
+        f"range '{param.schema_id}, {param.schema_name}' "
+        f"based on description {param.entity_description}"
+    ))
+    set_span_attributes(
+        property_name=param.property_name, schema_id=param.schema_id
+    )
+
+    entity_uuid = uuid.uuid4()
+    entity_id = "Item:OSW" + entity_uuid.hex
+
+    # Step 2: Early comparison with previous requests.
+    # Check and registration happen without await in between, so
+    # concurrent requests cannot both register the same entity.
+    # A request for an entity that is still being created gets its ID
+    # without waiting, same as the sync version: waiting could deadlock,
+    # e.g. on a parent or on a sibling branch waiting for this one.
+    with span("early_comparison"):
+        existing_from_log = compare_with_previous_requests(param)
+    if existing_from_log is not None:
+        return existing_from_log
+
+    entity_requests[entity_id] = param
+    return await _acreate_linked_entity(param, entity_uuid, semaphore)
+
+
+async def _acreate_linked_entity(
+    param: CreateParam,
+    entity_uuid: uuid.UUID,
+    semaphore: asyncio.Semaphore,
+) -> str | None:
+    entity_id = "Item:OSW" + entity_uuid.hex
+
+    # Step 1: Lookup schema
+    with span("schema_lookup"):
+        async with semaphore:
+            schema_name = await alookup_exact_schema(
+                get_schema_lookup_prompt(param)
             )
+        schema = get_schema_class(schema_name, param)
+    if schema is None:
+        return None
+    schema_cls, target_schema = schema
 
-            # Recursively create/lookup the linked entity
-            schema_name = (
-                range_schema_id.split(":")[-1]
-                if ":" in range_schema_id
-                else range_schema_id
+    # Step 3: Identify fillable properties
+    with span("fillable_properties"):
+        async with semaphore:
+            fillable_properties = await aidentify_fillable_properties(
+                param.entity_description,
+                target_schema,
+                get_llm()
             )
-            linked_param = CreateParam(
-                parent_id=entity_id,
-                property_name=prop_name,
-                schema_id=range_schema_id,
-                schema_name=schema_name,
-                entity_description=str(description)
+
+    # Step 4: Filter schema to only fillable properties
+    with span("filter_schema"):
+        filtered_schema = get_filtered_schema(
+            schema_cls, fillable_properties
+        )
+    if filtered_schema is None:
+        return None
+
+    range_properties = extract_range_properties(filtered_schema)
+    print(f"Range properties to process: {range_properties}")
+
+    # Step 5: Create entity with structured output
+    agent = get_entity_agent(filtered_schema)
+    user_prompt = get_entity_user_prompt(param, filtered_schema)
+    max_retries = 3
+    retry_count = 0
+    # problems of the previous response, sent with the retry
+    feedback = None
+    while True:
+        attempt_num = retry_count + 1
+        print(f"Invoking agent for entity creation (attempt {attempt_num})...")
+        try:
+            with span("create_entity", attempt=attempt_num):
+                async with semaphore:
+                    result = await agent.ainvoke({
+                        "messages": get_entity_messages(user_prompt, feedback)
+                    })
+        except Exception as e:
+            print(f"Error invoking agent: {e}")
+            return None
+
+        if "structured_response" not in result:
+            print(
+                f"Error: Agent result does not contain "
+                f"structured_response: {result}"
             )
+            return None
 
-            linked_entity_id = create_linked_entity(linked_param)
+        result = post_process_llm_json_response(result["structured_response"])
+        # Validate the supplied (not null or empty) values against the
+        # schema they were requested with
+        errors = validate_response(filtered_schema, result)
+        result["uuid"] = str(entity_uuid)
+
+        print(f"Structured Response for {param.schema_name}:")
+        print(json.dumps(result, indent=2))
+
+        # Don't create the instance yet - range properties are
+        # processed first
+        if not errors:
+            break
+        print(f"Error in response format: {errors}")
+        retry_count += 1
+        if retry_count >= max_retries:
+            # the data model decides on the last response
+            print("Max retries reached, continuing with the last response.")
+            break
+        feedback = get_validation_feedback(errors)
+        add_to_span(response_retries=1)
 
-            if linked_entity_id:
-                result[prop_name] = linked_entity_id
-                print(
-                    f"Replaced '{prop_name}' description with "
-                    f"ID: {linked_entity_id}"
-                )
-            else:
-                # Could not create linked entity, remove the property
-                result.pop(prop_name, None)
-                print(
-                    f"Could not create linked entity for '{prop_name}', "
-                    f"removing property"
-                )
+    # Step 6: Post-process range properties concurrently
+    # (the semaphore is not held here, only by the LLM calls)
+    print("\n>> Post-processing range properties...")
+    linked_params = get_linked_params(result, range_properties, entity_id)
+    with span("range_properties", count=len(linked_params)):
+        linked_entity_ids = await asyncio.gather(*(
+            acreate_linked_entity(linked_param, semaphore)
+            for linked_param in linked_params.values()
+        ))
+    for prop_name, linked_entity_id in zip(linked_params, linked_entity_ids):
+        set_linked_entity(result, prop_name, linked_entity_id)
 
     # Now create the actual data instance
     try:
@@ -434,24 +710,41 @@ def create_linked_entity(param: CreateParam) -> str | None:
 
     # Step 7: Compare with existing entities
     print("\n>> Comparing with existing entities in database...")
-    existing_entity = lookup_excact_matching_entity(
-        vector_store=vector_store,
-        description=data_instance.json(),
-        llm_judge=True
-    )
+    with span("db_comparison"):
+        async with semaphore:
+            existing_entity = await alookup_excact_matching_entity(
+                vector_store=get_vector_store(),
+                description=data_instance.json(),
+                llm_judge=True,
+                schema_id=get_comparison_schema_id(param, data_instance),
+            )
     if existing_entity is not None:
         print(f"Found existing entity match: {existing_entity}")
         return existing_entity
 
     # Step 8: Store and return
-    entities[data_instance.get_iri()] = data_instance
+    with span("store"):
+        entities[data_instance.get_iri()] = data_instance
     print(f">> RETURN: {data_instance.get_iri()}")
     return data_instance.get_iri()
 
 
+async def acreate_entity(
+    param: CreateParam, max_concurrency: int | None = None
+) -> str | None:
+    """create an entity and its linked entities with at most
+    `max_concurrency` concurrent LLM calls
+    (default: LLM_MAX_CONCURRENCY or 4)"""
+    if max_concurrency is None:
+        max_concurrency = int(environ.get("LLM_MAX_CONCURRENCY", "4"))
+    return await acreate_linked_entity(
+        param, asyncio.Semaphore(max_concurrency)
+    )
+
+
 # Main execution
-result = create_linked_entity(
-    CreateParam(
+if __name__ == "__main__":
+    root_param = CreateParam(
         parent_id="_root_",
         property_name="_",
         schema_id="LaboratoryProcess",
@@ -463,35 +756,53 @@ result = create_linked_entity(
             "status in finished."
         )
     )
-)
 
-print("\n\n=== Created / Looked up entities ===")
-for i, e in entities.items():
-    e: OswBaseModel
-    print(f"#### {i} ({e.name}) ####")
-    print(e.json(indent=2, exclude_none=True))
-
-
-# Generate a short random id prefix
-id_prefix = uuid.uuid4().hex[:6]
-
-# Prefix all entity names with the id_prefix to avoid name collisions
-for i, e in entities.items():
-    e: Entity
-    if e.name is not None:
-        e.name = f"{id_prefix}_{e.name}"
-    if e.label is not None:
-        for lb in e.label:
-            lb.text = f"{id_prefix} {lb.text}"
-
-STORE = False
-# Uncomment to store entities in OSL
-# STORE = True
-if STORE:
-    print("\n\n=== Storing entities in OSL ===")
-    osl_client = get_osl_client()
-    osl_client.store_entity(OSW.StoreEntityParam(
-        entities=list(entities.values()),
-        overwrite=True,
-        change_id="demo_advanced_agent-0002",
-    ))
+    ASYNC = False
+    # Uncomment to resolve range properties concurrently
+    # ASYNC = True
+    if ASYNC:
+        result = asyncio.run(acreate_entity(root_param))
+    else:
+        result = create_linked_entity(root_param)
+
+    llm_cache = get_llm_cache()
+    if llm_cache is not None:
+        print(f"LLM cache: {llm_cache.get_stats()}")
+    print(f"Schema cache: {get_schema_cache().get_stats()}")
+    for rate_limit_stats in get_rate_limit_stats():
+        print(f"Rate limit: {rate_limit_stats}")
+    for replay_stats in get_replay_stats():
+        print(f"Replay: {replay_stats}")
+    for step, step_summary in get_summary().items():
+        print(f"Step {step}: {step_summary}")
+    export_traces()
+
+    print("\n\n=== Created / Looked up entities ===")
+    for i, e in entities.items():
+        e: OswBaseModel
+        print(f"#### {i} ({e.name}) ####")
+        print(e.json(indent=2, exclude_none=True))
+
+    # Generate a short random id prefix
+    id_prefix = uuid.uuid4().hex[:6]
+
+    # Prefix all entity names with the id_prefix to avoid name collisions
+    for i, e in entities.items():
+        e: Entity
+        if e.name is not None:
+            e.name = f"{id_prefix}_{e.name}"
+        if e.label is not None:
+            for lb in e.label:
+                lb.text = f"{id_prefix} {lb.text}"
+
+    STORE = False
+    # Uncomment to store entities in OSL
+    # STORE = True
+    if STORE:
+        print("\n\n=== Storing entities in OSL ===")
+        osl_client = get_osl_client()
+        osl_client.store_entity(OSW.StoreEntityParam(
+            entities=list(entities.values()),
+            overwrite=True,
+            change_id="demo_advanced_agent-0002",
+        ))
@@ -7,14 +7,15 @@ from langchain.agents import create_agent
 from opensemantic.lab.v1 import LaboratoryProcess
 
 from util import (
-    modify_schema,
     post_process_llm_json_response,
     schema_to_markdown
 )
 
 import json
 
-from llm_init import get_response_format, llm
+from llm_init import get_llm, get_response_format, llm
+from osl_init import get_osl_client
+from schema_cache import get_processed_schema
 
 target_data_model = LaboratoryProcess
 
@@ -41,13 +42,12 @@ sys_prompt = (
 # with https://platform.openai.com/docs/guides/structured-outputs#supported-schemas  # noqa: E501
 
 schema_description = schema_to_markdown(
-    modify_schema(target_data_model.export_schema())
+    get_processed_schema(target_data_model)
 )
 effective_response_format = get_response_format(llm, target_data_model)
 
 # llm.temperature = 0.0  # not supported by reasoning models
-if hasattr(llm, "reasoning_effort"):
-    llm.reasoning_effort = "low"
+llm = get_llm(reasoning_effort="low")
 agent = create_agent(
     model=llm,
     response_format=effective_response_format
@@ -78,4 +78,5 @@ print(json.dumps(result, indent=2))
 # create an instance of the target data model from the result
 data_instance = target_data_model(**result)
 
+osl_client = get_osl_client()
 osl_client.store_entity(data_instance)
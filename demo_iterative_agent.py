@@ -15,7 +15,6 @@ import opensemantic.lab.v1  # noqa: F401 needed for eval
 from pydantic import BaseModel, Field
 
 from util import (
-    modify_schema,
     post_process_llm_json_response,
 )
 
@@ -23,8 +22,13 @@ import json
 
 from llm_init import get_llm, model_supports_structured_output
 from schema_catalog import lookup_exact_schema
+from schema_cache import get_processed_schema
+from schema_validation import get_validation_feedback, validate_response
+from tracing import add_to_span
+from osw.express import OSW
 from osl_init import (
-    build_vector_store,
+    get_osl_client,
+    get_vector_store,
     lookup_excact_matching_entity,
 )
 
@@ -93,7 +97,6 @@ class CreateParam(BaseModel):
 entitites = {}
 entitity_requests = {}
 root = True
-vector_store = build_vector_store()
 
 
 def create_linked_entity(param: CreateParam) -> str | None:
@@ -127,9 +130,10 @@ def create_linked_entity(param: CreateParam) -> str | None:
     LOOKUP_FIRST = False
     if LOOKUP_FIRST:
         existing_entity = lookup_excact_matching_entity(
-            vector_store=vector_store,
+            vector_store=get_vector_store(),
             description=prompt,
-            llm_judge=True
+            llm_judge=True,
+            schema_id=param.schema_id
         )
         if existing_entity is not None:
             print(f"Found existing entity match: {existing_entity}")
@@ -161,8 +165,7 @@ def create_linked_entity(param: CreateParam) -> str | None:
         # Fixme: schema contains "definitions" instead of "$defs"
         # but $refs are pointing to ""
         # target_schema = schema_cls
-        target_schema = schema_cls.export_schema()
-        target_schema = modify_schema(target_schema)
+        target_schema = get_processed_schema(schema_cls)
     except Exception as e:
         print(f"Error exporting schema for {param.schema_name}: {e}")
         return None
@@ -181,8 +184,7 @@ def create_linked_entity(param: CreateParam) -> str | None:
             schema=target_schema
         )
 
-    if hasattr(model, "max_retries"):
-        model.max_retries = 1
+    model = get_llm(max_retries=1)
     # model.temperature = 0.0 # not allowed for reasoning models
 
     agent = create_agent(
@@ -220,26 +222,30 @@ def create_linked_entity(param: CreateParam) -> str | None:
 
     max_retries = 3
     retry_count = 0
+    # problems of the previous response, sent with the retry
+    feedback = None
     while retry_count < max_retries:
 
         print(
             f"Invoking agent for entity creation with "
             f"prompt:\n{user_prompt}"
         )
+        messages = [
+            {
+                "role": "system",
+                "content": sys_prompt
+            },
+            {
+                "role": "user",
+                "content": user_prompt
+            }
+        ]
+        if feedback is not None:
+            print(f"Feedback:\n{feedback}")
+            messages.append({"role": "user", "content": feedback})
 
         try:
-            result = agent.invoke({
-                "messages": [
-                    {
-                        "role": "system",
-                        "content": sys_prompt
-                    },
-                    {
-                        "role": "user",
-                        "content": user_prompt
-                    }
-                ]
-            })
+            result = agent.invoke({"messages": messages})
         except Exception as e:
             print(f"Error invoking agent: {e}")
             print(f"  Prompt was:\n{user_prompt}")
@@ -253,32 +259,48 @@ def create_linked_entity(param: CreateParam) -> str | None:
             )
             return None
         result = post_process_llm_json_response(result["structured_response"])
+        # check the supplied (not null or empty) values against the schema
+        # they were requested with
+        errors = validate_response(target_schema, result)
         result["uuid"] = str(entity_uuid)
 
         print(f"Structured Response for {param.schema_name}:")
         print(json.dumps(result, indent=2))
 
-        # create an instance of the target data model from the result
-        try:
-            data_instance: OswBaseModel = schema_cls(**result)
-            break
-        except Exception as e:
-            print(f"Error creating data instance: {e}")
-            user_prompt += (
-                f"\n\nThe previous response could not be parsed correctly: {e}"
-            )
-            retry_count += 1
-            if retry_count < max_retries:
-                print(f"Retrying... ({retry_count}/{max_retries})")
-            else:
-                print("Max retries reached, aborting.")
-                return None
+        if errors:
+            print(f"Error validating response: {errors}")
+        if errors and retry_count + 1 < max_retries:
+            feedback = get_validation_feedback(errors)
+        else:
+            # create an instance of the target data model from the result,
+            # on the last attempt also from a response with violations
+            try:
+                data_instance: OswBaseModel = schema_cls(**result)
+                break
+            except Exception as e:
+                print(f"Error creating data instance: {e}")
+                feedback = (
+                    f"The previous response could not be parsed correctly: {e}"
+                )
+        retry_count += 1
+        if retry_count < max_retries:
+            add_to_span(response_retries=1)
+            print(f"Retrying... ({retry_count}/{max_retries})")
+        else:
+            print("Max retries reached, aborting.")
+            return None
 
     if not LOOKUP_FIRST:
         existing_entity = lookup_excact_matching_entity(
-            vector_store=vector_store,
+            vector_store=get_vector_store(),
             description=data_instance.json(),
-            llm_judge=True
+            llm_judge=True,
+            # only compare with entities of the requested range category
+            # or the category of the created entity
+            schema_id=[
+                param.schema_id,
+                *(getattr(data_instance, "type", None) or [])
+            ]
         )
         if existing_entity is not None:
             print(f"Found existing entity match: {existing_entity}")
@@ -289,43 +311,43 @@ def create_linked_entity(param: CreateParam) -> str | None:
     return data_instance.get_iri()
 
 
-result = create_linked_entity(
-    CreateParam(
-        parent_id="_root_",
-        property_name="_",
-        schema_id="LaboratoryProcess",
-        schema_name="LaboratoryProcess",
-        entity_description=(
-            "A laboratory process to document an experiment "
-            "created by Dr. Jane Doe, Example Lab, "
-            "starting at 05.02.2025 and ending at 06.02.2025, "
-            "status in finished."
+if __name__ == "__main__":
+    result = create_linked_entity(
+        CreateParam(
+            parent_id="_root_",
+            property_name="_",
+            schema_id="LaboratoryProcess",
+            schema_name="LaboratoryProcess",
+            entity_description=(
+                "A laboratory process to document an experiment "
+                "created by Dr. Jane Doe, Example Lab, "
+                "starting at 05.02.2025 and ending at 06.02.2025, "
+                "status in finished."
+            )
         )
     )
-)
 
-print("Created / Looked up entities:")
-for i, e in entitites.items():
-    e: OswBaseModel
-    print(f"#### {i} ({e.name}) ####")
-    print(e.json(indent=2, exclude_none=True))
-
-
-# generate a short random id prefix
-id_prefix = uuid.uuid4().hex[:6]
-
-# prefix all entity names with the id_prefix to avoid name collisions
-for i, e in entitites.items():
-    e: Entity
-    if e.name is not None:
-        e.name = f"{id_prefix}_{e.name}"
-    if e.label is not None:
-        for lb in e.label:
-            lb.text = f"{id_prefix} {lb.text}"
-
-osl_client = get_osl_client()
-osl_client.store_entity(OSW.StoreEntityParam(
-    entities=list(entitites.values()),
-    overwrite=True,
-    change_id="demo_iterative_agent-0001",
-))
+    print("Created / Looked up entities:")
+    for i, e in entitites.items():
+        e: OswBaseModel
+        print(f"#### {i} ({e.name}) ####")
+        print(e.json(indent=2, exclude_none=True))
+
+    # generate a short random id prefix
+    id_prefix = uuid.uuid4().hex[:6]
+
+    # prefix all entity names with the id_prefix to avoid name collisions
+    for i, e in entitites.items():
+        e: Entity
+        if e.name is not None:
+            e.name = f"{id_prefix}_{e.name}"
+        if e.label is not None:
+            for lb in e.label:
+                lb.text = f"{id_prefix} {lb.text}"
+
+    osl_client = get_osl_client()
+    osl_client.store_entity(OSW.StoreEntityParam(
+        entities=list(entitites.values()),
+        overwrite=True,
+        change_id="demo_iterative_agent-0001",
+    ))
@@ -0,0 +1,130 @@
+import hashlib
+import json
+from os import environ
+
+# jsondata fields rendered into the document text of every page
+DEFAULT_FIELDS = [
+    "type",
+    "name",
+    "label",
+    "short_name",
+    "description",
+    "keywords",
+]
+
+# additional jsondata fields per category, in the order they are rendered.
+# Entities of several categories get the fields of all of them.
+TYPE_FIELDS = {
+    # Person
+    "Category:OSW44deaa5b806d41a2a88594f562b110e9": [
+        "first_name", "middle_name", "surname", "orcid", "email",
+        "organization", "organizational_unit", "role",
+    ],
+    # Organization
+    "Category:OSW1969007d5acf40539642877659a02c23": [
+        "abbreviation", "legal_name", "ror_id", "website", "email",
+    ],
+    # OrganizationalUnit
+    "Category:OSW3cb8cef2225e403092f098f99bc4c472": [
+        "abbreviation", "superordinate_ou", "manager", "website", "email",
+    ],
+    # Process
+    "Category:OSWe5aa96bffb1c4d95be7fbd46142ad203": [
+        "creator", "actionees", "start_date_time", "end_date_time",
+        "status", "location", "location_name", "tool", "input", "output",
+    ],
+    # LaboratoryProcess
+    "Category:OSW0e7fab2262fb4427ad0fa454bc868a0d": [
+        "creator", "actionees", "start_date_time", "end_date_time",
+        "status", "location", "location_name", "tool", "input", "output",
+        "display_id", "project",
+    ],
+    # Device
+    "Category:OSWf0fe562f422d49c6877490b3dfee2f3f": [
+        "manufacturer", "type_no", "manufacturer_type_name",
+        "serial_number", "inventory_number", "location",
+        "responsible_person", "organizational_unit",
+    ],
+    # Sample
+    "Category:OSW88894b63a51d46b08b5b4b05a6b1b3c3": [
+        "manufacturer", "type_no", "origin", "components",
+    ],
+    # Article
+    "Category:OSW92cc6b1a2e6b4bb7bad470dfdcfdaf26": [
+        "author", "related_to", "part_of",
+    ],
+}
+
+
+def get_projections() -> dict | None:
+    """per category projections from environment variables:
+    DOCUMENT_TEXT ('projection', default, or 'slots' to embed the
+    full page slots as before),
+    DOCUMENT_PROJECTIONS_PATH (optional JSON file mapping category ids
+    to field lists, merged over TYPE_FIELDS).
+    Returns None if the full slots should be used."""
+    if environ.get("DOCUMENT_TEXT", "projection") == "slots":
+        return None
+    projections = dict(TYPE_FIELDS)
+    path = environ.get("DOCUMENT_PROJECTIONS_PATH")
+    if path:
+        with open(path, encoding="utf-8") as f:
+            projections.update(json.load(f))
+    return projections
+
+
+def get_projection_id(projections: dict | None) -> str:
+    """short hash identifying the document text format, changes whenever
+    the projected fields change so indexed documents can be rebuilt"""
+    if projections is None:
+        return "slots"
+    content = json.dumps([DEFAULT_FIELDS, projections], sort_keys=True)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()[:16]
+
+
+def get_fields(types, projections: dict) -> list[str]:
+    """ordered, de-duplicated fields to render for the given categories"""
+    if isinstance(types, str):
+        types = [types]
+    fields = list(DEFAULT_FIELDS)
+    for t in types or []:
+        fields.extend(projections.get(t, []))
+    return list(dict.fromkeys(fields))
+
+
+def format_value(value) -> str:
+    """render a jsondata value as compact text, multilingual texts
+    ([{'text': .., 'lang': ..}]) are reduced to their texts"""
+    if isinstance(value, dict):
+        if "text" in value:
+            return format_value(value["text"])
+        return ", ".join(
+            f"{key}: {text}" for key, text in
+            ((key, format_value(v)) for key, v in value.items()) if text
+        )
+    if isinstance(value, (list, tuple)):
+        return "; ".join(
+            text for text in (format_value(v) for v in value) if text
+        )
+    if value is None:
+        return ""
+    return str(value)
+
+
+def project_jsondata(jsondata: dict, projections: dict) -> str:
+    """render the fields of `jsondata` that are relevant for its categories
+    as one 'field: value' line each"""
+    lines = []
+    for field in get_fields(jsondata.get("type"), projections):
+        text = format_value(jsondata.get(field))
+        if text:
+            lines.append(f"{field}: {text}")
+    return "\n".join(lines)
+
+
+def get_document_text(slots: dict, projections: dict | None) -> str:
+    """document text of a page, the projected jsondata or, if
+    `projections` is None, all slots as JSON"""
+    if projections is None:
+        return json.dumps(slots)
+    return project_jsondata(slots.get("jsondata") or {}, projections)
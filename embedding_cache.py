@@ -0,0 +1,139 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+
+from langchain_core.embeddings import Embeddings
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that caches vectors on disk, keyed by the
+    embedding model and a hash of the embedded text.
+    The cache is a SQLite file bounded to `max_entries` vectors,
+    least recently used entries are evicted first.
+    """
+
+    def __init__(
+        self,
+        embedding: Embeddings,
+        model: str,
+        path: str,
+        max_entries: int = 100000,
+    ):
+        self.embedding = embedding
+        self.model = model
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB, last_used REAL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_last_used "
+            "ON embeddings (last_used)"
+        )
+        self._conn.commit()
+
+    def _key(self, kind: str, text: str) -> str:
+        content_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return f"{self.model}:{kind}:{content_hash}"
+
+    def _embed_cached(self, kind: str, texts: list[str], embed_fn):
+        keys = [self._key(kind, text) for text in texts]
+        now = time.time()
+
+        vectors = {}
+        with self._lock:
+            unique_keys = list(dict.fromkeys(keys))
+            # sqlite limits the number of host parameters per statement
+            for i in range(0, len(unique_keys), 500):
+                batch = unique_keys[i:i + 500]
+                rows = self._conn.execute(
+                    "SELECT key, vector FROM embeddings WHERE key IN "
+                    f"({','.join('?' * len(batch))})",
+                    batch,
+                ).fetchall()
+                for key, blob in rows:
+                    vectors[key] = array("d", blob).tolist()
+            self._conn.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                [(now, key) for key in vectors],
+            )
+            self._conn.commit()
+
+            missing = {}
+            for key, text in zip(keys, texts):
+                if key not in vectors and key not in missing:
+                    missing[key] = text
+            self.hits += len(keys) - len(missing)
+            self.misses += len(missing)
+
+        if missing:
+            new_vectors = embed_fn(list(missing.values()))
+            with self._lock:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings "
+                    "(key, vector, last_used) VALUES (?, ?, ?)",
+                    [
+                        (key, array("d", vector).tobytes(), now)
+                        for key, vector in zip(missing, new_vectors)
+                    ],
+                )
+                self._evict()
+                self._conn.commit()
+            vectors.update(zip(missing, new_vectors))
+
+        return [vectors[key] for key in keys]
+
+    def _evict(self):
+        """remove the least recently used entries above `max_entries`"""
+        (count,) = self._conn.execute(
+            "SELECT COUNT(*) FROM embeddings"
+        ).fetchone()
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE key IN ("
+                "SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self._embed_cached(
+            "document", texts, self.embedding.embed_documents
+        )
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed_queries([text])[0]
+
+    def embed_queries(self, texts: list[str]) -> list[list[float]]:
+        """query embeddings of several texts, looked up in the cache at
+        once (the wrapped embeddings only embed one query per call)"""
+        return self._embed_cached(
+            "query", texts,
+            lambda texts: [self.embedding.embed_query(t) for t in texts]
+        )
+
+    def get_stats(self) -> dict:
+        """return cache hit / miss counters and the current cache size"""
+        with self._lock:
+            (size,) = self._conn.execute(
+                "SELECT COUNT(*) FROM embeddings"
+            ).fetchone()
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / total if total else 0.0,
+            "size": size,
+            "max_entries": self.max_entries,
+        }
@@ -0,0 +1,123 @@
+import heapq
+import math
+import re
+import time
+from collections import Counter
+
+# identifiers are kept as single tokens so they can be matched exactly:
+# OSW ids (Item:OSW.., Category:OSW..), ORCIDs and ISO dates
+TOKEN_PATTERN = re.compile(
+    r"[A-Za-z]+:OSW[0-9a-fA-F]+"
+    r"|\d{4}-\d{4}-\d{4}-\d{3}[\dXx]"
+    r"|\d{4}-\d{2}-\d{2}"
+    r"|\w+"
+)
+
+# identifiers that have to be present in a document for an exact match
+IDENTIFIER_PATTERN = re.compile(
+    r"\d{4}-\d{4}-\d{4}-\d{3}[\dXx]"
+    r"|\d{4}-\d{2}-\d{2}"
+)
+
+
+def tokenize(text: str) -> list[str]:
+    return [token.lower() for token in TOKEN_PATTERN.findall(text)]
+
+
+def extract_identifiers(text: str) -> set[str]:
+    """ORCIDs and ISO dates contained in `text`"""
+    return {token.lower() for token in IDENTIFIER_PATTERN.findall(text)}
+
+
+class BM25Index:
+    """Incremental inverted index with Okapi BM25 ranking.
+    Complements dense embeddings for exact tokens like OSW ids, ORCIDs,
+    dates and names.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: dict[str, dict[str, int]] = {}
+        self._doc_terms: dict[str, Counter] = {}
+        self._doc_lengths: dict[str, int] = {}
+        self._total_length = 0
+        self.build_s = 0.0
+        self.queries = 0
+        self.query_s = 0.0
+
+    def __len__(self):
+        return len(self._doc_terms)
+
+    def __contains__(self, doc_id):
+        return doc_id in self._doc_terms
+
+    def add(self, doc_id: str, text: str):
+        """add or replace the document `doc_id`"""
+        start = time.perf_counter()
+        if doc_id in self._doc_terms:
+            self.remove(doc_id)
+        terms = Counter(tokenize(text))
+        self._doc_terms[doc_id] = terms
+        length = sum(terms.values())
+        self._doc_lengths[doc_id] = length
+        self._total_length += length
+        for term, tf in terms.items():
+            self._postings.setdefault(term, {})[doc_id] = tf
+        self.build_s += time.perf_counter() - start
+
+    def remove(self, doc_id: str):
+        terms = self._doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+        self._total_length -= self._doc_lengths.pop(doc_id)
+        for term in terms:
+            postings = self._postings[term]
+            postings.pop(doc_id, None)
+            if not postings:
+                del self._postings[term]
+
+    def contains_all(self, doc_id: str, tokens) -> bool:
+        """True if the document contains all the given tokens"""
+        terms = self._doc_terms.get(doc_id, {})
+        return all(token in terms for token in tokens)
+
+    def search(self, query: str, k: int = 10) -> list[tuple[str, float]]:
+        """return the ids and BM25 scores of the k best matching documents"""
+        start = time.perf_counter()
+        n_docs = len(self._doc_terms)
+        if n_docs == 0:
+            return []
+        avg_length = self._total_length / n_docs
+        scores: dict[str, float] = {}
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(
+                1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5)
+            )
+            for doc_id, tf in postings.items():
+                norm = self.k1 * (
+                    1 - self.b
+                    + self.b * self._doc_lengths[doc_id] / avg_length
+                )
+                scores[doc_id] = scores.get(doc_id, 0.0) + (
+                    idf * tf * (self.k1 + 1) / (tf + norm)
+                )
+        result = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        self.queries += 1
+        self.query_s += time.perf_counter() - start
+        return result
+
+    def get_stats(self) -> dict:
+        """index size, cumulative build time and average query latency"""
+        return {
+            "documents": len(self._doc_terms),
+            "terms": len(self._postings),
+            "build_s": self.build_s,
+            "queries": self.queries,
+            "avg_query_ms": (
+                self.query_s / self.queries * 1000 if self.queries else 0.0
+            ),
+        }
@@ -0,0 +1,177 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import warnings
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+from langchain_core.load import dumps, loads
+
+# name of the pipeline step the current LLM calls belong to,
+# set with llm_cache_step and used to report hit rates per step
+current_step: ContextVar[str] = ContextVar("llm_cache_step", default="")
+
+
+@contextmanager
+def llm_cache_step(name: str):
+    """attribute cache hits and misses of the LLM calls inside the
+    block to the pipeline step `name`"""
+    token = current_step.set(name)
+    try:
+        yield
+    finally:
+        current_step.reset(token)
+
+
+def is_cache_hit(response) -> bool:
+    """True if the LLMResult passed to on_llm_end callbacks was served
+    from the SQLiteLLMCache"""
+    return any(
+        (generation.generation_info or {}).get("llm_cache_hit")
+        for generations in response.generations
+        for generation in generations
+    )
+
+
+def get_token_usage(response) -> dict:
+    """input, output and total tokens of an LLMResult"""
+    usage = {"input_tokens": 0, "output_tokens": 0, "total_tokens": 0}
+    for generations in response.generations:
+        for generation in generations:
+            message = getattr(generation, "message", None)
+            metadata = getattr(message, "usage_metadata", None) or {}
+            for key in usage:
+                usage[key] += metadata.get(key, 0)
+    return usage
+
+
+class SQLiteLLMCache(BaseCache):
+    """langchain LLM cache storing responses in a SQLite file.
+    Entries are keyed by a hash of the prompt (the serialized messages)
+    and the llm string, which contains the model, its settings and the
+    call parameters like tools and response format schema.
+    Entries expire after `ttl_s` seconds, the cache is bounded to
+    `max_entries` responses, least recently used entries are evicted first.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        ttl_s: float = 7 * 24 * 3600,
+        max_entries: int = 10000,
+    ):
+        self.path = path
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self.step_stats: dict[str, dict[str, int]] = {}
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, generations TEXT, "
+            "created REAL, last_used REAL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_responses_last_used "
+            "ON responses (last_used)"
+        )
+        self._conn.commit()
+
+    def _key(self, prompt: str, llm_string: str) -> str:
+        content = f"{llm_string}\n{prompt}".encode("utf-8")
+        return hashlib.sha256(content).hexdigest()
+
+    def _count(self, hit: bool):
+        stats = self.step_stats.setdefault(
+            current_step.get() or "default", {"hits": 0, "misses": 0}
+        )
+        stats["hits" if hit else "misses"] += 1
+
+    def lookup(self, prompt: str, llm_string: str) -> RETURN_VAL_TYPE | None:
+        key = self._key(prompt, llm_string)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT generations FROM responses "
+                "WHERE key = ? AND created > ?",
+                (key, now - self.ttl_s),
+            ).fetchone()
+            if row is not None:
+                self._conn.execute(
+                    "UPDATE responses SET last_used = ? WHERE key = ?",
+                    (now, key),
+                )
+                self._conn.commit()
+            self._count(row is not None)
+        if row is None:
+            return None
+        with warnings.catch_warnings():
+            # langchain_core.load.loads is marked as beta
+            warnings.simplefilter("ignore")
+            generations = loads(row[0], allowed_objects="core")
+        # mark cached responses for the usage callbacks, see is_cache_hit
+        for generation in generations:
+            generation.generation_info = {
+                **(generation.generation_info or {}), "llm_cache_hit": True
+            }
+        return generations
+
+    def update(
+        self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE
+    ):
+        key = self._key(prompt, llm_string)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses "
+                "(key, generations, created, last_used) VALUES (?, ?, ?, ?)",
+                (key, dumps(return_val), now, now),
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float):
+        """remove expired entries and the least recently used entries
+        above `max_entries`"""
+        self._conn.execute(
+            "DELETE FROM responses WHERE created <= ?", (now - self.ttl_s,)
+        )
+        (count,) = self._conn.execute(
+            "SELECT COUNT(*) FROM responses"
+        ).fetchone()
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "SELECT key FROM responses ORDER BY last_used LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+    def clear(self, **kwargs):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def get_stats(self) -> dict:
+        """return hit / miss counters per pipeline step and the cache size"""
+        with self._lock:
+            (size,) = self._conn.execute(
+                "SELECT COUNT(*) FROM responses"
+            ).fetchone()
+            steps = {}
+            for step, stats in self.step_stats.items():
+                total = stats["hits"] + stats["misses"]
+                steps[step] = {
+                    **stats,
+                    "hit_rate": stats["hits"] / total if total else 0.0,
+                }
+        return {
+            "steps": steps,
+            "size": size,
+            "max_entries": self.max_entries,
+        }
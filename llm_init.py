@@ -1,29 +1,144 @@
-from langchain.chat_models.base import BaseChatModel
-from langchain.agents.factory import _supports_provider_strategy
+from __future__ import annotations
+
+import hashlib
+import threading
+from typing import TYPE_CHECKING
 from dotenv import load_dotenv
 from os import environ
-from oold.static import GenericLinkedBaseModel
-from pydantic import BaseModel
-from util import modify_schema
+
+# langchain, pydantic and the model clients are imported on first use,
+# so importing this module is cheap, see __getattr__
+if TYPE_CHECKING:
+    from langchain.chat_models.base import BaseChatModel
+    from oold.static import GenericLinkedBaseModel
+    from pydantic import BaseModel
 
 load_dotenv()
 
 
-def get_llm():
+_llm_cache = None
+
+
+def get_llm_cache():
+    """shared on-disk LLM response cache configured by environment
+    variables: LLM_CACHE_PATH (cache file, disabled if empty, default),
+    LLM_CACHE_TTL_S and LLM_CACHE_MAX_ENTRIES.
+    Returns None if caching is disabled."""
+    global _llm_cache
+    path = environ.get("LLM_CACHE_PATH", "")
+    if not path:
+        return None
+    if _llm_cache is None or _llm_cache.path != path:
+        from llm_cache import SQLiteLLMCache
+        _llm_cache = SQLiteLLMCache(
+            path,
+            ttl_s=float(environ.get("LLM_CACHE_TTL_S", 7 * 24 * 3600)),
+            max_entries=int(environ.get("LLM_CACHE_MAX_ENTRIES", "10000")),
+        )
+    return _llm_cache
+
+
+# shared chat clients by provider configuration, see get_llm
+_llm_registry: dict[str, BaseChatModel] = {}
+_llm_registry_lock = threading.Lock()
+
+
+def get_llm_config_key() -> str:
+    """key of the current provider configuration (provider, model,
+    endpoint, api version and a hash of the api key)"""
+    api_key_hash = hashlib.sha256(
+        environ.get("API_KEY", "").encode("utf-8")
+    ).hexdigest()[:16]
+    return "|".join([
+        environ.get("API_PROVIDER", ""),
+        environ.get("API_MODEL", ""),
+        environ.get("API_ENDPOINT", ""),
+        environ.get("API_VERSION", ""),
+        api_key_hash,
+    ])
+
+
+def get_llm(shared=True, **overrides):
+    """return the language model for the current environment variables.
+    If `shared` is True, one client per provider configuration is created
+    and reused, so its HTTP connection pool is kept alive between calls.
+    `overrides` (e.g. reasoning_effort="high", max_retries=1) are applied
+    to a copy that shares the client's connections, the shared instance is
+    never modified. Settings the model does not support are ignored.
+    """
+    if not shared:
+        llm = create_llm()
+    else:
+        key = get_llm_config_key()
+        with _llm_registry_lock:
+            llm = _llm_registry.get(key)
+            if llm is None:
+                llm = create_llm()
+                _llm_registry[key] = llm
+
+    update = {
+        name: value for name, value in overrides.items()
+        if name in type(llm).model_fields
+    }
+    if not update:
+        return llm
+    llm = llm.model_copy(update=update)
+    if "max_retries" in update:
+        _set_client_max_retries(llm, update["max_retries"])
+    return llm
+
+
+def _set_client_max_retries(llm: BaseChatModel, max_retries):
+    """openai based models pass max_retries to their API clients on
+    creation, derive clients with the new setting that share the
+    connection pool"""
+    for root_name, client_name in [
+        ("root_client", "client"),
+        ("root_async_client", "async_client"),
+    ]:
+        root_client = getattr(llm, root_name, None)
+        if root_client is None or not hasattr(root_client, "with_options"):
+            continue
+        root_client = root_client.with_options(max_retries=max_retries)
+        setattr(llm, root_name, root_client)
+        setattr(llm, client_name, root_client.chat.completions)
+
+
+def create_llm(provider: str = None):
     """initialize and return a new language model object
-    based on environment variables"""
+    based on environment variables, `provider` defaults to API_PROVIDER"""
+
+    from rate_limit import (
+        TokenUsageCallbackHandler,
+        get_http_client_kwargs,
+        get_ollama_client_kwargs,
+        get_rate_limiter,
+    )
+    from tracing import TracingCallbackHandler
+
+    # provider rate limits for all models, throttled requests pause the
+    # limiter of openai based and ollama models, see rate_limit
+    if provider is None:
+        provider = environ.get("API_PROVIDER", "")
+    rate_limiter = get_rate_limiter(provider=provider)
+    http_client_kwargs = get_http_client_kwargs(rate_limiter)
 
-    if environ.get("API_PROVIDER") == "azure":
+    if provider == "replay":
+        # offline, recorded or synthetic responses, see replay.py
+        llm = create_replay_llm()
+
+    if provider == "azure":
         # https://docs.langchain.com/oss/python/integrations/providers/microsoft
         from langchain_openai import AzureChatOpenAI
         llm = AzureChatOpenAI(
             azure_deployment=environ.get("API_MODEL"),  # or your deployment
             api_version=environ.get("API_VERSION"),  # or your api version
             api_key=environ.get("API_KEY"),  # or your api key
-            azure_endpoint=environ.get("API_ENDPOINT")
+            azure_endpoint=environ.get("API_ENDPOINT"),
+            **http_client_kwargs,
         )
 
-    if environ.get("API_PROVIDER") == "azure-foundry-anthropic":
+    if provider == "azure-foundry-anthropic":
         # Azure AI Foundry with Claude Sonnet
         # https://learn.microsoft.com/en-us/azure/ai-studio/
         from langchain_anthropic import ChatAnthropic
@@ -36,7 +151,7 @@ def get_llm():
             }
         )
 
-    if environ.get("API_PROVIDER") == "azure-foundry":
+    if provider == "azure-foundry":
         from langchain_openai import ChatOpenAI
         llm = ChatOpenAI(
             model=environ.get("API_MODEL"),  # e.g., deepseek-1.0
@@ -44,7 +159,8 @@ def get_llm():
             base_url=environ.get("API_ENDPOINT"),
             default_headers={
                 "x-ms-api-version": environ.get("API_VERSION", "2024-02-15")
-            }
+            },
+            **http_client_kwargs,
         )
         # AzureAIChatCompletionsModel is alpha/beta
         # from langchain_azure_ai.chat_models import (
@@ -58,41 +174,49 @@ def get_llm():
         #     api_version=environ.get("API_VERSION", "2024-02-15")
         # )
 
-    if environ.get("API_PROVIDER") == "ollama":
+    if provider == "ollama":
         # https://docs.langchain.com/oss/python/integrations/chat/ollama
         from langchain_ollama import ChatOllama
-        llm = ChatOllama(model=environ.get("API_MODEL"))
+        llm = ChatOllama(
+            model=environ.get("API_MODEL"),
+            **get_ollama_client_kwargs(rate_limiter),
+        )
 
-    if environ.get("API_PROVIDER") == "blablador":
+    if provider == "blablador":
         # https://sdlaml.pages.jsc.fz-juelich.de/ai/guides/blablador_api_access/
         from langchain_openai import ChatOpenAI
         llm = ChatOpenAI(
             model=environ.get("API_MODEL"),
             api_key=environ.get("API_KEY"),
-            base_url=environ.get("API_ENDPOINT")
+            base_url=environ.get("API_ENDPOINT"),
+            **http_client_kwargs,
         )
 
-    if environ.get("API_PROVIDER") == "openai":
+    if provider == "openai":
         from langchain_openai import ChatOpenAI
-        llm = ChatOpenAI(api_key=environ.get("API_KEY"))
+        llm = ChatOpenAI(
+            api_key=environ.get("API_KEY"), **http_client_kwargs
+        )
 
-    if environ.get("API_PROVIDER") == "chatai":
+    if provider == "chatai":
         from langchain_openai import ChatOpenAI
         llm = ChatOpenAI(
             api_key=environ.get("API_KEY"),
             openai_api_base=environ.get("API_ENDPOINT"),
-            model=environ.get("API_MODEL")
+            model=environ.get("API_MODEL"),
+            **http_client_kwargs,
         )
 
-    if environ.get("API_PROVIDER") == "vllm":
+    if provider == "vllm":
         from langchain_openai import ChatOpenAI
         llm = ChatOpenAI(
             api_key=environ.get("API_KEY"),
             base_url=environ.get("API_ENDPOINT"),
-            model=environ.get("API_MODEL")
+            model=environ.get("API_MODEL"),
+            **http_client_kwargs,
         )
 
-    if environ.get("API_PROVIDER") == "gemini":
+    if provider == "gemini":
         from langchain_openai import ChatOpenAI
         from langchain_google_genai import ChatGoogleGenerativeAI  # noqa: E402
         llm = ChatGoogleGenerativeAI(
@@ -102,10 +226,8 @@ def get_llm():
 
     model_name = environ.get("API_MODEL")
 
-    provider = environ.get("API_PROVIDER", "").lower()
-
     supports_structured_output = False
-    if provider == "vllm":
+    if provider.lower() == "vllm":
         supports_structured_output = True
 
     if model_name is None or model_name == "":
@@ -122,11 +244,49 @@ def get_llm():
             "structured_output"
         ] = supports_structured_output
 
+    # identical requests (messages, model settings, tools and response
+    # format) are answered from the cache if LLM_CACHE_PATH is set
+    llm_cache = get_llm_cache()
+    if llm_cache is not None:
+        llm.cache = llm_cache
+
+    # LLM calls and token usage of the current tracing span
+    llm.callbacks = [*(llm.callbacks or []), TracingCallbackHandler()]
+
+    if rate_limiter is not None:
+        llm.rate_limiter = rate_limiter
+        llm.callbacks = [
+            *llm.callbacks, TokenUsageCallbackHandler(rate_limiter)
+        ]
+
     return llm
 
 
+def create_replay_llm():
+    """replay model configured by REPLAY_* environment variables,
+    in record mode wrapping a model of REPLAY_RECORD_PROVIDER"""
+    from replay import ReplayChatModel, get_replay_config
+    config = get_replay_config()
+    record_provider = config.pop("record_provider")
+    recorder = None
+    if config["mode"] == "record":
+        if not record_provider or record_provider == "replay":
+            raise ValueError("REPLAY_RECORD_PROVIDER is required to record")
+        recorder = create_llm(record_provider)
+        # the replay model itself is cached, traced and rate limited
+        recorder.cache = None
+        recorder.callbacks = None
+        recorder.rate_limiter = None
+    return ReplayChatModel(
+        model_name=environ.get("API_MODEL") or "replay",
+        recorder=recorder,
+        **config,
+    )
+
+
 def model_supports_structured_output(llm: BaseChatModel, tools=None):
     """Check if the LLM model supports structured output"""
+    from langchain.agents.factory import _supports_provider_strategy
     if llm.model_name in ["gpt-oss-120b", "mistral-large-3"]:
         return False
     return _supports_provider_strategy(llm, tools)
@@ -143,10 +303,11 @@ def get_response_format(
         ProviderStrategy,
         ToolStrategy
     )
+    from oold.static import GenericLinkedBaseModel
+    from schema_cache import get_processed_schema
 
     if issubclass(target_data_model, GenericLinkedBaseModel):
-        target_schema = target_data_model.export_schema()
-        target_schema = modify_schema(target_schema)
+        target_schema = get_processed_schema(target_data_model)
     else:
         target_schema = target_data_model.model_json_schema()
 
@@ -163,10 +324,15 @@ def get_response_format(
         )
 
 
-# create a default instance of the LLM
-llm = get_llm()
+def __getattr__(name):
+    # the default LLM instance `llm` is created on first access
+    if name == "llm":
+        return get_llm()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 if __name__ == "__main__":
+    llm = get_llm()
     print("LLM initialized:", llm)
     result = llm.invoke("Hello, world!")
     print("LLM invocation result:", result)
@@ -1,17 +1,37 @@
-import json
+from __future__ import annotations
+
+import functools
+from itertools import batched
+from typing import TYPE_CHECKING
 from dotenv import load_dotenv
 from os import environ
-from osw.express import OswExpress, CredentialManager, OSW
-import osw.model.entity as model
 from pydantic import BaseModel
-from langchain.agents import create_agent
 
-from llm_init import get_response_format
+from document_projection import (
+    get_document_text,
+    get_projection_id,
+    get_projections,
+)
+
+# osw and langchain are imported on first use, so importing this module
+# is cheap and does not connect to OSL, see __getattr__
+if TYPE_CHECKING:
+    from osw.express import OswExpress
 
 load_dotenv()
 
+# directory of the persisted, incrementally synced vector store
+VECTOR_STORE_PATH = environ.get("VECTOR_STORE_PATH", ".vector_store")
+
 
 def get_osl_client():
+    """log into OSL and return a new client. If OSW_PROVIDER is 'replay'
+    an offline client serving the pages of OSW_REPLAY_PATH is returned,
+    see replay.ReplayOslClient"""
+    if environ.get("OSW_PROVIDER") == "replay":
+        from replay import ReplayOslClient
+        return ReplayOslClient(environ.get("OSW_REPLAY_PATH", ""))
+    from osw.express import CredentialManager, OswExpress
     cred_mngr = CredentialManager()
     cred_mngr.add_credential(CredentialManager.UserPwdCredential(
         iri="llm4eln.semos.dev",
@@ -26,11 +46,22 @@ def get_osl_client():
     return osl_client
 
 
-# default osl_client instance
-osl_client = get_osl_client()
+@functools.cache
+def get_default_osl_client():
+    """the default client, created on first use and then reused"""
+    return get_osl_client()
+
+
+def __getattr__(name):
+    # the default `osl_client` instance is created on first access
+    if name == "osl_client":
+        return get_default_osl_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def search_by_label(osl_client: OswExpress, query: str):
+    from osw.express import OSW
+    import osw.model.entity as model
     result = osl_client.site.semantic_search(
         "[[HasLabel::~*" + query + "*]]"
     )
@@ -67,6 +98,8 @@ def search_by_label(osl_client: OswExpress, query: str):
 
 
 def search_by_category(osl_client: OswExpress, category: str):
+    from osw.express import OSW
+    import osw.model.entity as model
     result = osl_client.site.semantic_search(
         f"[[Category:{category}]]"
     )
@@ -78,94 +111,500 @@ def search_by_category(osl_client: OswExpress, category: str):
     return entities
 
 
-def get_all_pages(osl_client: OswExpress):
-    result = []
-    for namespace in [
-        # ":Category",
-        "Item",
-        # "Property",
-        # "File",
-    ]:
+# namespaces indexed by build_vector_store, see get_all_pages
+# (':Category' matches category pages, 'Category' would match
+# all pages that are in any category)
+NAMESPACES = [":Category", "Item", "Property", "File"]
+
+
+def get_all_pages(osl_client: OswExpress, namespaces=None, page_size=1000):
+    """generator yielding the titles of all pages (without subobjects)
+    in the given `namespaces` (defaults to "Item", see NAMESPACES).
+    Titles are fetched in pages of `page_size` results following the
+    continuation offset reported by the wiki, so there is no upper limit
+    and callers can start processing before enumeration has finished.
+    """
+    if namespaces is None:
+        namespaces = ["Item"]
+    for namespace in namespaces:
+        if namespace == "Category":
+            namespace = ":Category"
         print(f"Fetching all pages in namespace {namespace}...")
-        _result = osl_client.site.semantic_search(
-            f"[[{namespace}:+]][[HasOswId::!~*#*]]|limit=10000"
+        count = 0
+        offset = 0
+        while offset is not None:
+            result = osl_client.site.mw_site.api(
+                "ask",
+                query=(
+                    f"[[{namespace}:+]][[HasOswId::!~*#*]]"
+                    f"|limit={page_size}|offset={offset}"
+                ),
+                format="json",
+            )
+            # SMW returns an empty list instead of a dict if nothing matched
+            for title in result["query"]["results"] or {}:
+                # filter titles containing "#" (subobjects)
+                if "#" in title:
+                    continue
+                count += 1
+                yield title
+            # the wiki omits the continuation offset for the last page
+            offset = result.get("query-continue-offset")
+        print(f"   ...found {count} pages in namespace {namespace}.")
+
+
+def get_page_revisions(osl_client: OswExpress, titles, batch_size=50):
+    """fetch the latest revision id and touched timestamp of the given pages
+    without downloading their content.
+    Returns a dict mapping title -> {"lastrevid": ..., "touched": ...}
+    for all pages that exist.
+    """
+    revisions = {}
+    for i in range(0, len(titles), batch_size):
+        batch = titles[i:i + batch_size]
+        result = osl_client.site.mw_site.api(
+            "query",
+            prop="info",
+            titles="|".join(batch),
+            format="json",
         )
-        print(f"   ...found {len(_result)} pages so far.")
-        result.extend(_result)
-    # result = osl_client.site.semantic_search(
-    #     "[[:Category:+||Item:+||Property:+||File:+]]|limit=10000"
-    #     #"OR [[Item:+]] "
-    #     #"OR [[Property:+]]"
-    # )
-    # filter titles containing "#" (subobjects)
-    result = [title for title in result if "#" not in title]
-    return result
-
-
-def build_vector_store():
-    osl_client = get_osl_client()
-    # search_by_label(osl_client, "PCR")
+        for page in result["query"]["pages"].values():
+            if "missing" in page or "invalid" in page:
+                continue
+            revisions[page["title"]] = {
+                "lastrevid": page.get("lastrevid"),
+                "touched": page.get("touched"),
+            }
+    return revisions
 
-    all_titles = get_all_pages(osl_client)
-    print(f"Total pages found: {len(all_titles)}")
-    # print all titles
-    # for title in all_titles:
-    #    print(title)
 
-    # load all entities
-    # entities = osl_client.load_entity(OSW.LoadEntityParam(
-    #     titles=all_titles,
-    #     autofetch_schema=False,
-    #     model_to_use=model.Entity
-    # ))
+def load_documents(osl_client: OswExpress, titles, projections=None):
+    """download the given pages and convert them to langchain Documents.
+    The page content is the compact projection of the page's jsondata
+    (see document_projection), or all slots as JSON if `projections`
+    is None. The full slots can be fetched with get_page_slots.
+    Pages that can not be converted are reported and skipped.
+    """
+    if not titles:
+        return []
 
-    # load all pages
     from osw.wtsite import WtSite
     pages = osl_client.site.get_page(
         WtSite.GetPageParam(
-            titles=all_titles
+            titles=titles,
+            parallel=False,
+            raise_exception=True,
         )
     ).pages
 
-    # create Documents
     from langchain_core.documents import Document
     documents = []
     for page in pages:
-        doc = Document(
-            id=page.title,
-            page_content=json.dumps(page._slots),
-            metadata={
-                "name": (
-                    page.get_slot_content("jsondata").get("name", "Unknown")
-                ),
-                "type": (
-                    page.get_slot_content("jsondata").get("type", "Unknown")
-                ),
-                "url": page.get_url(),
-            }
-        )
+        try:
+            # e.g. File or Property pages may have no jsondata slot
+            jsondata = page.get_slot_content("jsondata") or {}
+            doc = Document(
+                id=page.title,
+                page_content=get_document_text(page._slots, projections),
+                metadata={
+                    "name": jsondata.get("name", "Unknown"),
+                    "type": jsondata.get("type", "Unknown"),
+                    "url": page.get_url(),
+                }
+            )
+        except Exception as e:
+            # skip only this page, not the whole chunk (see iter_documents)
+            print(f"Skipping page {page.title}: {e}")
+            continue
         documents.append(doc)
+    return documents
 
-    from rag_init import get_vector_store
 
-    vector_store = get_vector_store()
+def get_page_slots(osl_client: OswExpress, title: str) -> dict:
+    """fetch all slots (jsondata, wikitext, header, ...) of a page on
+    demand, e.g. for a document whose content is only a projection"""
+    from osw.wtsite import WtSite
+    page = osl_client.site.get_page(
+        WtSite.GetPageParam(titles=[title], raise_exception=True)
+    ).pages[0]
+    return page._slots
+
+
+def iter_documents(
+    osl_client: OswExpress,
+    titles,
+    chunk_size=50,
+    max_workers=4,
+    retries=3,
+    retry_delay_s=5,
+    projections=None,
+):
+    """download the given pages in chunks of `chunk_size` titles using a pool
+    of `max_workers` threads and yield the Documents of each chunk as soon
+    as it is finished. `titles` may be any iterable, e.g. the generator
+    returned by get_all_pages, and is only consumed as far as needed.
+    `projections` is passed on to load_documents.
+    A failed chunk is retried up to `retries` times,
+    chunks that still fail are reported and skipped.
+    At most 2 * `max_workers` chunks are in flight, so memory stays flat
+    independent of the total number of pages.
+    """
+    import time
+    from concurrent.futures import (
+        FIRST_COMPLETED,
+        ThreadPoolExecutor,
+        wait,
+    )
 
-    # add documents to vector store
-    print(f"Adding {len(documents)} documents to vector store...")
-    vector_store.add_documents(documents=documents)
+    def load_chunk(chunk):
+        for attempt in range(1, retries + 1):
+            try:
+                return load_documents(osl_client, chunk, projections)
+            except Exception as e:
+                print(
+                    f"Error fetching chunk of {len(chunk)} pages "
+                    f"(attempt {attempt}/{retries}): {e}"
+                )
+                if attempt < retries:
+                    time.sleep(retry_delay_s)
+        print(f"Skipping {len(chunk)} pages: {chunk[0]} ...")
+        return []
+
+    chunks = (list(chunk) for chunk in batched(titles, chunk_size))
+    done_count = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = set()
+        for chunk in chunks:
+            pending.add(executor.submit(load_chunk, chunk))
+            if len(pending) < 2 * max_workers:
+                continue
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                documents = future.result()
+                done_count += len(documents)
+                print(f"   ...fetched {done_count} pages")
+                yield documents
+        for future in wait(pending).done:
+            documents = future.result()
+            done_count += len(documents)
+            print(f"   ...fetched {done_count} pages")
+            yield documents
+
+
+def build_vector_store(
+    persist_path=VECTOR_STORE_PATH, chunk_size=50, max_workers=4,
+    namespaces=NAMESPACES
+):
+    """build or update the vector store of all pages.
+    The store is persisted in `persist_path` together with a manifest of
+    the indexed page revisions, so only pages that were added, changed or
+    deleted since the last run are fetched and (re-)embedded.
+    Pass `persist_path=None` to build a fresh, non-persisted store.
+    All pages in `namespaces` are indexed, pages in other namespaces
+    are removed from a persisted store.
+    Pages are fetched in chunks of `chunk_size` by `max_workers` threads
+    and embedded while the next chunks are still downloading.
+    Documents contain the projected jsondata configured by
+    DOCUMENT_TEXT / DOCUMENT_PROJECTIONS_PATH, all pages are re-indexed
+    if this configuration changes.
+    """
+    osl_client = get_osl_client()
+    # search_by_label(osl_client, "PCR")
+
+    from rag_init import (
+        get_vector_store,
+        load_vector_store,
+        save_vector_store,
+    )
+
+    if persist_path is None:
+        vector_store = get_vector_store()
+        manifest = {"pages": {}}
+    else:
+        vector_store, manifest = load_vector_store(persist_path)
+    indexed = manifest["pages"]
+    print(f"Vector store sync: {len(indexed)} pages indexed")
+
+    projections = get_projections()
+    document_text = get_projection_id(projections)
+    if manifest.get("document_text", "slots") != document_text:
+        print("Document text format changed, re-indexing all pages")
+        for title in indexed:
+            indexed[title] = None
+        manifest["document_text"] = document_text
+
+    revisions = {}
+
+    def changed_titles():
+        """enumerate all pages and yield those that are new or changed"""
+        pages = get_all_pages(osl_client, namespaces)
+        for batch in batched(pages, 50):
+            batch_revisions = get_page_revisions(osl_client, list(batch))
+            revisions.update(batch_revisions)
+            for title, revision in batch_revisions.items():
+                if indexed.get(title) != revision:
+                    yield title
+
+    # load new or changed pages chunk by chunk while the enumeration
+    # is still running and add their documents to the vector store
+    added = 0
+    for documents in iter_documents(
+        osl_client,
+        changed_titles(),
+        chunk_size=chunk_size,
+        max_workers=max_workers,
+        projections=projections,
+    ):
+        if not documents:
+            continue
+        outdated = [doc.id for doc in documents if doc.id in indexed]
+        if outdated:
+            vector_store.delete(ids=outdated)
+        vector_store.add_documents(documents=documents)
+        for doc in documents:
+            indexed[doc.id] = revisions.get(doc.id)
+        added += len(documents)
+    print(f"Total pages found: {len(revisions)}")
+
+    # remove pages that no longer exist
+    deleted = [title for title in indexed if title not in revisions]
+    if deleted:
+        vector_store.delete(ids=deleted)
+        for title in deleted:
+            indexed.pop(title)
+
+    print(
+        f"Vector store sync: {added} documents added or updated, "
+        f"{len(deleted)} deleted"
+    )
+    if added and hasattr(vector_store.embedding, "get_stats"):
+        print(f"Embedding cache: {vector_store.embedding.get_stats()}")
+    if getattr(vector_store, "keyword_index", None) is not None:
+        print(f"Keyword index: {vector_store.keyword_index.get_stats()}")
+
+    if hasattr(vector_store, "build_index"):
+        vector_store.build_index()
+
+    if persist_path is not None and (deleted or added):
+        save_vector_store(vector_store, manifest, persist_path)
 
     return vector_store
 
 
-def lookup_excact_matching_entity(
-    vector_store, description, llm_judge=False, debug=False
-) -> str | None:
-    """lookup an entity by its description using the vector store
-    and return the entity's title / ID if a good match is found.
-    """
+@functools.cache
+def get_vector_store():
+    """the default vector store, built (or synced) on first use and
+    then reused"""
+    return build_vector_store()
+
+
+class JudgeResult(BaseModel):
+    osw_id: str
+    """the OSW-ID of the best matching entity,
+    or empty '' if no good match is found"""
+    explanation: str
+    """explanation of the decision"""
+
+
+JUDGE_SYSTEM_PROMPT = (
+    "Check if one of the candidate entities matches the given "
+    "description exactly by comparing all fields. "
+    "For free text fields, consider minor variations in wording "
+    "as matches. "
+    "Structured fields like ids, dates, enums, have to match "
+    "exactly. "
+    "Go over each candidate entity and compare its data to the "
+    "description. "
+    "Side by side compare each field and decide if it matches "
+    "the description. "
+    "If all match, return the matching entity's OSW-ID "
+    "(e.g. Item:OSW123..). "
+    "Return an empty OSW-ID if no good match was found."
+    "Respond in valid JSON according to the schema: "
+    "{'osw_id': str, 'explanation': str}"
+)
+
+
+def get_judge_agent():
+    """create the agent that judges if one of the candidates
+    matches a description"""
+    from langchain.agents import create_agent
+    from llm_init import get_llm, get_response_format
+
+    llm = get_llm()
+    # llm = get_llm(reasoning_effort="high")
+
+    response_format = get_response_format(
+        llm, target_data_model=JudgeResult
+    )
+    return create_agent(
+        model=llm,
+        response_format=response_format,
+    )
+
+
+def get_judge_input(description, results) -> dict:
+    """build the judge agent input for a description and its candidates"""
+    candidates_str = "\n".join([
+        f"- OSW-ID: {res.id}, Data: {res.page_content}"
+        for res, score in results
+    ])
+
+    user_prompt = (
+        f"Description of the entity:\n"
+        f"{description}\n\n"
+        f"Candidate entities with their metadata:\n"
+        f"{candidates_str}"
+    )
+    return {"messages": [
+        {
+            "role": "system",
+            "content": JUDGE_SYSTEM_PROMPT
+        },
+        {
+            "role": "user",
+            "content": user_prompt
+        }
+    ]}
+
+
+def get_judge_decision(response) -> str | None:
+    """return the OSW-ID chosen by the judge or None if there is no match"""
+    response = response["structured_response"]
+    print(f"LLM Judge Response: {response}")
+    response = JudgeResult.model_validate(response)
+    if not response.osw_id.startswith("Item:OSW"):
+        return None
+    else:
+        return response.osw_id
+
+
+def get_threshold_decision(results, threshold=0.4) -> str | None:
+    """return the best match if its score is above the threshold"""
+    if not results:
+        return None
+    best_res, best_score = results[0]
+    if best_score > threshold:  # arbitrary threshold
+        return best_res.id
+    else:
+        return None
+
+
+# counters of the entity lookup:
+# judge_calls_skipped counts lookups without candidates,
+# candidates_demoted the effect of the identifier ranking
+# (see rank_candidates)
+lookup_stats = {
+    "lookups": 0,
+    "judge_calls": 0,
+    "judge_calls_skipped": 0,
+    "candidates_demoted": 0,
+}
+
+
+def get_type_filter(schema_id) -> list[str] | None:
+    """category ids (e.g. 'Category:OSW44deaa5b806d41a2a88594f562b110e9')
+    a lookup is restricted to, None if schema_id contains none"""
+    if not schema_id:
+        return None
+    if isinstance(schema_id, str):
+        schema_id = [schema_id]
+    types = [s for s in schema_id if s and s.startswith("Category:")]
+    return types or None
+
+
+def get_search_kwargs(vector_store, types) -> dict:
+    """search arguments restricting the search to documents of `types`"""
+    if types is None:
+        return {}
+    if hasattr(vector_store, "get_types"):
+        # type partitioned store, only scans the matching vectors
+        return {"types": types}
+
+    def type_filter(doc):
+        doc_types = doc.metadata.get("type") or []
+        if isinstance(doc_types, str):
+            doc_types = [doc_types]
+        return any(t in types for t in doc_types)
+    return {"filter": type_filter}
+
+
+def search_candidates(vector_store, description, k=5, types=None):
+    """return the k best candidates for a description, using hybrid
+    (BM25 + vector) search if the store has a keyword index"""
+    search_kwargs = get_search_kwargs(vector_store, types)
+    if getattr(vector_store, "keyword_index", None) is not None:
+        return vector_store.hybrid_search_with_score(
+            description, k=k, **search_kwargs
+        )
+    return vector_store.similarity_search_with_score(
+        description, k=k, **search_kwargs
+    )
+
+
+def embed_queries(embeddings, texts: list[str]) -> list[list[float]]:
+    """query embeddings of `texts` (embed_query, which differs from
+    embed_documents for asymmetric models), in one cache lookup if the
+    embeddings are cached"""
+    if hasattr(embeddings, "embed_queries"):
+        return embeddings.embed_queries(texts)
+    return [embeddings.embed_query(text) for text in texts]
+
+
+def search_candidates_batch(vector_store, descriptions, k=5, types=None):
+    """batch variant of search_candidates: embeds all descriptions and
+    scores them against the store in one matrix product (if supported),
+    the type filter and BM25 fusion are applied per description"""
+    search_kwargs = get_search_kwargs(vector_store, types)
+    embeddings = embed_queries(vector_store.embeddings, list(descriptions))
+    if getattr(vector_store, "keyword_index", None) is not None:
+        return vector_store.hybrid_search_with_score_by_vectors(
+            descriptions, embeddings, k=k, **search_kwargs
+        )
+    if hasattr(vector_store, "similarity_search_with_score_by_vectors"):
+        return vector_store.similarity_search_with_score_by_vectors(
+            embeddings, k=k, **search_kwargs
+        )
+    return [
+        vector_store.similarity_search_with_score_by_vector(
+            embedding, k=k, **search_kwargs
+        )
+        for embedding in embeddings
+    ]
+
+
+def rank_candidates(vector_store, description, results):
+    """rank candidates that contain every ORCID and ISO date of the
+    description first, keeping the order by score otherwise.
+    Candidates without them are not dropped: the indexed text is only a
+    projection of the jsondata (see document_projection), the
+    identifiers of a true match may be in fields outside of it.
+    Requires a store with keyword index."""
+    keyword_index = getattr(vector_store, "keyword_index", None)
+    if keyword_index is None:
+        return results
+    from keyword_index import extract_identifiers
+    identifiers = extract_identifiers(description)
+    if not identifiers:
+        return results
+    matching, other = [], []
+    for res, score in results:
+        if keyword_index.contains_all(res.id, identifiers):
+            matching.append((res, score))
+        else:
+            other.append((res, score))
+    lookup_stats["candidates_demoted"] += len(other)
+    return matching + other
+
+
+def get_lookup_candidates(
+    vector_store, description, debug=False, schema_id=None
+):
+    """search and rank the candidates of an entity lookup"""
+    lookup_stats["lookups"] += 1
     # perform a similarity search
-    results = vector_store.similarity_search_with_score(
-        description, k=5
+    results = search_candidates(
+        vector_store, description, k=5, types=get_type_filter(schema_id)
     )
     print(f"\n\nLookup description: {description}")
     if debug:
@@ -175,83 +614,129 @@ def lookup_excact_matching_entity(
                 f"  Metadata: {res.metadata}\n"
                 f"  Data: {res.page_content}\n"
             )
+    return rank_candidates(vector_store, description, results)
+
+
+def lookup_excact_matching_entity(
+    vector_store, description, llm_judge=False, debug=False, schema_id=None
+) -> str | None:
+    """lookup an entity by its description using the vector store
+    and return the entity's title / ID if a good match is found.
+    If `schema_id` contains category ids (e.g. `CreateParam.schema_id`),
+    only entities of these categories are considered.
+    """
+    results = get_lookup_candidates(
+        vector_store, description, debug=debug, schema_id=schema_id
+    )
 
     # if llm_judge is True, use LLM to judge the best match
     if llm_judge:
-        from llm_init import get_llm
-
-        class ResultSchema(BaseModel):
-            osw_id: str
-            """the OSW-ID of the best matching entity,
-            or empty '' if no good match is found"""
-            explanation: str
-            """explanation of the decision"""
-
-        system_prompt = (
-            "Check if one of the candidate entities matches the given "
-            "description exactly by comparing all fields. "
-            "For free text fields, consider minor variations in wording "
-            "as matches. "
-            "Structured fields like ids, dates, enums, have to match "
-            "exactly. "
-            "Go over each candidate entity and compare its data to the "
-            "description. "
-            "Side by side compare each field and decide if it matches "
-            "the description. "
-            "If all match, return the matching entity's OSW-ID "
-            "(e.g. Item:OSW123..). "
-            "Return an empty OSW-ID if no good match was found."
-            "Respond in valid JSON according to the schema: "
-            "{'osw_id': str, 'explanation': str}"
-        )
+        if not results:
+            print("No candidates found, skipping judge")
+            lookup_stats["judge_calls_skipped"] += 1
+            return None
+        lookup_stats["judge_calls"] += 1
+        from llm_cache import llm_cache_step
+        agent = get_judge_agent()
+        with llm_cache_step("judge"):
+            response = agent.invoke(get_judge_input(description, results))
+        return get_judge_decision(response)
+    else:
+        # return the best match if score is above a threshold
+        return get_threshold_decision(results)
 
-        candidates_str = "\n".join([
-            f"- OSW-ID: {res.id}, Data: {res.page_content}"
-            for res, score in results
-        ])
 
-        user_prompt = (
-            f"Description of the entity:\n"
-            f"{description}\n\n"
-            f"Candidate entities with their metadata:\n"
-            f"{candidates_str}"
-        )
+async def alookup_excact_matching_entity(
+    vector_store, description, llm_judge=False, debug=False, schema_id=None
+) -> str | None:
+    """async variant of lookup_excact_matching_entity, the vector search
+    runs in a worker thread and the judge is awaited"""
+    import asyncio
+    results = await asyncio.to_thread(
+        get_lookup_candidates,
+        vector_store, description, debug=debug, schema_id=schema_id
+    )
 
-        llm = get_llm()
-        # if hasattr(llm, "reasoning_effort"):
-        #     llm.reasoning_effort = "high"
+    if llm_judge:
+        if not results:
+            print("No candidates found, skipping judge")
+            lookup_stats["judge_calls_skipped"] += 1
+            return None
+        lookup_stats["judge_calls"] += 1
+        from llm_cache import llm_cache_step
+        agent = get_judge_agent()
+        with llm_cache_step("judge"):
+            response = await agent.ainvoke(
+                get_judge_input(description, results)
+            )
+        return get_judge_decision(response)
+    else:
+        return get_threshold_decision(results)
+
+
+def lookup_excact_matching_entities(
+    vector_store, descriptions: list[str], llm_judge=False, k=5, debug=False,
+    schema_id=None
+) -> list[dict]:
+    """batch variant of lookup_excact_matching_entity.
+    Embeds all descriptions as queries, scores them against the store in
+    one matrix product, fuses each with its BM25 matches like the single
+    lookup (see search_candidates_batch) and runs the LLM judge calls
+    concurrently. `schema_id` restricts all lookups to the given
+    categories, see lookup_excact_matching_entity.
+    Returns one dict per description with the keys
+    `description`, `candidates` (list of (OSW-ID, score)) and
+    `osw_id` (the matching entity or None).
+    """
+    if not descriptions:
+        return []
+    print(f"\n\nLookup of {len(descriptions)} descriptions")
 
-        response_format = get_response_format(
-            llm, target_data_model=ResultSchema
-        )
-        agent = create_agent(
-            model=llm,
-            response_format=response_format,
-        )
+    all_results = search_candidates_batch(
+        vector_store, descriptions, k=k, types=get_type_filter(schema_id)
+    )
 
-        response = agent.invoke({"messages": [
-            {
-                "role": "system",
-                "content": system_prompt
-            },
-            {
-                "role": "user",
-                "content": user_prompt
-            }
-        ]})["structured_response"]
-        print(f"LLM Judge Response: {response}")
-        response = ResultSchema.model_validate(response)
-        if not response.osw_id.startswith("Item:OSW"):
-            return None
-        else:
-            return response.osw_id
+    if debug:
+        for description, results in zip(descriptions, all_results):
+            print(f"Lookup description: {description}")
+            for res, score in results:
+                print(f"- Document ID: {res.id}, Score: {score}")
+    lookup_stats["lookups"] += len(descriptions)
+    all_results = [
+        rank_candidates(vector_store, description, results)
+        for description, results in zip(descriptions, all_results)
+    ]
+
+    if llm_judge:
+        to_judge = [i for i, results in enumerate(all_results) if results]
+        lookup_stats["judge_calls"] += len(to_judge)
+        lookup_stats["judge_calls_skipped"] += (
+            len(descriptions) - len(to_judge)
+        )
+        decisions = [None] * len(descriptions)
+        if to_judge:
+            from llm_cache import llm_cache_step
+            agent = get_judge_agent()
+            with llm_cache_step("judge"):
+                responses = agent.batch([
+                    get_judge_input(descriptions[i], all_results[i])
+                    for i in to_judge
+                ])
+            for i, response in zip(to_judge, responses):
+                decisions[i] = get_judge_decision(response)
     else:
-        # return the best match if score is above a threshold
-        best_res, best_score = results[0]
-        if best_score > 0.4:  # arbitrary threshold
-            return best_res.id
-        else:
-            return None
+        decisions = [get_threshold_decision(r) for r in all_results]
+
+    return [
+        {
+            "description": description,
+            "candidates": [(res.id, score) for res, score in results],
+            "osw_id": decision,
+        }
+        for description, results, decision in zip(
+            descriptions, all_results, decisions
+        )
+    ]
 
 
 if __name__ == "__main__":
@@ -310,3 +795,18 @@ if __name__ == "__main__":
         llm_judge=True
     )
     print(f"Lookup result with LLM judge: {res3}")
+
+    batch_results = lookup_excact_matching_entities(
+        vector_store=vector_store,
+        descriptions=[
+            "Dr. John Doe",
+            "Example Lab",
+            "Person Dr. Jane Smith",
+        ],
+        llm_judge=True
+    )
+    for batch_result in batch_results:
+        print(
+            f"Batch lookup result for '{batch_result['description']}': "
+            f"{batch_result['osw_id']}"
+        )
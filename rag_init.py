@@ -1,4 +1,5 @@
 import json
+import os
 from dotenv import load_dotenv
 from os import environ
 from langchain_core.documents import Document
@@ -6,11 +7,75 @@ from langchain_core.documents import Document
 load_dotenv()
 
 
-def get_embedding():
+def get_embedding_model_name() -> str:
+    """EMBEDDING_API_MODEL, prefixed with 'replay:' for the replay
+    provider so replayed or synthetic vectors are never mixed with
+    cached or persisted vectors of the real provider"""
+    model = environ.get("EMBEDDING_API_MODEL", "")
+    if environ.get("EMBEDDING_API_PROVIDER") == "replay":
+        return f"replay:{model}"
+    return model
+
+
+def get_embedding(cached=True):
     """initialize and return a new language model object
-    based on environment variables"""
+    based on environment variables.
+    If `cached` is True and EMBEDDING_CACHE_PATH is not empty, the
+    embedding is wrapped in an on-disk cache so identical texts are
+    only embedded once. Requests that are not cached are rate limited
+    by EMBEDDING_RATE_LIMIT_RPM / EMBEDDING_RATE_LIMIT_TPM.
+    """
+
+    from rate_limit import RateLimitedEmbeddings, get_rate_limiter
+    rate_limiter = get_rate_limiter("EMBEDDING_")
+    embedding = create_embedding(
+        environ.get("EMBEDDING_API_PROVIDER"), rate_limiter
+    )
+
+    if rate_limiter is not None:
+        embedding = RateLimitedEmbeddings(embedding, rate_limiter)
+
+    cache_path = environ.get(
+        "EMBEDDING_CACHE_PATH", ".cache/embeddings.sqlite"
+    )
+    if cached and cache_path:
+        from embedding_cache import CachedEmbeddings
+        embedding = CachedEmbeddings(
+            embedding,
+            model=get_embedding_model_name(),
+            path=cache_path,
+            max_entries=int(
+                environ.get("EMBEDDING_CACHE_MAX_ENTRIES", "100000")
+            ),
+        )
+    return embedding
+
+
+def create_embedding(provider: str, rate_limiter=None):
+    """embedding model of `provider`, throttled requests of openai
+    based clients pause `rate_limiter`, see rate_limit"""
+    from rate_limit import get_http_client_kwargs
 
-    if environ.get("EMBEDDING_API_PROVIDER") == "azure":
+    if provider == "replay":
+        # offline, recorded or hash based vectors, see replay.py
+        from replay import ReplayEmbeddings, get_replay_config
+        config = get_replay_config("EMBEDDING_")
+        record_provider = config.pop("record_provider")
+        recorder = None
+        if config["mode"] == "record":
+            if not record_provider or record_provider == "replay":
+                raise ValueError(
+                    "EMBEDDING_REPLAY_RECORD_PROVIDER is required to record"
+                )
+            recorder = create_embedding(record_provider, rate_limiter)
+        dimensions = environ.get("EMBEDDING_REPLAY_DIMENSIONS")
+        embedding = ReplayEmbeddings(
+            recorder=recorder,
+            dimensions=int(dimensions) if dimensions else None,
+            **config,
+        )
+
+    if provider == "azure":
         # https://docs.langchain.com/oss/python/integrations/providers/microsoft
         from langchain_openai import AzureOpenAIEmbeddings
         embedding = AzureOpenAIEmbeddings(
@@ -19,20 +84,86 @@ def get_embedding():
             # or your api version
             api_version=environ.get("EMBEDDING_API_VERSION"),
             api_key=environ.get("EMBEDDING_API_KEY"),  # or your api key
-            azure_endpoint=environ.get("EMBEDDING_API_ENDPOINT")
+            azure_endpoint=environ.get("EMBEDDING_API_ENDPOINT"),
+            **get_http_client_kwargs(rate_limiter),
         )
     return embedding
 
 
+def get_index_config() -> dict:
+    """vector store index settings from environment variables:
+    VECTOR_STORE_INDEX ('exact' or 'ivf' for approximate search),
+    VECTOR_STORE_NLIST and VECTOR_STORE_NPROBE (ivf only),
+    VECTOR_STORE_KEYWORD_INDEX ('true' to keep a BM25 index
+    for hybrid search, default)"""
+    config = {
+        "index": environ.get("VECTOR_STORE_INDEX", "exact"),
+        "keyword_index": environ.get(
+            "VECTOR_STORE_KEYWORD_INDEX", "true"
+        ).lower() in ("1", "true", "yes"),
+    }
+    if config["index"] == "ivf":
+        if environ.get("VECTOR_STORE_NLIST"):
+            config["nlist"] = int(environ["VECTOR_STORE_NLIST"])
+        if environ.get("VECTOR_STORE_NPROBE"):
+            config["nprobe"] = int(environ["VECTOR_STORE_NPROBE"])
+    return config
+
+
 def get_vector_store():
     """initialize and return a vector store instance"""
     embedding = get_embedding()
 
-    from langchain_core.vectorstores import InMemoryVectorStore
-    vector_store = InMemoryVectorStore(embedding=embedding)
+    from vector_store import NumpyVectorStore
+    vector_store = NumpyVectorStore(embedding=embedding, **get_index_config())
     return vector_store
 
 
+def load_vector_store(path: str):
+    """load a vector store and its sync manifest persisted with
+    `save_vector_store` from the directory `path`.
+    Returns a fresh, empty vector store and manifest if nothing was
+    persisted yet or the index was built with a different embedding model.
+    """
+    store_file = os.path.join(path, "store.npz")
+    manifest_file = os.path.join(path, "manifest.json")
+    embedding_model = get_embedding_model_name()
+
+    if os.path.isfile(store_file) and os.path.isfile(manifest_file):
+        with open(manifest_file, encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("embedding_model") == embedding_model:
+            from vector_store import NumpyVectorStore
+            vector_store = NumpyVectorStore.load(
+                store_file, embedding=get_embedding(), **get_index_config()
+            )
+            return vector_store, manifest
+        print(
+            f"Embedding model changed from "
+            f"'{manifest.get('embedding_model')}' to '{embedding_model}', "
+            f"rebuilding vector store"
+        )
+
+    manifest = {"embedding_model": embedding_model, "pages": {}}
+    return get_vector_store(), manifest
+
+
+def save_vector_store(vector_store, manifest: dict, path: str):
+    """persist a vector store and its sync manifest to the directory `path`
+    so that `load_vector_store` can restore it on the next run"""
+    os.makedirs(path, exist_ok=True)
+    store_file = os.path.join(path, "store.npz")
+    manifest_file = os.path.join(path, "manifest.json")
+
+    # write to temporary files first so an interrupted run
+    # never leaves a store without matching manifest behind
+    vector_store.dump(store_file + ".tmp")
+    with open(manifest_file + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(store_file + ".tmp", store_file)
+    os.replace(manifest_file + ".tmp", manifest_file)
+
+
 if __name__ == "__main__":
 
     vector_store = get_vector_store()
@@ -83,3 +214,6 @@ if __name__ == "__main__":
     query("PCR techniques")
     query("Electrophoresis methods")
     query("Elephant")
+
+    if hasattr(vector_store.embedding, "get_stats"):
+        print(f"Embedding cache: {vector_store.embedding.get_stats()}")
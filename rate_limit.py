@@ -0,0 +1,408 @@
+import asyncio
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from os import environ
+
+import httpx
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.embeddings import Embeddings
+from langchain_core.rate_limiters import BaseRateLimiter
+
+from tracing import add_to_span
+
+# throttled responses, they pause the rate limiter for the provider's
+# Retry-After delay (or a jittered exponential backoff)
+RETRY_STATUS_CODES = {429, 503}
+# retry count sent by the openai (and anthropic) SDKs
+SDK_RETRY_HEADER = "x-stainless-retry-count"
+
+
+class TokenBucket:
+    """token bucket refilled with `rate_per_minute`, holding at most
+    `capacity` tokens. The level may become negative: reservations and
+    recorded usage beyond the capacity are paid back before the next
+    reservation succeeds. Not thread safe, see RateLimiter."""
+
+    def __init__(self, rate_per_minute: float, capacity: float = None):
+        self.rate = rate_per_minute / 60
+        self.capacity = capacity or max(1.0, rate_per_minute / 6)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.level = min(
+            self.capacity, self.level + (now - self.updated) * self.rate
+        )
+        self.updated = now
+
+    def wait_time(self, now: float, amount: float = 0.0) -> float:
+        """seconds until `amount` tokens are available"""
+        self._refill(now)
+        return max(0.0, amount - self.level) / self.rate
+
+    def reserve(self, now: float, amount: float = 1.0) -> float:
+        """take `amount` tokens and return the seconds to wait until
+        they are actually available"""
+        wait = self.wait_time(now, amount)
+        self.level -= amount
+        return wait
+
+
+class RateLimiter(BaseRateLimiter):
+    """rate limiter of one provider with token buckets for requests and
+    tokens (per minute). Waiting requests are scheduled in order, a
+    Retry-After received by any request pauses all of them.
+    Usable as `rate_limiter` of langchain chat models.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        requests_per_minute: float = None,
+        tokens_per_minute: float = None,
+    ):
+        self.name = name
+        self.requests = (
+            TokenBucket(requests_per_minute) if requests_per_minute else None
+        )
+        self.tokens = (
+            TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        )
+        self._lock = threading.Lock()
+        self._not_before = 0.0
+        self.acquired = 0
+        self.waiting = 0
+        self.max_waiting = 0
+        self.wait_s = 0.0
+        self.token_count = 0
+        self.throttled = 0
+
+    def _reserve(self, blocking: bool) -> float | None:
+        """reserve a request slot and return the seconds to wait for it,
+        None if not `blocking` and the slot is not available now"""
+        with self._lock:
+            now = time.monotonic()
+            wait = max(0.0, self._not_before - now)
+            if self.tokens is not None:
+                # wait until the used tokens are paid back
+                wait = max(wait, self.tokens.wait_time(now))
+            if not blocking and (wait > 0 or (
+                self.requests is not None
+                and self.requests.wait_time(now, 1) > 0
+            )):
+                return None
+            if self.requests is not None:
+                # reservations queue up behind the current waiters
+                wait = max(wait, self.requests.reserve(now))
+            self.acquired += 1
+            if wait > 0:
+                self.waiting += 1
+                self.max_waiting = max(self.max_waiting, self.waiting)
+                self.wait_s += wait
+            return wait
+
+    def _done_waiting(self):
+        with self._lock:
+            self.waiting -= 1
+
+    def acquire(self, *, blocking: bool = True) -> bool:
+        wait = self._reserve(blocking)
+        if wait is None:
+            return False
+        if wait > 0:
+            time.sleep(wait)
+            self._done_waiting()
+        return True
+
+    async def aacquire(self, *, blocking: bool = True) -> bool:
+        wait = self._reserve(blocking)
+        if wait is None:
+            return False
+        if wait > 0:
+            await asyncio.sleep(wait)
+            self._done_waiting()
+        return True
+
+    def record_tokens(self, count: int):
+        """account the tokens used by a finished request"""
+        with self._lock:
+            self.token_count += count
+            if self.tokens is not None:
+                self.tokens.reserve(time.monotonic(), count)
+
+    def pause(self, delay_s: float):
+        """let no request start within the next `delay_s` seconds,
+        called for throttled responses"""
+        with self._lock:
+            self.throttled += 1
+            self._not_before = max(
+                self._not_before, time.monotonic() + delay_s
+            )
+
+    def get_stats(self) -> dict:
+        """request / token counters, current and max. queue depth and
+        the time spent waiting for the limits"""
+        with self._lock:
+            return {
+                "name": self.name,
+                "requests": self.acquired,
+                "tokens": self.token_count,
+                "queue_depth": self.waiting,
+                "max_queue_depth": self.max_waiting,
+                "wait_s": self.wait_s,
+                "avg_wait_ms": (
+                    self.wait_s / self.acquired * 1000
+                    if self.acquired else 0.0
+                ),
+                "throttled": self.throttled,
+            }
+
+
+def get_retry_after(headers) -> float | None:
+    """delay in seconds requested by the provider, if any
+    (retry-after-ms, retry-after as seconds or HTTP date)"""
+    if "retry-after-ms" in headers:
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value).timestamp()
+        return max(0.0, retry_at - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def get_retry_delay(
+    attempt: int,
+    retry_after: float = None,
+    base_delay_s: float = 1.0,
+    max_delay_s: float = 60.0,
+) -> float:
+    """Retry-After if given, otherwise exponential backoff with full jitter"""
+    if retry_after is not None:
+        # small jitter so paused requests do not all restart at once
+        return min(max_delay_s, retry_after) + random.uniform(0, 0.5)
+    return random.uniform(0, min(max_delay_s, base_delay_s * 2 ** attempt))
+
+
+class RetryPolicy:
+    """retry of throttled requests (RETRY_STATUS_CODES) up to
+    `max_retries` times. The delay pauses the whole `limiter`, and
+    each retry acquires a new request slot. With `max_retries=0`
+    throttled responses only pause the limiter and are returned, for
+    clients retrying on their own (see get_http_client_kwargs)."""
+
+    def __init__(
+        self,
+        limiter: RateLimiter,
+        max_retries: int = 5,
+        base_delay_s: float = 1.0,
+        max_delay_s: float = 60.0,
+    ):
+        self.limiter = limiter
+        self.max_retries = max_retries
+        self.base_delay_s = base_delay_s
+        self.max_delay_s = max_delay_s
+
+    def get_delay(self, response, attempt) -> float | None:
+        """pause the limiter if `response` is throttled and return the
+        delay before the next attempt, None if `response` is final"""
+        if response.status_code not in RETRY_STATUS_CODES:
+            return None
+        delay = get_retry_delay(
+            attempt,
+            get_retry_after(response.headers),
+            self.base_delay_s,
+            self.max_delay_s,
+        )
+        self.limiter.pause(delay)
+        if attempt >= self.max_retries:
+            return None
+        add_to_span(retries=1)
+        return delay
+
+    @staticmethod
+    def is_client_retry(request) -> bool:
+        """whether `request` is a retry of the client's SDK"""
+        return request.headers.get(SDK_RETRY_HEADER, "0") != "0"
+
+
+class RetryTransport(RetryPolicy, httpx.BaseTransport):
+    """httpx transport applying the RetryPolicy"""
+
+    def __init__(self, limiter: RateLimiter, transport=None, **kwargs):
+        super().__init__(limiter, **kwargs)
+        self.transport = transport or httpx.HTTPTransport()
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        if self.is_client_retry(request):
+            # the rate limiter of the model is only acquired once per call
+            add_to_span(retries=1)
+            self.limiter.acquire()
+        attempt = 0
+        while True:
+            response = self.transport.handle_request(request)
+            if self.get_delay(response, attempt) is None:
+                return response
+            response.close()
+            attempt += 1
+            self.limiter.acquire()
+
+    def close(self):
+        self.transport.close()
+
+
+class AsyncRetryTransport(RetryPolicy, httpx.AsyncBaseTransport):
+    """async httpx transport applying the RetryPolicy"""
+
+    def __init__(self, limiter: RateLimiter, transport=None, **kwargs):
+        super().__init__(limiter, **kwargs)
+        self.transport = transport or httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(
+        self, request: httpx.Request
+    ) -> httpx.Response:
+        if self.is_client_retry(request):
+            add_to_span(retries=1)
+            await self.limiter.aacquire()
+        attempt = 0
+        while True:
+            response = await self.transport.handle_async_request(request)
+            if self.get_delay(response, attempt) is None:
+                return response
+            await response.aclose()
+            attempt += 1
+            await self.limiter.aacquire()
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+class TokenUsageCallbackHandler(BaseCallbackHandler):
+    """records the token usage of chat model responses in a RateLimiter"""
+
+    def __init__(self, limiter: RateLimiter):
+        self.limiter = limiter
+
+    def on_llm_end(self, response, **kwargs):
+        from llm_cache import get_token_usage, is_cache_hit
+        if not is_cache_hit(response):
+            self.limiter.record_tokens(
+                get_token_usage(response)["total_tokens"]
+            )
+
+
+class RateLimitedEmbeddings(Embeddings):
+    """Embeddings wrapper acquiring a request slot of `limiter` per call
+    and recording the number of tokens, estimated as characters / 4"""
+
+    def __init__(self, embedding: Embeddings, limiter: RateLimiter):
+        self.embedding = embedding
+        self.limiter = limiter
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        self.limiter.acquire()
+        self.limiter.record_tokens(sum(len(text) for text in texts) // 4)
+        return self.embedding.embed_documents(texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        self.limiter.acquire()
+        self.limiter.record_tokens(len(text) // 4)
+        return self.embedding.embed_query(text)
+
+
+# one limiter per provider, see get_rate_limiter
+_rate_limiters: dict[str, RateLimiter] = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(prefix: str = "", provider: str = None):
+    """shared rate limiter of a provider configured by environment
+    variables: <prefix>RATE_LIMIT_RPM and <prefix>RATE_LIMIT_TPM
+    (requests / tokens per minute), optionally per provider as
+    <prefix>RATE_LIMIT_RPM_<PROVIDER>, e.g. RATE_LIMIT_RPM_AZURE.
+    `prefix` is '' for chat models and 'EMBEDDING_' for embeddings,
+    `provider` defaults to <prefix>API_PROVIDER.
+    Returns None if no limit is configured."""
+    if provider is None:
+        provider = environ.get(f"{prefix}API_PROVIDER", "")
+    suffix = "_" + provider.upper().replace("-", "_")
+    limits = []
+    for name in ["RATE_LIMIT_RPM", "RATE_LIMIT_TPM"]:
+        value = environ.get(f"{prefix}{name}{suffix}") or environ.get(
+            f"{prefix}{name}"
+        )
+        limits.append(float(value) if value else None)
+    if not any(limits):
+        return None
+    key = f"{prefix.lower()}{provider}"
+    with _rate_limiters_lock:
+        if key not in _rate_limiters:
+            _rate_limiters[key] = RateLimiter(key, *limits)
+        return _rate_limiters[key]
+
+
+def get_retry_kwargs() -> dict:
+    """RetryPolicy arguments from RATE_LIMIT_MAX_RETRIES (default 5)
+    and RATE_LIMIT_MAX_DELAY_S (default 60)"""
+    return {
+        "max_retries": int(environ.get("RATE_LIMIT_MAX_RETRIES", "5")),
+        "max_delay_s": float(environ.get("RATE_LIMIT_MAX_DELAY_S", "60")),
+    }
+
+
+def get_http_client_kwargs(limiter: RateLimiter | None) -> dict:
+    """http_client / http_async_client arguments for openai based
+    clients (openai, azure, blablador, chatai, vllm). The SDK retries
+    throttled requests itself (max_retries of the model), the transport
+    only pauses `limiter` for their Retry-After and acquires a request
+    slot per SDK retry, so RATE_LIMIT_MAX_RETRIES does not apply."""
+    if limiter is None:
+        return {}
+    from openai import DefaultAsyncHttpxClient, DefaultHttpxClient
+    retry_kwargs = {**get_retry_kwargs(), "max_retries": 0}
+    return {
+        "http_client": DefaultHttpxClient(
+            transport=RetryTransport(limiter, **retry_kwargs)
+        ),
+        "http_async_client": DefaultAsyncHttpxClient(
+            transport=AsyncRetryTransport(limiter, **retry_kwargs)
+        ),
+    }
+
+
+def get_ollama_client_kwargs(limiter: RateLimiter | None) -> dict:
+    """client arguments for ChatOllama, whose client does not retry:
+    throttled requests (e.g. of a proxied ollama server) are retried
+    by the transport as configured by RATE_LIMIT_MAX_RETRIES and
+    RATE_LIMIT_MAX_DELAY_S.
+    Anthropic and gemini models have no transport hook, they only use
+    `limiter` as rate_limiter and their SDK's own retries."""
+    if limiter is None:
+        return {}
+    retry_kwargs = get_retry_kwargs()
+    return {
+        "sync_client_kwargs": {
+            "transport": RetryTransport(limiter, **retry_kwargs)
+        },
+        "async_client_kwargs": {
+            "transport": AsyncRetryTransport(limiter, **retry_kwargs)
+        },
+    }
+
+
+def get_rate_limit_stats() -> list[dict]:
+    """stats of all rate limiters created so far"""
+    with _rate_limiters_lock:
+        limiters = list(_rate_limiters.values())
+    return [limiter.get_stats() for limiter in limiters]
@@ -0,0 +1,580 @@
+import asyncio
+import copy
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+import uuid
+import warnings
+from os import environ
+from types import SimpleNamespace
+from typing import Any
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.load import dumpd, load
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+from keyword_index import tokenize
+
+# ids that change between runs (uuids, OSW ids) are masked in the request
+# keys, so responses recorded in one run are found in the next
+VOLATILE_ID_PATTERN = re.compile(
+    r"[0-9a-fA-F]{8}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{4}-?"
+    r"[0-9a-fA-F]{4}-?[0-9a-fA-F]{12}"
+)
+
+
+def get_replay_config(prefix: str = "") -> dict:
+    """replay settings from environment variables, `prefix` is '' for
+    chat models and 'EMBEDDING_' for embeddings:
+    <prefix>REPLAY_CASSETTE (recorded responses, JSON lines),
+    <prefix>REPLAY_MODE ('replay', default, or 'record' to call
+    <prefix>REPLAY_RECORD_PROVIDER and record its responses),
+    <prefix>REPLAY_LATENCY_MS and <prefix>REPLAY_LATENCY_JITTER_MS
+    (simulated latency of replayed and synthetic responses)"""
+    name = "embeddings" if prefix else "llm"
+    return {
+        "cassette_path": environ.get(
+            f"{prefix}REPLAY_CASSETTE", f".cache/replay_{name}.jsonl"
+        ),
+        "mode": environ.get(f"{prefix}REPLAY_MODE", "replay"),
+        "record_provider": environ.get(f"{prefix}REPLAY_RECORD_PROVIDER"),
+        "latency_ms": float(environ.get(f"{prefix}REPLAY_LATENCY_MS", "0")),
+        "latency_jitter_ms": float(
+            environ.get(f"{prefix}REPLAY_LATENCY_JITTER_MS", "0")
+        ),
+    }
+
+
+class Cassette:
+    """recorded responses by request key, stored as JSON lines.
+    Recording appends to the file, later lines replace earlier ones."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries: dict[str, Any] = {}
+        self.hits = 0
+        self.misses = 0
+        self.recorded = 0
+        self._lock = threading.Lock()
+        if path and os.path.isfile(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.entries[entry["key"]] = entry["value"]
+
+    def get(self, key: str):
+        with self._lock:
+            value = self.entries.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return value
+
+    def put(self, key: str, value):
+        with self._lock:
+            self.entries[key] = value
+            self.recorded += 1
+            if not self.path:
+                return
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"key": key, "value": value}) + "\n")
+
+    def get_stats(self) -> dict:
+        """size of the cassette and replay hits / misses"""
+        with self._lock:
+            return {
+                "path": self.path,
+                "size": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "recorded": self.recorded,
+            }
+
+
+# one cassette per file, shared by all models using it
+_cassettes: dict[str, Cassette] = {}
+_cassettes_lock = threading.Lock()
+
+
+def get_cassette(path: str) -> Cassette:
+    with _cassettes_lock:
+        if path not in _cassettes:
+            _cassettes[path] = Cassette(path)
+        return _cassettes[path]
+
+
+def get_replay_stats() -> list[dict]:
+    """stats of all cassettes used so far"""
+    with _cassettes_lock:
+        cassettes = list(_cassettes.values())
+    return [cassette.get_stats() for cassette in cassettes]
+
+
+def get_latency_s(key: str, latency_ms: float, jitter_ms: float) -> float:
+    """simulated latency, the jitter is derived from the request key so
+    repeated runs take the same time"""
+    jitter = random.Random(key).uniform(-jitter_ms, jitter_ms)
+    return max(0.0, latency_ms + jitter) / 1000
+
+
+def get_request_key(messages, stop, kwargs: dict) -> str:
+    """hash of the messages (without message and tool call ids) and the
+    call parameters (tools, tool choice, response format)"""
+    content = [
+        {
+            "type": message.type,
+            "content": message.content,
+            "tool_calls": [
+                {"name": call["name"], "args": call["args"]}
+                for call in getattr(message, "tool_calls", None) or []
+            ],
+        }
+        for message in messages
+    ]
+    text = json.dumps(
+        [content, stop, kwargs], sort_keys=True, default=str
+    )
+    text = VOLATILE_ID_PATTERN.sub("<id>", text)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _resolve_ref(ref: str, root: dict) -> dict:
+    node = root
+    for part in ref.lstrip("#/").split("/"):
+        if part:
+            node = node[part]
+    return node
+
+
+# dummy values of string properties with a pattern, by property name
+DUMMY_STRINGS = {
+    # SchemaResponse of schema_catalog
+    "module_path": "opensemantic.core.v1.Entity",
+}
+
+
+def get_dummy_value(schema: dict, root: dict = None, seed="", path=""):
+    """deterministic, minimal value valid against the JSON `schema`:
+    nullable values are None, objects only contain required properties,
+    arrays have their minimum length. Patterns are satisfied only if the
+    schema provides `examples` or a `default` or the property is listed
+    in DUMMY_STRINGS."""
+    root = schema if root is None else root
+    if "$ref" in schema:
+        schema = {
+            **_resolve_ref(schema["$ref"], root),
+            **{k: v for k, v in schema.items() if k != "$ref"},
+        }
+    if "const" in schema:
+        return copy.deepcopy(schema["const"])
+    if "default" in schema:
+        return copy.deepcopy(schema["default"])
+    if schema.get("enum"):
+        return copy.deepcopy(schema["enum"][0])
+    if schema.get("examples"):
+        return copy.deepcopy(schema["examples"][0])
+    for key in ["anyOf", "oneOf"]:
+        if schema.get(key):
+            options = schema[key]
+            if any(option.get("type") == "null" for option in options):
+                return None
+            return get_dummy_value(options[0], root, seed, path)
+    if schema.get("allOf"):
+        merged = {k: v for k, v in schema.items() if k != "allOf"}
+        for part in schema["allOf"]:
+            if "$ref" in part:
+                part = _resolve_ref(part["$ref"], root)
+            merged = {**part, **merged}
+        return get_dummy_value(merged, root, seed, path)
+
+    schema_type = schema.get("type")
+    if isinstance(schema_type, list):
+        if "null" in schema_type:
+            return None
+        schema_type = schema_type[0]
+    if schema_type is None:
+        if "properties" in schema:
+            schema_type = "object"
+        elif "items" in schema:
+            schema_type = "array"
+        else:
+            schema_type = "string"
+
+    if schema_type == "object":
+        properties = schema.get("properties", {})
+        return {
+            name: get_dummy_value(
+                properties.get(name, {}), root, seed, f"{path}/{name}"
+            )
+            for name in schema.get("required", [])
+        }
+    if schema_type == "array":
+        return [
+            get_dummy_value(
+                schema.get("items", {}), root, seed, f"{path}/{i}"
+            )
+            for i in range(schema.get("minItems", 0))
+        ]
+    if schema_type == "integer":
+        return int(schema.get("minimum", 0))
+    if schema_type == "number":
+        return float(schema.get("minimum", 0.0))
+    if schema_type == "boolean":
+        return False
+    if schema_type == "null":
+        return None
+    string_format = schema.get("format")
+    if string_format == "date-time":
+        return "2025-01-01T00:00:00"
+    if string_format == "date":
+        return "2025-01-01"
+    if string_format == "time":
+        return "00:00:00"
+    if string_format == "uuid":
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{seed}{path}"))
+    if string_format == "email":
+        return "replay@example.org"
+    if string_format in ("uri", "iri", "url"):
+        return "https://example.org"
+    name = path.rsplit("/", 1)[-1]
+    if name in DUMMY_STRINGS:
+        return DUMMY_STRINGS[name]
+    return "x" * schema.get("minLength", 0)
+
+
+def get_tool_schema(tool) -> tuple[str, dict]:
+    """name and parameters of a tool bound in OpenAI format"""
+    function = tool.get("function", tool)
+    return function["name"], function.get("parameters", {})
+
+
+def get_synthetic_message(key: str, messages, kwargs: dict) -> AIMessage:
+    """deterministic response for requests not found in the cassette.
+    If tool use is enforced (tool_choice, e.g. the ToolStrategy of
+    create_agent) the requested, otherwise the last bound tool is called
+    with dummy arguments, which is the structured output tool of
+    create_agent. A json_schema response format gets dummy JSON content.
+    Otherwise a short text is returned."""
+    tools = kwargs.get("tools") or []
+    tool_choice = kwargs.get("tool_choice")
+    response_format = kwargs.get("response_format")
+    tool_calls = []
+    content = ""
+    if tools and tool_choice not in (None, "auto", "none"):
+        tool = tools[-1]
+        if isinstance(tool_choice, dict):
+            name = tool_choice.get("function", tool_choice).get("name")
+            tool = next(
+                (t for t in tools if get_tool_schema(t)[0] == name), tool
+            )
+        elif isinstance(tool_choice, str) and tool_choice not in (
+            "any", "required"
+        ):
+            tool = next(
+                (t for t in tools if get_tool_schema(t)[0] == tool_choice),
+                tool,
+            )
+        name, parameters = get_tool_schema(tool)
+        tool_calls.append({
+            "name": name,
+            "args": get_dummy_value(parameters, seed=key),
+            "id": f"call_replay_{key[:16]}",
+            "type": "tool_call",
+        })
+    elif response_format:
+        if isinstance(response_format, dict):
+            schema = response_format.get("json_schema", {}).get("schema", {})
+        else:
+            schema = response_format.model_json_schema()
+        content = json.dumps(get_dummy_value(schema, seed=key))
+    else:
+        content = "This is a synthetic response of the replay provider."
+
+    input_chars = sum(len(str(message.content)) for message in messages)
+    output_chars = len(content) + len(json.dumps(
+        [call["args"] for call in tool_calls]
+    ))
+    return AIMessage(
+        content=content,
+        tool_calls=tool_calls,
+        response_metadata={"model_name": "replay", "synthetic": True},
+        usage_metadata={
+            "input_tokens": input_chars // 4,
+            "output_tokens": output_chars // 4,
+            "total_tokens": (input_chars + output_chars) // 4,
+        },
+    )
+
+
+def _load_message(value) -> AIMessage:
+    with warnings.catch_warnings():
+        # langchain_core.load.load is marked as beta
+        warnings.simplefilter("ignore")
+        return load(value, allowed_objects="core")
+
+
+class ReplayChatModel(BaseChatModel):
+    """offline chat model answering from a cassette of recorded
+    responses, with deterministic synthetic responses for unknown
+    requests. In 'record' mode the requests are sent to `recorder`
+    and its responses are appended to the cassette."""
+
+    cassette_path: str = ""
+    mode: str = "replay"
+    model_name: str = "replay"
+    latency_ms: float = 0.0
+    latency_jitter_ms: float = 0.0
+    recorder: BaseChatModel | None = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "replay"
+
+    @property
+    def _identifying_params(self) -> dict:
+        return {"model_name": self.model_name}
+
+    @property
+    def cassette(self) -> Cassette:
+        return get_cassette(self.cassette_path)
+
+    def bind_tools(self, tools, *, tool_choice=None, **kwargs):
+        return self.bind(
+            tools=[convert_to_openai_tool(tool) for tool in tools],
+            tool_choice=tool_choice,
+            **kwargs,
+        )
+
+    def _get_recorder(self, kwargs: dict):
+        """the recorder with the tools and response format of the call"""
+        kwargs = dict(kwargs)
+        tools = kwargs.pop("tools", None)
+        tool_choice = kwargs.pop("tool_choice", None)
+        if tools:
+            return self.recorder.bind_tools(
+                tools, tool_choice=tool_choice, **kwargs
+            )
+        if kwargs:
+            return self.recorder.bind(**kwargs)
+        return self.recorder
+
+    def _replay(self, key: str, messages, kwargs: dict) -> AIMessage:
+        value = self.cassette.get(key)
+        if value is not None:
+            return _load_message(value)
+        return get_synthetic_message(key, messages, kwargs)
+
+    def _record(self, key: str, message: AIMessage) -> ChatResult:
+        self.cassette.put(key, dumpd(message))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        key = get_request_key(messages, stop, kwargs)
+        if self.mode == "record":
+            message = self._get_recorder(kwargs).invoke(messages, stop=stop)
+            return self._record(key, message)
+        message = self._replay(key, messages, kwargs)
+        time.sleep(get_latency_s(
+            key, self.latency_ms, self.latency_jitter_ms
+        ))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(
+        self, messages, stop=None, run_manager=None, **kwargs
+    ):
+        key = get_request_key(messages, stop, kwargs)
+        if self.mode == "record":
+            message = await self._get_recorder(kwargs).ainvoke(
+                messages, stop=stop
+            )
+            return self._record(key, message)
+        message = self._replay(key, messages, kwargs)
+        await asyncio.sleep(get_latency_s(
+            key, self.latency_ms, self.latency_jitter_ms
+        ))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+def get_hash_embedding(text: str, dimensions: int) -> list[float]:
+    """deterministic bag of words embedding: each token is hashed to a
+    dimension and sign, so texts sharing tokens get similar vectors"""
+    vector = [0.0] * dimensions
+    for token in tokenize(text) or [text]:
+        digest = hashlib.sha256(token.encode("utf-8")).digest()
+        index = int.from_bytes(digest[:4], "little") % dimensions
+        vector[index] += 1.0 if digest[4] & 1 else -1.0
+    norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+    return [value / norm for value in vector]
+
+
+class ReplayEmbeddings(Embeddings):
+    """offline embeddings answering from a cassette of recorded vectors,
+    with hash embeddings (see get_hash_embedding) for unknown texts.
+    In 'record' mode the texts are embedded by `recorder` and the
+    vectors are appended to the cassette."""
+
+    def __init__(
+        self,
+        cassette_path: str = "",
+        mode: str = "replay",
+        recorder: Embeddings = None,
+        dimensions: int = None,
+        latency_ms: float = 0.0,
+        latency_jitter_ms: float = 0.0,
+    ):
+        self.cassette = get_cassette(cassette_path)
+        self.mode = mode
+        self.recorder = recorder
+        self.latency_ms = latency_ms
+        self.latency_jitter_ms = latency_jitter_ms
+        if dimensions is None:
+            # synthetic vectors have the size of the recorded ones
+            recorded = next(iter(self.cassette.entries.values()), None)
+            dimensions = len(recorded) if recorded else 256
+        self.dimensions = dimensions
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        keys = [self._key(text) for text in texts]
+        if self.mode == "record":
+            vectors = self.recorder.embed_documents(texts)
+            for key, vector in zip(keys, vectors):
+                self.cassette.put(key, vector)
+            return vectors
+        vectors = [
+            self.cassette.get(key)
+            or get_hash_embedding(text, self.dimensions)
+            for key, text in zip(keys, texts)
+        ]
+        time.sleep(get_latency_s(
+            "".join(keys), self.latency_ms, self.latency_jitter_ms
+        ))
+        return vectors
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed_documents([text])[0]
+
+
+class ReplayPage:
+    """the parts of an osw WtPage used by osl_init"""
+
+    def __init__(self, title: str, slots: dict, domain: str):
+        self.title = title
+        self._slots = slots
+        self.domain = domain
+
+    def get_slot_content(self, slot: str):
+        return self._slots.get(slot)
+
+    def get_url(self) -> str:
+        return f"https://{self.domain}/wiki/{self.title}"
+
+
+class ReplaySite:
+    """the parts of the osw WtSite (and its mwclient site `mw_site`)
+    used by osl_init, answered from pages held in memory"""
+
+    def __init__(self, pages: dict[str, dict], domain: str):
+        self.pages = pages
+        self.revisions = {title: 1 for title in pages}
+        self.domain = domain
+        self.mw_site = self
+
+    def api(self, action: str, **kwargs) -> dict:
+        if action == "ask":
+            # [[<namespace>:+]]...|limit=<n>|offset=<n>, see get_all_pages
+            query = kwargs["query"]
+            namespace = re.match(r"\[\[:?([^:\]]+):\+\]\]", query).group(1)
+            options = dict(re.findall(r"\|(\w+)=(\d+)", query))
+            limit = int(options.get("limit", 50))
+            offset = int(options.get("offset", 0))
+            titles = [
+                title for title in self.pages
+                if title.startswith(namespace + ":")
+            ]
+            result = {"query": {"results": {
+                title: {} for title in titles[offset:offset + limit]
+            }}}
+            if offset + limit < len(titles):
+                result["query-continue-offset"] = offset + limit
+            return result
+        if action == "query":
+            pages = {}
+            for i, title in enumerate(kwargs["titles"].split("|")):
+                if title in self.pages:
+                    pages[str(i)] = {
+                        "title": title,
+                        "lastrevid": self.revisions[title],
+                        "touched": None,
+                    }
+                else:
+                    pages[str(-i - 1)] = {"title": title, "missing": ""}
+            return {"query": {"pages": pages}}
+        raise NotImplementedError(f"offline OSL api action '{action}'")
+
+    def get_page(self, param):
+        return SimpleNamespace(pages=[
+            ReplayPage(title, self.pages[title], self.domain)
+            for title in param.titles
+        ])
+
+    def semantic_search(self, query: str) -> list[str]:
+        """[[Category:<id>]] and [[HasLabel::~*<text>*]] queries"""
+        category = re.fullmatch(r"\[\[Category:(.+)\]\]", query)
+        label = re.fullmatch(r"\[\[HasLabel::~\*(.*)\*\]\]", query)
+        titles = []
+        for title, slots in self.pages.items():
+            jsondata = slots.get("jsondata") or {}
+            if category and (
+                "Category:" + category.group(1) in jsondata.get("type", [])
+            ):
+                titles.append(title)
+            if label and any(
+                label.group(1).lower() in lb.get("text", "").lower()
+                for lb in jsondata.get("label", [])
+            ):
+                titles.append(title)
+        return titles
+
+
+class ReplayOslClient:
+    """offline stand-in for OswExpress serving the pages of a JSON file
+    ({title: slots}). Stored entities are kept in memory only."""
+
+    def __init__(self, path: str = "", domain: str = "llm4eln.semos.dev"):
+        pages = {}
+        if path and os.path.isfile(path):
+            with open(path, encoding="utf-8") as f:
+                pages = json.load(f)
+        self.site = ReplaySite(pages, domain)
+
+    def load_entity(self, param):
+        return [
+            param.model_to_use(**self.site.pages[title]["jsondata"])
+            for title in param.titles
+            if title in self.site.pages
+        ]
+
+    def store_entity(self, param):
+        entities = getattr(param, "entities", None) or [param]
+        for entity in entities:
+            title = entity.get_iri()
+            self.site.pages[title] = {
+                "jsondata": json.loads(entity.json(exclude_none=True))
+            }
+            self.site.revisions[title] = self.site.revisions.get(title, 0) + 1
+        print(f"Stored {len(entities)} entities (offline, not persisted)")
@@ -0,0 +1,234 @@
+import functools
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from os import environ
+
+from dotenv import load_dotenv
+
+from util import (
+    filter_properties, get_schema_budget, is_openai_model, modify_schema
+)
+
+load_dotenv()
+
+
+def _immutable(self, *args, **kwargs):
+    raise TypeError(
+        f"{type(self).__name__} is a shared cached schema and cannot be "
+        "modified, use copy.deepcopy() or thaw() for a mutable copy"
+    )
+
+
+class FrozenDict(dict):
+    """read-only dict of a cached schema. Still a dict for isinstance
+    checks and JSON serialization, copy.deepcopy returns a mutable copy"""
+
+    __slots__ = ()
+    __setitem__ = __delitem__ = __ior__ = _immutable
+    clear = pop = popitem = setdefault = update = _immutable
+
+    def __copy__(self):
+        return dict(self)
+
+    def __deepcopy__(self, memo):
+        return thaw(self)
+
+    def __reduce__(self):
+        return FrozenDict, (dict(self),)
+
+
+class FrozenList(list):
+    """read-only list of a cached schema, see FrozenDict"""
+
+    __slots__ = ()
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _immutable
+    append = extend = insert = pop = remove = clear = _immutable
+    sort = reverse = _immutable
+
+    def __copy__(self):
+        return list(self)
+
+    def __deepcopy__(self, memo):
+        return thaw(self)
+
+    def __reduce__(self):
+        return FrozenList, (list(self),)
+
+
+def freeze(obj):
+    """read-only version of a JSON value"""
+    if isinstance(obj, dict):
+        return FrozenDict((key, freeze(value)) for key, value in obj.items())
+    if isinstance(obj, list):
+        return FrozenList(freeze(item) for item in obj)
+    return obj
+
+
+def thaw(obj):
+    """mutable (plain dict / list) copy of a JSON value"""
+    if isinstance(obj, dict):
+        return {key: thaw(value) for key, value in obj.items()}
+    if isinstance(obj, list):
+        return [thaw(item) for item in obj]
+    return obj
+
+
+@functools.cache
+def get_opensemantic_version() -> str:
+    """versions of the loaded opensemantic packages (and oold, which
+    exports the schemas), the exported schema of a class also contains
+    the schemas of other packages"""
+    import sys
+    from importlib.metadata import PackageNotFoundError, version
+    names = {"oold", "opensemantic"} | {
+        ".".join(name.split(".")[:2]) for name in list(sys.modules)
+        if name.startswith("opensemantic.")
+    }
+    versions = []
+    for name in sorted(names):
+        try:
+            versions.append(f"{name} {version(name)}")
+        except PackageNotFoundError:
+            pass  # namespace or module without distribution, e.g. .v1
+    return ", ".join(versions)
+
+
+@functools.cache
+def get_processing_version() -> str:
+    """hash of util.py, processed schemas are invalidated when the
+    schema processing changes"""
+    import util
+    with open(util.__file__, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()[:16]
+
+
+class SchemaCache:
+    """processed (export_schema + modify_schema) JSON schemas of data
+    model classes, in memory and optionally in a SQLite file.
+    Entries are keyed by the class, the model family flag, the
+    versions of the opensemantic packages and of the schema processing,
+    the schema budget and the property filter, if any.
+    Returned schemas are shared read-only views (FrozenDict)."""
+
+    def __init__(self, path: str = ""):
+        self.path = path
+        self.entries: dict[tuple, FrozenDict] = {}
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        if path:
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS schemas ("
+                "key TEXT PRIMARY KEY, schema TEXT)"
+            )
+            self._conn.commit()
+
+    def _disk_key(self, key: tuple) -> str:
+        return hashlib.sha256(
+            json.dumps(key).encode("utf-8")
+        ).hexdigest()
+
+    def _load(self, key: tuple):
+        if self._conn is None:
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT schema FROM schemas WHERE key = ?",
+                (self._disk_key(key),),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _store(self, key: tuple, schema: dict):
+        if self._conn is None:
+            return
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO schemas (key, schema) VALUES (?, ?)",
+                (self._disk_key(key), json.dumps(schema)),
+            )
+            self._conn.commit()
+
+    def get_key(self, cls, properties=None) -> tuple:
+        key = (
+            f"{cls.__module__}.{cls.__qualname__}",
+            "openai" if is_openai_model() else "default",
+            get_opensemantic_version(),
+            get_processing_version(),
+            tuple(sorted(get_schema_budget().items())),
+        )
+        if properties is not None:
+            # the filtered schema does not depend on their order
+            key += (tuple(sorted(set(properties))),)
+        return key
+
+    def get(self, cls, properties=None, report=None) -> FrozenDict:
+        """processed schema of `cls`, computed on the first request.
+        If `properties` are given, the schema only has these (and the
+        required) properties, see filter_properties. `report` is updated
+        with the size and expansion counters of modify_schema if the
+        schema is processed by this call."""
+        key = self.get_key(cls, properties)
+        with self._lock:
+            schema = self.entries.get(key)
+            if schema is not None:
+                self.hits += 1
+                return schema
+        data = self._load(key)
+        with self._lock:
+            if data is not None:
+                self.disk_hits += 1
+            else:
+                self.misses += 1
+        if data is None:
+            # export_schema() returns the same (cached) dict on every
+            # call, filter_properties and modify_schema do not change it
+            schema = cls.export_schema()
+            if properties is not None:
+                schema = filter_properties(schema, properties)
+            data = modify_schema(schema, report=report)
+            self._store(key, data)
+        schema = freeze(data)
+        with self._lock:
+            # keep the first one if another thread was faster
+            return self.entries.setdefault(key, schema)
+
+    def get_stats(self) -> dict:
+        """memory / disk hits and misses (schemas processed)"""
+        with self._lock:
+            return {
+                "path": self.path,
+                "size": len(self.entries),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+            }
+
+
+@functools.cache
+def get_schema_cache() -> SchemaCache:
+    """schema cache configured by SCHEMA_CACHE_PATH
+    (SQLite file, in memory only if empty)"""
+    return SchemaCache(
+        environ.get("SCHEMA_CACHE_PATH", ".cache/schemas.sqlite")
+    )
+
+
+def get_processed_schema(cls) -> FrozenDict:
+    """OpenAI conform schema of a data model class
+    (export_schema + modify_schema), cached, read-only"""
+    return get_schema_cache().get(cls)
+
+
+@functools.cache
+def get_exported_schema(cls) -> FrozenDict:
+    """unmodified export_schema() of a data model class,
+    cached in memory, read-only"""
+    return freeze(cls.export_schema())
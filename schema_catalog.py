@@ -1,92 +1,265 @@
-from pydantic import BaseModel, Field
-from langchain.agents import create_agent
-from langchain.agents.structured_output import ProviderStrategy, ToolStrategy
-from llm_init import get_llm, model_supports_structured_output
-import opensemantic.core.v1._model
-import opensemantic.base.v1._model
-import opensemantic.lab.v1._model
-
-# load the source code of the opensemantic.core.v1 module
+import functools
 import inspect
-source_code = "##### opensemantic.core.v1 #####\n\n"
-source_code += inspect.getsource(opensemantic.core.v1._model)
-source_code += "\n\n##### opensemantic.base.v1 #####\n\n"
-source_code += inspect.getsource(opensemantic.base.v1._model)
-source_code += "\n\n##### opensemantic.lab.v1 #####\n\n"
-source_code += inspect.getsource(opensemantic.lab.v1._model)
+import re
+from os import environ
+from dotenv import load_dotenv
+from pydantic import BaseModel, Field, ValidationError
 
+# opensemantic and langchain are imported on first use, the module level
+# `source_code` and `source_markdown` are built on first access,
+# see __getattr__
 
-def get_data_schema_inventory_markdown(
-    include_properties=True, include_property_def=True
-) -> str:
-    """returns a markdown list of available data models in opensemantic"""
+load_dotenv()
 
-    root_class = opensemantic.core.v1._model.Entity
 
-    inventory = "# Available Data Models\n\n"
-    for module in [
+def get_schema_modules() -> list:
+    """the opensemantic model modules offered to the llm"""
+    import opensemantic.core.v1._model
+    import opensemantic.base.v1._model
+    import opensemantic.lab.v1._model
+    return [
         opensemantic.core.v1._model,
         opensemantic.base.v1._model,
         opensemantic.lab.v1._model
-    ]:
+    ]
+
+
+@functools.cache
+def get_source_code() -> str:
+    """the source code of the opensemantic model modules"""
+    source_code = ""
+    for module in get_schema_modules():
+        module_name = module.__name__.replace('._model', '')
+        if source_code:
+            source_code += "\n\n"
+        source_code += f"##### {module_name} #####\n\n"
+        source_code += inspect.getsource(module)
+    return source_code
+
+
+def get_schema_classes() -> dict[str, type]:
+    """the data model classes by module path,
+    e.g. 'opensemantic.core.v1.Entity'"""
+    modules = get_schema_modules()
+    root_class = modules[0].Entity
+    classes = {}
+    for module in modules:
+        module_name = module.__name__.replace('._model', '')
         for name, obj in inspect.getmembers(module):
-            obj: type[opensemantic.core.v1._model.Entity]
             if inspect.isclass(obj) and issubclass(obj, root_class):
-                doc = obj.__doc__ or ""
-                module_name = module.__name__.replace('._model', '')
-                inventory += f"## {module_name}.{name}\n\n{doc}\n\n"
-                for bc in obj.__bases__:
-                    bc_path = f"{bc.__module__}.{bc.__name__}"
-                    bc_path = bc_path.replace("._model", "")
-                    inventory += f"- Inherits from: `{bc_path}`\n"
-                if not include_properties:
-                    inventory += "\n"
-                    continue
-                fields = getattr(obj, "__fields__", {})
-                if fields:
-                    inventory += "### Fields:\n\n"
-                    for field_name, field_info in fields.items():
-                        field_title = field_info.field_info.title or ""
-                        field_desc = field_info.field_info.description or ""
-                        data_type = str(field_info.annotation)
-                        data_type = data_type.replace("typing.", "")
-                        data_type = data_type.replace("._model", "")
-                        # assembly <name>: <type> | <title> - <description>
-                        inventory += f"- **{field_name}**: *{data_type}*"
-                        if include_property_def:
-                            if field_title:
-                                inventory += f" - {field_title}"
-                            if field_desc:
-                                inventory += f" - {field_desc}"
-                        inventory += "\n"
-                    inventory += "\n"
-    return inventory
-
-
-source_markdown = get_data_schema_inventory_markdown()
+                classes[f"{module_name}.{name}"] = obj
+    return classes
+
+
+def get_inventory_entry(
+    module_path: str, obj: type, include_properties, include_property_def
+) -> str:
+    """markdown section describing the data model class `obj`"""
+    doc = obj.__doc__ or ""
+    entry = f"## {module_path}\n\n{doc}\n\n"
+    for bc in obj.__bases__:
+        bc_path = f"{bc.__module__}.{bc.__name__}"
+        bc_path = bc_path.replace("._model", "")
+        entry += f"- Inherits from: `{bc_path}`\n"
+    if not include_properties:
+        return entry + "\n"
+    fields = getattr(obj, "__fields__", {})
+    if fields:
+        entry += "### Fields:\n\n"
+        for field_name, field_info in fields.items():
+            field_title = field_info.field_info.title or ""
+            field_desc = field_info.field_info.description or ""
+            data_type = str(field_info.annotation)
+            data_type = data_type.replace("typing.", "")
+            data_type = data_type.replace("._model", "")
+            # assembly <name>: <type> | <title> - <description>
+            entry += f"- **{field_name}**: *{data_type}*"
+            if include_property_def:
+                if field_title:
+                    entry += f" - {field_title}"
+                if field_desc:
+                    entry += f" - {field_desc}"
+            entry += "\n"
+        entry += "\n"
+    return entry
+
+
+@functools.cache
+def get_inventory_entries(
+    include_properties=True, include_property_def=True
+) -> dict[str, str]:
+    """markdown sections of all data model classes by module path"""
+    return {
+        module_path: get_inventory_entry(
+            module_path, obj, include_properties, include_property_def
+        )
+        for module_path, obj in get_schema_classes().items()
+    }
+
+
+def get_data_schema_inventory_markdown(
+    include_properties=True, include_property_def=True, module_paths=None
+) -> str:
+    """returns a markdown list of available data models in opensemantic,
+    restricted to `module_paths` if given"""
+    entries = get_inventory_entries(include_properties, include_property_def)
+    if module_paths is not None:
+        entries = {path: entries[path] for path in module_paths}
+    return "# Available Data Models\n\n" + "".join(entries.values())
+
+
+# words of the task prompts that do not help to tell data models apart
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "create", "describe",
+    "entity", "entry", "for", "i", "id", "in", "is", "it", "my", "name",
+    "of", "on", "or", "schema", "that", "the", "this", "to", "want", "with",
+}
+
+
+def split_identifier(name: str) -> str:
+    """'LaboratoryProcess' -> 'Laboratory Process',
+    'start_date_time' -> 'start date time'"""
+    name = re.sub(r"([a-z0-9])([A-Z])", r"\1 \2", name)
+    return name.replace("_", " ")
+
+
+def get_index_text(obj: type) -> str:
+    """text indexed for a data model class: its name, category ids,
+    docstring, base classes and the names and titles of the fields it
+    adds to its base classes"""
+    fields = getattr(obj, "__fields__", {})
+    inherited = set()
+    for bc in obj.__bases__:
+        inherited.update(getattr(bc, "__fields__", {}))
+    # the class name is indexed as one word and split into its words,
+    # repeated to rank classes named in the task above classes that only
+    # have a field of that name
+    lines = [obj.__name__, split_identifier(obj.__name__)] * 3
+    if "type" in fields and isinstance(fields["type"].default, list):
+        lines.extend(fields["type"].default)
+    lines.append(obj.__doc__ or "")
+    lines.extend(split_identifier(bc.__name__) for bc in obj.__bases__)
+    for field_name, field_info in fields.items():
+        if field_name in inherited:
+            continue
+        lines.append(split_identifier(field_name))
+        lines.append(field_info.field_info.title or "")
+    return "\n".join(lines)
+
+
+@functools.cache
+def get_schema_index():
+    """BM25 index over all data model classes, keyed by module path.
+    Classes re-exported by other modules are indexed once, under the
+    module that defines them."""
+    from keyword_index import BM25Index
+    index = BM25Index()
+    for module_path, obj in get_schema_classes().items():
+        module_name = module_path.rsplit(".", 1)[0]
+        if obj.__module__.replace("._model", "") == module_name:
+            index.add(module_path, get_index_text(obj))
+    return index
+
+
+@functools.cache
+def get_general_schemas() -> list[str]:
+    """indexed module paths ordered by the number of subclasses,
+    most general data models (Entity, Item, ..) first"""
+    classes = get_schema_classes()
+    index = get_schema_index()
+    indexed = [path for path in classes if path in index]
+    return sorted(indexed, key=lambda path: -sum(
+        issubclass(classes[other], classes[path]) for other in indexed
+    ))
+
+
+def shortlist_schemas(description: str, top_n: int = None) -> list[str]:
+    """module paths of the `top_n` data models best matching the
+    description (SCHEMA_SHORTLIST_SIZE, default 20), most relevant first.
+    Fewer matches are completed with the most general data models.
+    Returns all data models if the shortlist is disabled (0)."""
+    if top_n is None:
+        top_n = int(environ.get("SCHEMA_SHORTLIST_SIZE", "20"))
+    classes = get_schema_classes()
+    if top_n <= 0 or top_n >= len(classes):
+        return list(classes)
+    from keyword_index import TOKEN_PATTERN
+    query = " ".join(
+        token for token in TOKEN_PATTERN.findall(
+            description + "\n" + split_identifier(description)
+        ) if token.lower() not in STOPWORDS
+    )
+    shortlist = [
+        module_path for module_path, _
+        in get_schema_index().search(query, top_n)
+    ]
+    for module_path in get_general_schemas():
+        if len(shortlist) >= top_n:
+            break
+        if module_path not in shortlist:
+            shortlist.append(module_path)
+    return shortlist
+
+
+@functools.cache
+def get_class_source(module_path: str) -> str:
+    return inspect.getsource(get_schema_classes()[module_path])
+
+
+def get_schema_source_code(module_paths) -> str:
+    """the source code of the given data model classes"""
+    return "\n\n".join(
+        f"##### {module_path} #####\n\n{get_class_source(module_path)}"
+        for module_path in module_paths
+    )
+
+
+def __getattr__(name):
+    if name == "source_code":
+        return get_source_code()
+    if name == "source_markdown":
+        return get_data_schema_inventory_markdown()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# the system prompts contain no task specific data, so they form a stable
+# prefix that providers can cache. The shortlisted data models follow in
+# the user message.
+SUGGEST_SCHEMA_SYSTEM_PROMPT = (
+    "You are a helpful assistant called 'LLM4ELN'."
+    "Your purpose is to help users of electronic lab notebook "
+    "to find the most suitable data model for their "
+    "documentation task. "
+    "If the existing data models are not sufficient, "
+    "extend them by adding a new class."
+    "The source code of data models you can choose from is attached "
+    "to the task."
+)
 
 
 def suggest_existing_or_new_schema(prompt: str) -> str:
     """asks the llm what is the most suitable data model for the given task"""
 
+    module_paths = shortlist_schemas(prompt)
+    if len(module_paths) == len(get_schema_classes()):
+        source_code = get_source_code()
+    else:
+        source_code = get_schema_source_code(module_paths)
     messages = [
         (
-            "system",
-            "You are a helpful assistant called 'LLM4ELN'."
-            "Your purpose is to help users of electronic lab notebook "
-            "to find the most suitable data model for their "
-            "documentation task. "
-            "If the existing data models are not sufficient, "
-            "extend them by adding a new class."
-            "Attached is the source code of data models you can choose from:"
-            "\n\n" + source_code
+            "system", SUGGEST_SCHEMA_SYSTEM_PROMPT
         ),
         (
-            "human", prompt
+            "human",
+            "Source code of the data models:\n\n" + source_code
+            + "\n\nTask:\n\n" + prompt
         ),
     ]
+    from llm_cache import llm_cache_step
+    from llm_init import get_llm
     llm = get_llm()
-    ai_reply = llm.invoke(messages)
+    with llm_cache_step("suggest_existing_or_new_schema"):
+        ai_reply = llm.invoke(messages)
     if isinstance(ai_reply, str):
         ai_msg = ai_reply
     else:
@@ -94,48 +267,30 @@ def suggest_existing_or_new_schema(prompt: str) -> str:
     return ai_msg
 
 
-def lookup_exact_schema(prompt: str) -> str:
-    """ask the llm what is the most suitable data model for the given task
+class SchemaResponse(BaseModel):
+    # property with regex
+    module_path: str = Field(
+        ...,
+        pattern=(
+            r"^opensemantic\.[a-zA-Z_][a-zA-Z0-9_]*"
+            r"(\.[a-zA-Z_][a-zA-Z0-9_]*)*$"
+        ),
+    )
+    """Full import path to the schema class
+    (e.g., 'opensemantic.core.v1.Entity')"""
+    explanation: str
+    """Brief explanation of why this schema was chosen"""
 
-    Returns the full module path (e.g., 'opensemantic.core.v1.Entity')
-    """
 
-    class SchemaResponse(BaseModel):
-        # property with regex
-        module_path: str = Field(
-            ...,
-            pattern=(
-                r"^opensemantic\.[a-zA-Z_][a-zA-Z0-9_]*"
-                r"(\.[a-zA-Z_][a-zA-Z0-9_]*)*$"
-            )
-        )
-        """Full import path to the schema class
-        (e.g., 'opensemantic.core.v1.Entity')"""
-        explanation: str
-        """Brief explanation of why this schema was chosen"""
-
-    system_prompt = (
-        "You are a helpful assistant called 'LLM4ELN'. "
-        "Your purpose is to help users of electronic lab notebooks "
-        "to find the most suitable data model for their "
-        "documentation task. "
-        "Analyze the user's request and select the most "
-        "appropriate data "
-        "model from the available schemas. "
-        "Reply only with a JSON object containing the fields "
-        "`module_path` and `explanation`. "
-        "Return the exact full import path `module_path` to the "
-        "Python class, "
-        "e.g., 'opensemantic.<submodule>.v1.<classname>'. "
-        "Also provide a brief `explanation` of why this schema was "
-        "chosen. "
-        "Available data models:\n\n"
-        + get_data_schema_inventory_markdown(False, False)
+def get_schema_lookup_agent():
+    """create the agent that selects the data model for a task"""
+    from langchain.agents import create_agent
+    from langchain.agents.structured_output import (
+        ProviderStrategy,
+        ToolStrategy,
     )
-
-    llm = get_llm()
-    if hasattr(llm, "reasoning_effort"):
-        llm.reasoning_effort = "high"
+    from llm_init import get_llm, model_supports_structured_output
+    llm = get_llm(reasoning_effort="high")
     if model_supports_structured_output(llm):
         # Model supports provider strategy - use it
         effective_response_format = ProviderStrategy(
@@ -148,24 +303,134 @@ def lookup_exact_schema(prompt: str) -> str:
             schema=SchemaResponse
         )
 
-    agent = create_agent(
+    return create_agent(
         model=llm,
         response_format=effective_response_format,
     )
 
-    response = agent.invoke({
+
+SCHEMA_LOOKUP_SYSTEM_PROMPT = (
+    "You are a helpful assistant called 'LLM4ELN'. "
+    "Your purpose is to help users of electronic lab notebooks "
+    "to find the most suitable data model for their "
+    "documentation task. "
+    "Analyze the user's request and select the most "
+    "appropriate data "
+    "model from the available schemas listed with the request. "
+    "Reply only with a JSON object containing the fields "
+    "`module_path` and `explanation`. "
+    "Return the exact full import path `module_path` to the "
+    "Python class, "
+    "e.g., 'opensemantic.<submodule>.v1.<classname>'. "
+    "Also provide a brief `explanation` of why this schema was "
+    "chosen."
+)
+
+
+# repeated lookups if the agent does not return one of the data models
+SCHEMA_LOOKUP_RETRIES = 1
+
+
+def get_schema_lookup_input(prompt: str, module_paths=None) -> dict:
+    """build the schema lookup agent input for a task description,
+    listing the shortlisted data models only"""
+    if module_paths is None:
+        module_paths = shortlist_schemas(prompt)
+    from tracing import set_span_attributes
+    set_span_attributes(schema_candidates=len(module_paths))
+    inventory = get_data_schema_inventory_markdown(False, False, module_paths)
+    return {
         "messages": [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": prompt}
+            {"role": "system", "content": SCHEMA_LOOKUP_SYSTEM_PROMPT},
+            {"role": "user", "content": inventory + "\n# Request\n\n" + prompt}
         ]
-    })
+    }
+
 
-    result = response["structured_response"]
-    result = SchemaResponse.model_validate(result)
+def get_schema_lookup_result(response, module_paths) -> str | None:
+    """return the module path chosen by the schema lookup agent,
+    None if it is neither shortlisted in `module_paths` nor a known
+    data model"""
+    try:
+        result = SchemaResponse.model_validate(
+            response.get("structured_response")
+        )
+    except ValidationError as e:
+        print(f"Invalid schema lookup response: {e}")
+        return None
+    if (
+        result.module_path not in module_paths
+        and result.module_path not in get_schema_classes()
+    ):
+        print(f"Schema lookup returned unknown data model "
+              f"{result.module_path}")
+        return None
     print(f"Schema lookup: {result.module_path} - {result.explanation}")
     return result.module_path
 
 
+def get_schema_lookup_retry_input(response) -> dict:
+    """agent input repeating the lookup after an unknown data model"""
+    return {
+        "messages": [
+            *response.get("messages", []),
+            {
+                "role": "user",
+                "content": (
+                    "This is not one of the available data models. "
+                    "Reply with the exact `module_path` of one of the "
+                    "data models listed with the request."
+                ),
+            },
+        ]
+    }
+
+
+def get_fallback_schema(prompt: str) -> str:
+    """the data model best matching the task by keywords, used if the
+    agent does not return a known data model"""
+    module_path = shortlist_schemas(prompt, top_n=1)[0]
+    print(f"Schema lookup falls back to {module_path}")
+    from tracing import set_span_attributes
+    set_span_attributes(schema_fallback=module_path)
+    return module_path
+
+
+def lookup_exact_schema(prompt: str) -> str:
+    """ask the llm what is the most suitable data model for the given task
+
+    Returns the full module path (e.g., 'opensemantic.core.v1.Entity')
+    """
+    from llm_cache import llm_cache_step
+    agent = get_schema_lookup_agent()
+    module_paths = shortlist_schemas(prompt)
+    agent_input = get_schema_lookup_input(prompt, module_paths)
+    for _ in range(SCHEMA_LOOKUP_RETRIES + 1):
+        with llm_cache_step("lookup_exact_schema"):
+            response = agent.invoke(agent_input)
+        module_path = get_schema_lookup_result(response, module_paths)
+        if module_path is not None:
+            return module_path
+        agent_input = get_schema_lookup_retry_input(response)
+    return get_fallback_schema(prompt)
+
+
+async def alookup_exact_schema(prompt: str) -> str:
+    """async variant of lookup_exact_schema"""
+    from llm_cache import llm_cache_step
+    agent = get_schema_lookup_agent()
+    module_paths = shortlist_schemas(prompt)
+    agent_input = get_schema_lookup_input(prompt, module_paths)
+    for _ in range(SCHEMA_LOOKUP_RETRIES + 1):
+        with llm_cache_step("lookup_exact_schema"):
+            response = await agent.ainvoke(agent_input)
+        module_path = get_schema_lookup_result(response, module_paths)
+        if module_path is not None:
+            return module_path
+        agent_input = get_schema_lookup_retry_input(response)
+    return get_fallback_schema(prompt)
+
+
 if __name__ == "__main__":
 
     print("Data Schema Inventory:\n")
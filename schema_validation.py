@@ -0,0 +1,338 @@
+import json
+import re
+import threading
+import time
+
+from tracing import add_to_span
+
+# checks of the JSON schema types
+TYPE_CHECKS = {
+    "null": lambda value: value is None,
+    "boolean": lambda value: isinstance(value, bool),
+    "string": lambda value: isinstance(value, str),
+    "integer": lambda value: (
+        isinstance(value, int) and not isinstance(value, bool)
+        or isinstance(value, float) and value.is_integer()
+    ),
+    "number": lambda value: (
+        isinstance(value, (int, float)) and not isinstance(value, bool)
+    ),
+    "object": lambda value: isinstance(value, dict),
+    "array": lambda value: isinstance(value, list),
+}
+
+
+def get_type_name(value) -> str:
+    """JSON type name of a value for error messages"""
+    for name in ["null", "boolean", "integer", "number", "string",
+                 "object", "array"]:
+        if TYPE_CHECKS[name](value):
+            return name
+    return type(value).__name__
+
+
+def get_path_suffix(key: str) -> str:
+    """JSON path suffix of an object key, appended to the parent path"""
+    if re.fullmatch(r"[A-Za-z_][A-Za-z0-9_]*", key):
+        return f".{key}"
+    return f"[{json.dumps(key)}]"
+
+
+class SchemaValidator:
+    """JSON schema compiled into nested validation functions.
+    Supports the keywords of the processed data model schemas (type,
+    enum, const, properties, required, additionalProperties, items,
+    min/maxItems, min/maxLength, pattern, minimum / maximum, anyOf,
+    oneOf, allOf and $refs within the schema), others are ignored.
+    `validate` returns all violations as (JSON path, message) tuples.
+    With `check_required=False` only the properties present are checked,
+    e.g. responses without their null and empty values."""
+
+    def __init__(self, schema: dict, check_required: bool = True):
+        self.root = schema
+        self.check_required = check_required
+        # compiled $ref targets, compiled on first use (cycles)
+        self.refs = {}
+        self._validate = self.compile(schema)
+
+    def validate(self, instance) -> list[tuple[str, str]]:
+        errors = []
+        self._validate(instance, "$", errors)
+        return errors
+
+    def is_valid(self, instance) -> bool:
+        return not self.validate(instance)
+
+    def resolve(self, ref: str) -> dict:
+        if ref == "#":
+            return self.root
+        if not ref.startswith("#/"):
+            raise ValueError(f"Unsupported $ref {ref}")
+        schema = self.root
+        for part in ref[2:].split("/"):
+            schema = schema[part.replace("~1", "/").replace("~0", "~")]
+        return schema
+
+    def compile_ref(self, ref: str):
+        def validate_ref(value, path, errors):
+            if ref not in self.refs:
+                self.refs[ref] = self.compile(self.resolve(ref))
+            self.refs[ref](value, path, errors)
+        return validate_ref
+
+    def compile(self, schema):
+        """validation function (value, path, errors) of `schema`"""
+        if schema is True or schema == {}:
+            return lambda value, path, errors: None
+        if schema is False:
+            return lambda value, path, errors: errors.append(
+                (path, "no value allowed")
+            )
+        checks = []
+
+        if "$ref" in schema:
+            checks.append(self.compile_ref(schema["$ref"]))
+
+        if "type" in schema:
+            types = schema["type"]
+            types = [types] if isinstance(types, str) else list(types)
+            type_checks = [TYPE_CHECKS[name] for name in types]
+            expected = " or ".join(types)
+
+            def check_type(value, path, errors):
+                for type_check in type_checks:
+                    if type_check(value):
+                        return
+                errors.append(
+                    (path, f"expected {expected}, got {get_type_name(value)}")
+                )
+            checks.append(check_type)
+
+        if "enum" in schema:
+            enum = list(schema["enum"])
+
+            def check_enum(value, path, errors):
+                if value not in enum:
+                    errors.append((
+                        path, f"{json.dumps(value)} is not one of "
+                        f"{json.dumps(enum)}"
+                    ))
+            checks.append(check_enum)
+
+        if "const" in schema:
+            const = schema["const"]
+
+            def check_const(value, path, errors):
+                if value != const:
+                    errors.append((path, f"expected {json.dumps(const)}"))
+            checks.append(check_const)
+
+        checks += self.compile_object(schema)
+        checks += self.compile_array(schema)
+        checks += self.compile_string(schema)
+        checks += self.compile_number(schema)
+        checks += self.compile_combinations(schema)
+
+        if len(checks) == 1:
+            return checks[0]
+
+        def validate(value, path, errors):
+            for check in checks:
+                check(value, path, errors)
+        return validate
+
+    def compile_object(self, schema) -> list:
+        properties = {
+            name: (self.compile(subschema), get_path_suffix(name))
+            for name, subschema in schema.get("properties", {}).items()
+        }
+        required = (
+            list(schema.get("required", [])) if self.check_required else []
+        )
+        additional = schema.get("additionalProperties", True)
+        if not properties and not required and additional is True:
+            return []
+        validate_additional = (
+            None if additional is False else self.compile(additional)
+        )
+
+        def check_object(value, path, errors):
+            if not isinstance(value, dict):
+                return
+            for name in required:
+                if name not in value:
+                    errors.append(
+                        (path, f"missing required property '{name}'")
+                    )
+            for name, item in value.items():
+                if name in properties:
+                    validate_property, suffix = properties[name]
+                    validate_property(item, path + suffix, errors)
+                elif validate_additional is None:
+                    errors.append((
+                        path + get_path_suffix(name),
+                        "additional property not allowed",
+                    ))
+                else:
+                    validate_additional(
+                        item, path + get_path_suffix(name), errors
+                    )
+        return [check_object]
+
+    def compile_array(self, schema) -> list:
+        checks = []
+        if "items" in schema:
+            validate_item = self.compile(schema["items"])
+
+            def check_items(value, path, errors):
+                if isinstance(value, list):
+                    for i, item in enumerate(value):
+                        validate_item(item, f"{path}[{i}]", errors)
+            checks.append(check_items)
+        min_items = schema.get("minItems")
+        max_items = schema.get("maxItems")
+        if min_items is not None or max_items is not None:
+            def check_length(value, path, errors):
+                if not isinstance(value, list):
+                    return
+                if min_items is not None and len(value) < min_items:
+                    errors.append(
+                        (path, f"expected at least {min_items} items")
+                    )
+                if max_items is not None and len(value) > max_items:
+                    errors.append(
+                        (path, f"expected at most {max_items} items")
+                    )
+            checks.append(check_length)
+        return checks
+
+    def compile_string(self, schema) -> list:
+        min_length = schema.get("minLength")
+        max_length = schema.get("maxLength")
+        pattern = schema.get("pattern")
+        if min_length is None and max_length is None and pattern is None:
+            return []
+        regex = re.compile(pattern) if pattern is not None else None
+
+        def check_string(value, path, errors):
+            if not isinstance(value, str):
+                return
+            if min_length is not None and len(value) < min_length:
+                errors.append(
+                    (path, f"expected at least {min_length} characters")
+                )
+            if max_length is not None and len(value) > max_length:
+                errors.append(
+                    (path, f"expected at most {max_length} characters")
+                )
+            if regex is not None and not regex.search(value):
+                errors.append((path, f"does not match pattern {pattern}"))
+        return [check_string]
+
+    def compile_number(self, schema) -> list:
+        bounds = [
+            (schema[key], compare, message)
+            for key, compare, message in [
+                ("minimum", lambda v, b: v >= b, "expected >= {}"),
+                ("maximum", lambda v, b: v <= b, "expected <= {}"),
+                ("exclusiveMinimum", lambda v, b: v > b, "expected > {}"),
+                ("exclusiveMaximum", lambda v, b: v < b, "expected < {}"),
+            ]
+            # exclusive bounds as bool (draft 4) are not supported
+            if isinstance(schema.get(key), (int, float))
+            and not isinstance(schema.get(key), bool)
+        ]
+        if not bounds:
+            return []
+
+        def check_number(value, path, errors):
+            if not TYPE_CHECKS["number"](value):
+                return
+            for bound, compare, message in bounds:
+                if not compare(value, bound):
+                    errors.append((path, message.format(bound)))
+        return [check_number]
+
+    def compile_combinations(self, schema) -> list:
+        checks = []
+        for subschema in schema.get("allOf", []):
+            checks.append(self.compile(subschema))
+        for keyword in ["anyOf", "oneOf"]:
+            if keyword not in schema:
+                continue
+            options = [self.compile(option) for option in schema[keyword]]
+
+            def check_options(
+                value, path, errors, options=options, keyword=keyword
+            ):
+                option_errors = []
+                for option in options:
+                    errors_of_option = []
+                    option(value, path, errors_of_option)
+                    option_errors.append(errors_of_option)
+                    if not errors_of_option and keyword == "anyOf":
+                        return
+                matches = sum(not e for e in option_errors)
+                if matches == 1:
+                    return
+                if matches > 1:
+                    errors.append((path, f"matches {matches} oneOf options"))
+                    return
+                # report the violations of the closest option
+                errors.extend(min(option_errors, key=len))
+            checks.append(check_options)
+        return checks
+
+
+# compiled validators by id of the schema object (the shared schemas
+# of the schema cache), the schema is kept so its id is not reused
+VALIDATOR_CACHE_SIZE = 128
+_validators: dict[tuple, tuple[dict, SchemaValidator]] = {}
+_validators_lock = threading.Lock()
+
+
+def get_validator(
+    schema: dict, check_required: bool = True
+) -> SchemaValidator:
+    """validator of `schema`, compiled once per schema object"""
+    key = (id(schema), check_required)
+    with _validators_lock:
+        entry = _validators.get(key)
+    if entry is not None and entry[0] is schema:
+        return entry[1]
+    validator = SchemaValidator(schema, check_required)
+    with _validators_lock:
+        if len(_validators) >= VALIDATOR_CACHE_SIZE:
+            # drop the oldest entry
+            _validators.pop(next(iter(_validators)))
+        _validators[key] = (schema, validator)
+    return validator
+
+
+def validate_response(schema: dict, response) -> list[tuple[str, str]]:
+    """violations of a post-processed LLM `response` (without null and
+    empty values) against the `schema` it was requested with,
+    counted in the current span"""
+    validator = get_validator(schema, check_required=False)
+    start = time.perf_counter()
+    errors = validator.validate(response)
+    add_to_span(
+        validations=1,
+        validation_errors=len(errors),
+        validation_ms=(time.perf_counter() - start) * 1000,
+    )
+    return errors
+
+
+def get_validation_feedback(
+    errors: list[tuple[str, str]], max_errors: int = 20
+) -> str:
+    """retry prompt with the violations of the previous response"""
+    lines = [f"- {path}: {message}" for path, message in errors[:max_errors]]
+    if len(errors) > max_errors:
+        lines.append(f"- ... and {len(errors) - max_errors} more")
+    return (
+        "The previous response does not match the schema:\n"
+        + "\n".join(lines)
+        + "\nReturn the complete JSON document with these errors fixed."
+    )
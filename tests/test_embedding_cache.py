@@ -0,0 +1,24 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from embedding_cache import CachedEmbeddings
+
+
+def test_counters_of_concurrent_lookups(tmp_path):
+    cache = CachedEmbeddings(
+        DeterministicFakeEmbedding(size=8), "fake",
+        str(tmp_path / "embeddings.sqlite"),
+    )
+    texts = [f"text {i}" for i in range(50)]
+    cache.embed_documents(texts)
+
+    with ThreadPoolExecutor(8) as executor:
+        list(executor.map(
+            lambda _: cache.embed_documents(texts), range(40)
+        ))
+
+    stats = cache.get_stats()
+    assert stats["misses"] == len(texts)
+    assert stats["hits"] == 40 * len(texts)
+    assert stats["size"] == len(texts)
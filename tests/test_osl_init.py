@@ -0,0 +1,111 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+import osl_init
+from vector_store import NumpyVectorStore
+
+PEOPLE = [
+    ("Jane Doe", "0000-0001-2345-6789"),
+    ("John Doe", "0000-0002-3456-7890"),
+    ("Jane Smith", "0000-0003-4567-8901"),
+]
+
+
+def get_documents():
+    documents = []
+    for i, (name, orcid) in enumerate(PEOPLE):
+        jsondata = {"type": ["Category:Person"], "name": name, "orcid": orcid}
+        documents.append(Document(
+            id=f"Item:OSW{i:032x}",
+            page_content=json.dumps({"jsondata": jsondata}),
+            metadata={"type": jsondata["type"]},
+        ))
+    documents.append(Document(
+        id=f"Item:OSW{len(PEOPLE):032x}",
+        page_content=json.dumps({"jsondata": {"name": "Example Lab"}}),
+        metadata={"type": ["Category:Organization"]},
+    ))
+    return documents
+
+
+@pytest.mark.parametrize("keyword_index", [True, False])
+@pytest.mark.parametrize("schema_id", [None, "Category:Person"])
+def test_batch_lookup_matches_single_lookup(keyword_index, schema_id):
+    store = NumpyVectorStore(
+        DeterministicFakeEmbedding(size=32), keyword_index=keyword_index
+    )
+    store.add_documents(get_documents())
+    descriptions = [orcid for _, orcid in PEOPLE] + ["Example Lab"]
+
+    batch = osl_init.lookup_excact_matching_entities(
+        store, descriptions, schema_id=schema_id
+    )
+    for description, result in zip(descriptions, batch):
+        single = osl_init.get_lookup_candidates(
+            store, description, schema_id=schema_id
+        )
+        assert [doc_id for doc_id, _ in result["candidates"]] == [
+            doc.id for doc, _ in single
+        ]
+        assert [score for _, score in result["candidates"]] == pytest.approx(
+            [score for _, score in single], abs=1e-6
+        )
+    if keyword_index:
+        # exact identifier matches are found by the BM25 part
+        for i, result in enumerate(batch[:len(PEOPLE)]):
+            assert result["candidates"][0][0] == f"Item:OSW{i:032x}"
+
+
+class FakePage:
+    def __init__(self, title, slots, url=None):
+        self.title = title
+        self._slots = slots
+        self.url = url
+
+    def get_slot_content(self, slot):
+        return self._slots.get(slot)
+
+    def get_url(self):
+        if self.url is None:
+            raise ValueError("no url")
+        return self.url
+
+
+def get_fake_client(pages):
+    def get_page(param):
+        return SimpleNamespace(
+            pages=[page for page in pages if page.title in param.titles]
+        )
+    return SimpleNamespace(site=SimpleNamespace(get_page=get_page))
+
+
+def test_load_documents_without_jsondata():
+    pages = [
+        FakePage(
+            "Item:OSW1",
+            {"jsondata": {"name": "Jane Doe", "type": ["Category:Person"]}},
+            url="https://example.org/Item:OSW1",
+        ),
+        # e.g. a File page
+        FakePage(
+            "File:OSW2.png", {"main": "file description"},
+            url="https://example.org/File:OSW2.png",
+        ),
+        # fails conversion, only this page is skipped
+        FakePage("Item:OSW3", {"jsondata": {"name": "Broken"}}),
+    ]
+    titles = [page.title for page in pages]
+    projections = osl_init.get_projections()
+
+    documents = osl_init.load_documents(
+        get_fake_client(pages), titles, projections
+    )
+
+    assert [doc.id for doc in documents] == ["Item:OSW1", "File:OSW2.png"]
+    assert documents[0].metadata["name"] == "Jane Doe"
+    assert documents[1].metadata["name"] == "Unknown"
+    assert documents[1].metadata["type"] == "Unknown"
@@ -0,0 +1,46 @@
+import httpx
+
+from rate_limit import SDK_RETRY_HEADER, RateLimiter, RetryTransport
+
+
+def get_transport(statuses, **kwargs):
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(
+            statuses[len(requests) - 1], headers={"retry-after": "0"}
+        )
+
+    limiter = RateLimiter("test", requests_per_minute=6000)
+    transport = RetryTransport(
+        limiter, httpx.MockTransport(handler), **kwargs
+    )
+    return transport, limiter, requests
+
+
+def test_transport_retries_throttled_requests():
+    transport, limiter, requests = get_transport([429, 503, 200])
+    with httpx.Client(transport=transport) as client:
+        response = client.get("https://example.org")
+    assert response.status_code == 200
+    assert len(requests) == 3
+    assert limiter.get_stats()["throttled"] == 2
+    assert limiter.get_stats()["requests"] == 2
+
+
+def test_transport_without_retries_only_pauses():
+    # clients retrying on their own, e.g. the openai SDK
+    transport, limiter, requests = get_transport([429, 200], max_retries=0)
+    with httpx.Client(transport=transport) as client:
+        response = client.get("https://example.org")
+        assert response.status_code == 429
+        assert limiter.get_stats()["requests"] == 0
+        response = client.get(
+            "https://example.org", headers={SDK_RETRY_HEADER: "1"}
+        )
+    assert response.status_code == 200
+    assert len(requests) == 2
+    assert limiter.get_stats()["throttled"] == 1
+    # the SDK retry acquired a request slot
+    assert limiter.get_stats()["requests"] == 1
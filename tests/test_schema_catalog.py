@@ -0,0 +1,44 @@
+import pytest
+
+import schema_catalog
+
+PROMPT = "I want to document a laboratory process"
+
+
+class FakeAgent:
+    """returns the given module paths as structured responses"""
+
+    def __init__(self, module_paths):
+        self.module_paths = list(module_paths)
+        self.inputs = []
+
+    def invoke(self, agent_input):
+        self.inputs.append(agent_input)
+        module_path = self.module_paths.pop(0)
+        return {
+            "messages": agent_input["messages"],
+            "structured_response": {
+                "module_path": module_path, "explanation": "test",
+            },
+        }
+
+
+@pytest.mark.parametrize("module_paths, expected", [
+    # a known data model
+    (["opensemantic.lab.v1.LaboratoryProcess"],
+     "opensemantic.lab.v1.LaboratoryProcess"),
+    # unknown, then corrected by the retry
+    (["opensemantic.lab.v1.Unknown", "opensemantic.core.v1.Entity"],
+     "opensemantic.core.v1.Entity"),
+    # unknown twice, the best keyword match
+    (["opensemantic.lab.v1.Unknown", "opensemantic.Unknown"], None),
+])
+def test_lookup_exact_schema(monkeypatch, module_paths, expected):
+    agent = FakeAgent(module_paths)
+    monkeypatch.setattr(schema_catalog, "get_schema_lookup_agent",
+                        lambda: agent)
+    if expected is None:
+        expected = schema_catalog.shortlist_schemas(PROMPT, top_n=1)[0]
+
+    assert schema_catalog.lookup_exact_schema(PROMPT) == expected
+    assert len(agent.inputs) == min(len(module_paths), 2)
@@ -0,0 +1,38 @@
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from vector_store import NumpyVectorStore
+
+
+def get_ivf_store(size=500):
+    store = NumpyVectorStore(
+        DeterministicFakeEmbedding(size=16), index="ivf", min_size=100
+    )
+    store.add_texts(
+        [f"text {i}" for i in range(size)],
+        ids=[str(i) for i in range(size)],
+    )
+    return store
+
+
+def test_delete_last_rows_of_ivf_store():
+    store = get_ivf_store()
+    # trains the index and builds the inverted lists
+    store.similarity_search("text 1", k=5)
+    # nothing is moved when the last rows are deleted
+    store.delete(["499", "498"])
+    results = store.similarity_search("text 499", k=5)
+    assert len(store) == 498
+    assert len(results) == 5
+    assert all(int(doc.id) < 498 for doc in results)
+
+
+def test_delete_inner_rows_of_ivf_store():
+    store = get_ivf_store()
+    store.similarity_search("text 1", k=5)
+    store.delete(["0", "1"])
+    # the last rows moved into the freed ones
+    assert store.get_by_ids(["499", "498"])[0].page_content == "text 499"
+    for query in ["text 0", "text 498", "text 499"]:
+        results = store.similarity_search(query, k=5)
+        assert len(results) == 5
+        assert not {"0", "1"} & {doc.id for doc in results}
@@ -0,0 +1,254 @@
+import functools
+import inspect
+import json
+import os
+import secrets
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+# span of the currently running step, see span()
+current_span: ContextVar["Span | None"] = ContextVar(
+    "current_span", default=None
+)
+
+# finished root spans, exported by export_json / export_otlp
+traces: list["Span"] = []
+
+
+class Span:
+    """a timed step with attributes, counters (LLM calls, tokens,
+    retries) and nested child spans"""
+
+    def __init__(self, name: str, parent: "Span | None", attributes: dict):
+        self.name = name
+        self.parent = parent
+        self.attributes = attributes
+        self.children: list[Span] = []
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.depth = parent.depth + 1 if parent else 0
+        # number of enclosing spans with the same name, e.g. the
+        # recursion depth of create_linked_entity
+        self.recursion_depth = 0
+        ancestor = parent
+        while ancestor is not None:
+            if ancestor.name == name:
+                self.recursion_depth += 1
+            ancestor = ancestor.parent
+        self.counters = {
+            "llm_calls": 0,
+            "cached_llm_calls": 0,
+            "input_tokens": 0,
+            "output_tokens": 0,
+            "total_tokens": 0,
+            "retries": 0,
+            # schema validation of the structured responses and the
+            # LLM calls repeated because of invalid responses
+            "validations": 0,
+            "validation_errors": 0,
+            "validation_ms": 0.0,
+            "response_retries": 0,
+        }
+        self.error = None
+        self.start_ns = time.time_ns()
+        self._start = time.perf_counter()
+        self.end_ns = None
+        self.duration_ms = None
+
+    def end(self):
+        self.duration_ms = (time.perf_counter() - self._start) * 1000
+        self.end_ns = self.start_ns + int(self.duration_ms * 1e6)
+
+    def get_totals(self) -> dict:
+        """counters of this span including all nested spans"""
+        totals = dict(self.counters)
+        for child in self.children:
+            for key, value in child.get_totals().items():
+                totals[key] += value
+        return totals
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "duration_ms": self.duration_ms,
+            "depth": self.depth,
+            "recursion_depth": self.recursion_depth,
+            "attributes": self.attributes,
+            "counters": self.counters,
+            "totals": self.get_totals(),
+            "error": self.error,
+            "children": [child.to_dict() for child in self.children],
+        }
+
+    def iter_spans(self):
+        yield self
+        for child in self.children:
+            yield from child.iter_spans()
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """record the enclosed block as span `name`, nested in the current
+    span. Spans without parent are collected in `traces`."""
+    parent = current_span.get()
+    new_span = Span(name, parent, attributes)
+    if parent is not None:
+        parent.children.append(new_span)
+    token = current_span.set(new_span)
+    try:
+        yield new_span
+    except BaseException as e:
+        new_span.error = repr(e)
+        raise
+    finally:
+        new_span.end()
+        current_span.reset(token)
+        if parent is None:
+            traces.append(new_span)
+
+
+def traced(name: str = None, **attributes):
+    """decorator recording each call of a (sync or async) function
+    as a span"""
+    def decorator(fn):
+        span_name = name or fn.__name__
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(span_name, **attributes):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(span_name, **attributes):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def add_to_span(**counters):
+    """add to the counters of the current span, if any"""
+    current = current_span.get()
+    if current is not None:
+        for key, value in counters.items():
+            current.counters[key] = current.counters.get(key, 0) + value
+
+
+def set_span_attributes(**attributes):
+    """set attributes of the current span, if any"""
+    current = current_span.get()
+    if current is not None:
+        current.attributes.update(attributes)
+
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    """counts LLM calls and token usage in the current span"""
+
+    def on_llm_end(self, response, **kwargs):
+        from llm_cache import get_token_usage, is_cache_hit
+        if is_cache_hit(response):
+            add_to_span(llm_calls=1, cached_llm_calls=1)
+            return
+        add_to_span(llm_calls=1, **get_token_usage(response))
+
+
+def get_summary(spans: list[Span] = None) -> dict:
+    """count, total / max wall time and counters per span name"""
+    summary = {}
+    for root in traces if spans is None else spans:
+        for s in root.iter_spans():
+            entry = summary.setdefault(s.name, {
+                "count": 0, "total_ms": 0.0, "max_ms": 0.0,
+                **{key: 0 for key in s.counters},
+            })
+            entry["count"] += 1
+            entry["total_ms"] += s.duration_ms or 0.0
+            entry["max_ms"] = max(entry["max_ms"], s.duration_ms or 0.0)
+            for key, value in s.counters.items():
+                entry[key] = entry.get(key, 0) + value
+    return summary
+
+
+def export_json(path: str, spans: list[Span] = None):
+    """write the span trees as nested JSON"""
+    spans = traces if spans is None else spans
+    _write(path, {
+        "traces": [s.to_dict() for s in spans],
+        "summary": get_summary(spans),
+    })
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    if not isinstance(value, str):
+        value = json.dumps(value, default=str)
+    return {"stringValue": value}
+
+
+def export_otlp(path: str, spans: list[Span] = None, service="osl-eln-demo"):
+    """write the spans in the OpenTelemetry OTLP/JSON trace format,
+    e.g. for import into Jaeger or an OpenTelemetry collector"""
+    otlp_spans = []
+    for root in traces if spans is None else spans:
+        for s in root.iter_spans():
+            attributes = {
+                **s.attributes,
+                **s.counters,
+                "depth": s.depth,
+                "recursion_depth": s.recursion_depth,
+            }
+            otlp_span = {
+                "traceId": s.trace_id,
+                "spanId": s.span_id,
+                "name": s.name,
+                "kind": 1,
+                "startTimeUnixNano": str(s.start_ns),
+                "endTimeUnixNano": str(s.end_ns),
+                "attributes": [
+                    {"key": key, "value": _otlp_value(value)}
+                    for key, value in attributes.items()
+                ],
+                "status": (
+                    {"code": 2, "message": s.error} if s.error
+                    else {"code": 1}
+                ),
+            }
+            if s.parent is not None:
+                otlp_span["parentSpanId"] = s.parent.span_id
+            otlp_spans.append(otlp_span)
+    _write(path, {"resourceSpans": [{
+        "resource": {"attributes": [
+            {"key": "service.name", "value": {"stringValue": service}}
+        ]},
+        "scopeSpans": [{"scope": {"name": "tracing"}, "spans": otlp_spans}],
+    }]})
+
+
+def export_traces(path: str = None, trace_format: str = None):
+    """export all finished traces to TRACE_PATH in TRACE_FORMAT
+    ('json', default, or 'otlp'), nothing if no path is configured"""
+    path = path or os.environ.get("TRACE_PATH")
+    if not path:
+        return
+    trace_format = trace_format or os.environ.get("TRACE_FORMAT", "json")
+    if trace_format == "otlp":
+        export_otlp(path)
+    else:
+        export_json(path)
+    print(f"Traces written to {path}")
+
+
+def _write(path: str, data: dict):
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, default=str)
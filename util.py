@@ -38,16 +38,52 @@ def deep_equal(x, y):
     return x == y
 
 
+def get_canonical_key(item):
+    """hashable key of a JSON value, equal for deep_equal values
+    (dicts ignore the order of their keys)"""
+    if isinstance(item, dict):
+        return frozenset(
+            (key, get_canonical_key(value)) for key, value in item.items()
+        )
+    if isinstance(item, list):
+        # tagged, so a list never matches a tuple value
+        return list, tuple(get_canonical_key(value) for value in item)
+    return item
+
+
+# below this length comparing each item with the kept ones (== in C) is
+# faster than building canonical keys in Python, see the scan / hash rows
+# of benchmarks/bench_unique_array.py (crossover around 500 items, the
+# arrays merged by merge_all_of are much shorter)
+UNIQUE_ARRAY_HASH_MIN_LENGTH = 512
+
+
 def unique_array(array):
+    """items of `array` without duplicates (deep_equal),
+    in the order of their first occurrence"""
+    if len(array) < UNIQUE_ARRAY_HASH_MIN_LENGTH:
+        # == of JSON values is deep_equal, evaluated in C
+        result = []
+        for item in array:
+            if item not in result:
+                result.append(item)
+        return result
     result = []
+    seen = set()
     for item in array:
-        add = True
-        for added_item in result:
-            if deep_equal(added_item, item):
-                add = False
-                break
-        if add:
-            result.append(item)
+        try:
+            key = (
+                get_canonical_key(item)
+                if isinstance(item, (dict, list)) else item
+            )
+            if key in seen:
+                continue
+            seen.add(key)
+        except TypeError:
+            # unhashable non-JSON value, compare with the kept items
+            if any(deep_equal(added, item) for added in result):
+                continue
+        result.append(item)
     return result
 
 
@@ -76,67 +112,251 @@ def merge_deep(target, source):
 
 
 def merge_all_of(schema):
-    """The most specific schema is on the root level"""
-    if isinstance(schema, dict):
-        merged_schema = {}
-
-        for key, value in schema.items():
-            if key == "allOf":
-                pass  # handled later
-
-            # if key == "$ref":
-            #    pass # not implemented
-
-            elif isinstance(value, dict):
-                merged_schema[key] = merge_all_of(value)
-            elif isinstance(value, list):
-                merged_schema[key] = [
-                    merge_all_of(item)
-                    if isinstance(item, dict) else item for item in value
-                ]
-            else:
-                merged_schema[key] = value
+    """The most specific schema is on the root level.
+    Does not modify `schema`, returns it unchanged if it has no allOf,
+    otherwise a merged dict sharing the unchanged subschemas"""
+    if not isinstance(schema, dict) or "allOf" not in schema:
+        return schema
+    merged_schema = {}
+
+    for key, value in schema.items():
+        if key == "allOf":
+            pass  # handled later
+
+        # if key == "$ref":
+        #    pass # not implemented
+
+        elif isinstance(value, dict):
+            merged_schema[key] = merge_all_of(value)
+        elif isinstance(value, list):
+            merged_schema[key] = [
+                merge_all_of(item)
+                if isinstance(item, dict) else item for item in value
+            ]
+        else:
+            merged_schema[key] = value
+
+        if key == "oneOf":
+            merged_schema["anyOf"] = merged_schema.pop("oneOf")
+
+    for super_schema in schema["allOf"]:
+        # process it first
+        super_schema = merge_all_of(super_schema)
+        # print("merge", sub_schema, " with ", merged_schema)
+        # then merge our schema over the super_schema
+        merged_schema = merge_deep(super_schema, merged_schema)
+
+    return merged_schema
+
+
+def filter_properties(schema, properties):
+    """`schema` with only the given properties (and the required ones),
+    does not modify `schema` and shares the kept property schemas"""
+    if "properties" not in schema:
+        return schema
+    properties_to_keep = set(properties) | set(schema.get("required", []))
+    filtered_schema = dict(schema)
+    filtered_schema["properties"] = {
+        prop: prop_schema
+        for prop, prop_schema in schema["properties"].items()
+        if prop in properties_to_keep
+    }
+    return filtered_schema
+
+
+def is_openai_model():
+    """True if API_MODEL is an OpenAI model, which needs stricter schemas"""
+    model_type = os.environ.get("API_MODEL", "").lower()
+    return "openai" in model_type or "gpt" in model_type
 
-            if key == "oneOf":
-                merged_schema["anyOf"] = merged_schema.pop("oneOf")
 
-        if "allOf" in schema:
-            for super_schema in schema["allOf"]:
-                # process it first
-                super_schema = merge_all_of(super_schema)
-                # print("merge", sub_schema, " with ", merged_schema)
-                # then merge our schema over the super_schema
-                merged_schema = merge_deep(super_schema, merged_schema)
+# default budget of the $ref expansion, keeps the processed schemas
+# about as large as without expansion of the $defs
+# (see benchmarks/bench_ref_expansion.py)
+DEFAULT_SCHEMA_BUDGET = {"max_chars": 16000, "max_depth": 2}
+
+
+def get_schema_budget():
+    """limits of the $ref expansion of modify_schema from environment
+    variables: SCHEMA_MAX_CHARS (characters of the resulting schema) and
+    SCHEMA_MAX_REF_DEPTH (nesting of expanded definitions),
+    DEFAULT_SCHEMA_BUDGET if not set, 0 for no limit"""
+    return {
+        "max_chars": int(
+            os.environ.get("SCHEMA_MAX_CHARS")
+            or DEFAULT_SCHEMA_BUDGET["max_chars"]
+        ),
+        "max_depth": int(
+            os.environ.get("SCHEMA_MAX_REF_DEPTH")
+            or DEFAULT_SCHEMA_BUDGET["max_depth"]
+        ),
+    }
+
+
+# definitions that are always expanded, also beyond the budget
+REF_WHITELIST = ["Label", "LangCode", "Description"]
+
+
+def get_json_size(obj):
+    import json  # noqa: E402
+    return len(json.dumps(obj))
+
+
+class RefExpansion:
+    """state of the $ref expansion of one modify_schema call.
+    Each definition is processed once and shared by all its references.
+    A reference to a definition that is currently being expanded (on the
+    path from the root) is a cycle and replaced by type null, as are
+    references beyond the size or depth budget (see get_schema_budget),
+    except for definitions in REF_WHITELIST.
+    Definitions whose result depends on the path (cut by a cycle to an
+    outer definition or by the budget) are not reused."""
+
+    def __init__(self, root, max_chars=0, max_depth=0):
+        self.root = root
+        self.definitions = (
+            root.get("$defs", {}) if isinstance(root, dict) else {}
+        )
+        self.max_chars = max_chars
+        self.max_depth = max_depth
+        # processed definitions and their size in characters
+        self.processed = {}
+        self.sizes = {}
+        # definitions being expanded and whether their result depends
+        # on the path
+        self.path = []
+        self.path_dependent = []
+        # estimated size of the result: the schema without definitions
+        # plus the expanded references
+        self.chars = get_json_size({
+            key: value for key, value in root.items() if key != "$defs"
+        }) if isinstance(root, dict) else 0
+        self.expanded = 0
+        self.reused = 0
+        self.cycles = 0
+        self.budget_cuts = 0
+        # definitions not expanded because of the budget
+        self.cut_refs = set()
+        self.max_reached_depth = 0
+
+    def _cut_budget(self, def_key):
+        """the reference to `def_key` is beyond the budget"""
+        self.budget_cuts += 1
+        self.cut_refs.add(def_key)
+        self._cut(0)
+
+    def _cut(self, depends_from: int):
+        """mark the definitions on the path from `depends_from` on as
+        path dependent"""
+        for i in range(depends_from, len(self.path)):
+            self.path_dependent[i] = True
+
+    def expand(self, def_key):
+        """processed schema of definition `def_key`,
+        None if the reference is not expanded (cycle or budget)"""
+        if def_key in self.path:
+            self.cycles += 1
+            self._cut(self.path.index(def_key) + 1)
+            return None
+        limited = def_key not in REF_WHITELIST
+        if def_key in self.processed:
+            size = self.sizes[def_key]
+            if (
+                limited and self.max_chars
+                and self.chars + size > self.max_chars
+            ):
+                self._cut_budget(def_key)
+                return None
+            self.reused += 1
+            self.chars += size
+            return self.processed[def_key]
+        if limited and (
+            (self.max_depth and len(self.path) >= self.max_depth)
+            or (self.max_chars and self.chars >= self.max_chars)
+        ):
+            self._cut_budget(def_key)
+            return None
+
+        chars = self.chars
+        self.path.append(def_key)
+        self.path_dependent.append(False)
+        self.max_reached_depth = max(self.max_reached_depth, len(self.path))
+        try:
+            schema = modify_schema(
+                self.definitions[def_key], root=self.root, expansion=self
+            )
+        finally:
+            self.path.pop()
+            path_dependent = self.path_dependent.pop()
+        size = get_json_size(schema)
+        # the nested expansions are part of the size of this one
+        self.chars = chars + size
+        self.expanded += 1
+        if not path_dependent:
+            self.processed[def_key] = schema
+            self.sizes[def_key] = size
+        return schema
+
+    def get_report(self, schema) -> dict:
+        """size of the resulting schema and expansion counters"""
+        return {
+            "chars": get_json_size(schema),
+            "definitions": len(self.definitions),
+            "expanded": self.expanded,
+            "reused": self.reused,
+            "cycles": self.cycles,
+            "budget_cuts": self.budget_cuts,
+            "max_depth": self.max_reached_depth,
+        }
 
-            return merged_schema
-    return schema
 
+def get_range_schema(schema):
+    """string schema replacing a subschema with range annotation"""
+    return {
+        "type": "string",
+        "range": schema["range"],
+        "title": schema.get("title", ""),
+        "description": schema.get("description", "")
+    }
 
-def modify_schema(schema, seen_refs=None, root=None):
+
+def modify_schema(schema, expansion=None, root=None, report=None):
     """makes jsonschema OpenAI conform,
     see https://platform.openai.com/docs/guides/structured-outputs#supported-schemas
     Interate over a JsonSchema recursively.
     add the key additionalProperties: false to every type object schema.
     for each object properties which is not required add the union type with null,
     e.g. type: [string, null]. finally, make all properties required.
+    Does not modify `schema`: changed dicts and lists are copied,
+    unchanged subschemas are shared with the result.
+    $refs to the root $defs are expanded within the budget of
+    get_schema_budget(), see RefExpansion, other $refs become type null,
+    so the result contains no $refs. If given, `report` is updated
+    with the size of the result and the expansion counters.
     """  # noqa: E501
 
-    model_type = os.environ.get("API_MODEL", "").lower()
-    is_openai_model = ("openai" in model_type or "gpt" in model_type)
-
-    # fix: rename "defintions" to "$defs"
-    if isinstance(schema, dict) and "definitions" in schema:
-        schema["$defs"] = schema.pop("definitions")
+    openai_model = is_openai_model()
 
     root_level = False
     if root is None:
+        # fix: rename "defintions" to "$defs"
+        if isinstance(schema, dict) and "definitions" in schema:
+            schema = dict(schema)
+            schema["$defs"] = schema.pop("definitions")
         root = schema
         root_level = True
 
-    if seen_refs is None:
-        seen_refs = {}
+    if expansion is None:
+        expansion = RefExpansion(root, **get_schema_budget())
 
     schema = merge_all_of(schema)
+    if isinstance(schema, dict) and "range" in schema and "$ref" not in schema:
+        # cut off below, skip processing (and expanding $refs in) the
+        # subschemas
+        return get_range_schema(schema)
+    if isinstance(schema, dict):
+        # changes of this level go to a shallow copy
+        schema = dict(schema)
     if isinstance(schema, dict) and schema.get("type") is not None:
 
         rm_keys = [
@@ -171,11 +391,12 @@ def modify_schema(schema, seen_refs=None, root=None):
 
         if "object" in schema.get("type"):
             schema["additionalProperties"] = False
-            properties = schema.get("properties", {})
+            properties = dict(schema.get("properties", {}))
             # make all required for openai models
-            if is_openai_model:
+            if openai_model:
                 required = schema.get("required", [])
             for prop, prop_schema in properties.items():
+                prop_schema = dict(prop_schema)
                 # check if 'type', 'anyOf', 'oneOf', or 'allOf' is present
                 if not any(k in prop_schema for k in [
                     "type", "anyOf", "oneOf", "allOf"
@@ -187,12 +408,14 @@ def modify_schema(schema, seen_refs=None, root=None):
                     )
                     prop_schema["type"] = "string"
 
-                if is_openai_model:
+                if openai_model:
                     if prop not in required:
                         if "type" in prop_schema:
                             if isinstance(prop_schema["type"], list):
                                 if "null" not in prop_schema["type"]:
-                                    prop_schema["type"].append("null")
+                                    prop_schema["type"] = [
+                                        *prop_schema["type"], "null"
+                                    ]
                             else:
                                 prop_schema["type"] = [
                                     prop_schema["type"], "null"
@@ -205,9 +428,11 @@ def modify_schema(schema, seen_refs=None, root=None):
                     # ["array", "null"] are not supported by structured
                     # output APIs
                 # Recursively modify nested objects
-                schema["properties"][prop] = modify_schema(
-                    prop_schema, root=root, seen_refs=seen_refs
+                properties[prop] = modify_schema(
+                    prop_schema, root=root, expansion=expansion
                 )
+            if "properties" in schema:
+                schema["properties"] = properties
             # Make all properties required - LLM will provide empty defaults
             # for fields without data ([], "", {})
             schema["required"] = list(properties.keys())
@@ -215,11 +440,13 @@ def modify_schema(schema, seen_refs=None, root=None):
             items = schema.get("items")
             if items:
                 schema["items"] = modify_schema(
-                    items, root=root, seen_refs=seen_refs
+                    items, root=root, expansion=expansion
                 )
     elif isinstance(schema, list):
-        for i, item in enumerate(schema):
-            schema[i] = modify_schema(item, root=root, seen_refs=seen_refs)
+        schema = [
+            modify_schema(item, root=root, expansion=expansion)
+            for item in schema
+        ]
 
     # #handle $defs
     # if isinstance(schema, dict) and "$defs" in schema:
@@ -228,37 +455,38 @@ def modify_schema(schema, seen_refs=None, root=None):
     #             def_schema, seen_refs=seen_refs
     #         )
 
+    if isinstance(schema, dict) and "anyOf" in schema:
+        schema["anyOf"] = [
+            modify_schema(subschema, root=root, expansion=expansion)
+            for subschema in schema["anyOf"]
+        ]
+
     # replace $refs from root $defs
-    ref_whitelist = ["Label", "LangCode", "Description"]
     if isinstance(schema, dict) and "$ref" in schema:
         ref = schema["$ref"]
         if ref.startswith("#/$defs/"):
             def_key = ref[len("#/$defs/"):]
-            if root and "$defs" in root and def_key in root["$defs"]:
-                if ref in seen_refs and def_key not in ref_whitelist:
-                    # print(f"Warning: Circular $ref detected for {ref}")
-                    schema.pop("$ref", None)
+            if def_key in expansion.definitions:
+                # the expanded definition is already processed
+                definition = expansion.expand(def_key)
+                if definition is None:
+                    # circular or beyond the budget
                     schema["type"] = "null"
                 else:
-                    seen_refs[ref] = True
-                    schema.update(modify_schema(
-                        root["$defs"][def_key], root=root, seen_refs=seen_refs
-                    ))
-                    schema.pop("$ref", None)
+                    schema.update(definition)
+                schema.pop("$ref", None)
             else:
-
-                # if ref name matches root title, replace with root schema
+                # the result has no $defs, so the reference is replaced
+                # like a cycle: a reference to the root (by its title) is
+                # one, others can not be resolved
                 if root and "title" in root and def_key == root["title"]:
-                    schema["$ref"] = "#"
+                    expansion.cycles += 1
                 else:
                     print(f"Warning: $ref {ref} not found in root $defs")
+                schema["type"] = "null"
+                schema.pop("$ref", None)
 
     if isinstance(schema, dict):
-        if "anyOf" in schema:
-            for i, subschema in enumerate(schema["anyOf"]):
-                schema["anyOf"][i] = modify_schema(
-                    subschema, root=root, seen_refs=seen_refs
-                )
         if "format" in schema:
             if schema["format"] in [
                 "uri", "uri-reference", "iri", "iri-reference"
@@ -267,17 +495,19 @@ def modify_schema(schema, seen_refs=None, root=None):
 
         # cutoff subschemas if range annotation is present
         if "range" in schema:
-            schema = {
-                "type": "string",
-                "range": schema["range"],
-                "title": schema.get("title", ""),
-                "description": schema.get("description", "")
-            }
+            schema = get_range_schema(schema)
 
     if root_level:
         # finally, remove $defs from root
         if "$defs" in schema:
             schema.pop("$defs")
+        if expansion.budget_cuts:
+            print(
+                f"Warning: schema budget reached, {expansion.budget_cuts} "
+                f"$refs not expanded: {', '.join(sorted(expansion.cut_refs))}"
+            )
+        if report is not None:
+            report.update(expansion.get_report(schema))
             # for def_key in list(schema["$defs"].keys()):
             #     if def_key in ref_whitelist:
             #         continue
@@ -333,12 +563,69 @@ def remove_auto_defined_fields(d):
         return d
 
 
-def post_process_llm_json_response(response_json):
+# strings treated as empty values, ":null" is produced by
+# llama-3.3-70b-instruct
+EMPTY_STRINGS = ("", ":null")
+# fields defined by the data model, not by the LLM
+AUTO_DEFINED_FIELDS = ("uuid", "type")
+
+
+def post_process_llm_json_response(
+    response_json,
+    empty_strings=EMPTY_STRINGS,
+    auto_defined_fields=AUTO_DEFINED_FIELDS,
+):
     """Post-process LLM JSON response by
-    removing null values, empty strings, and auto-defined fields"""
-    cleaned_response = remove_nulls(response_json)
-    cleaned_response = remove_empty(cleaned_response)
-    cleaned_response = remove_auto_defined_fields(cleaned_response)
+    removing null values, empty strings, and auto-defined fields.
+    Same result as remove_nulls, remove_empty and
+    remove_auto_defined_fields in sequence, but in one iterative pass
+    (no recursion limit for deeply nested responses): a value is removed
+    if it is null, one of `empty_strings` or an array / object that is
+    empty without its null values, dict entries also if their key is one
+    of `auto_defined_fields`"""
+    empty_strings = frozenset(empty_strings)
+    auto_defined_fields = frozenset(auto_defined_fields)
+
+    def clean(value):
+        """the value to keep (a container still to fill), or `removed`"""
+        if value is None:
+            return removed
+        if isinstance(value, str):
+            return removed if value in empty_strings else value
+        if isinstance(value, list):
+            if value.count(None) == len(value):
+                return removed
+            result = []
+        elif isinstance(value, dict):
+            if all(item is None for item in value.values()):
+                return removed
+            result = {}
+        else:
+            return value
+        stack.append((value, result))
+        return result
+
+    if not isinstance(response_json, (dict, list)):
+        return response_json
+    removed = object()
+    # (source container, cleaned copy) pairs still to fill
+    stack = [
+        (response_json, {} if isinstance(response_json, dict) else [])
+    ]
+    cleaned_response = stack[0][1]
+    while stack:
+        source, target = stack.pop()
+        if isinstance(target, dict):
+            for key, value in source.items():
+                if key not in auto_defined_fields:
+                    value = clean(value)
+                    if value is not removed:
+                        target[key] = value
+        else:
+            for value in source:
+                value = clean(value)
+                if value is not removed:
+                    target.append(value)
     return cleaned_response
 
 
@@ -0,0 +1,662 @@
+import json
+import uuid
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+from keyword_index import BM25Index
+
+
+class IVFIndex:
+    """Approximate nearest neighbour index for NumpyVectorStore
+    (inverted file with spherical k-means coarse quantization).
+    The rows of the store are clustered into `nlist` lists, a query only
+    scores the rows of the `nprobe` lists with the closest centroids.
+    Knobs: larger `nprobe` -> higher recall, higher latency.
+    `nlist` defaults to 4 * sqrt(number of rows) at training time.
+    Stores smaller than `min_size` rows are always scanned exactly.
+    The index is trained lazily on the first search and retrained once the
+    store has grown by `retrain_growth` since, new rows are assigned to the
+    nearest existing centroid on insertion.
+    """
+
+    def __init__(
+        self,
+        nlist: int = None,
+        nprobe: int = 8,
+        min_size: int = 10000,
+        kmeans_iter: int = 10,
+        train_sample: int = 100000,
+        retrain_growth: float = 4.0,
+        seed: int = 0,
+    ):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.min_size = min_size
+        self.kmeans_iter = kmeans_iter
+        self.train_sample = train_sample
+        self.retrain_growth = retrain_growth
+        self.seed = seed
+        self.centroids = None
+        self.trained_size = 0
+        self._assign = np.empty(0, dtype=np.int32)
+        self._lists = None
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def needs_training(self, size: int) -> bool:
+        if size < self.min_size:
+            return False
+        return (
+            not self.is_trained
+            or size > self.retrain_growth * self.trained_size
+        )
+
+    def _nearest_centroid(self, vectors: np.ndarray) -> np.ndarray:
+        # in batches to bound the size of the score matrix
+        assign = np.empty(len(vectors), dtype=np.int32)
+        for i in range(0, len(vectors), 65536):
+            scores = vectors[i:i + 65536] @ self.centroids.T
+            assign[i:i + 65536] = np.argmax(scores, axis=1)
+        return assign
+
+    def train(self, vectors: np.ndarray):
+        """cluster the (normalized) rows of `vectors` and assign all rows"""
+        rng = np.random.default_rng(self.seed)
+        nlist = self.nlist or max(1, int(4 * np.sqrt(len(vectors))))
+        nlist = min(nlist, len(vectors))
+        sample = vectors
+        if len(vectors) > self.train_sample:
+            sample = vectors[
+                rng.choice(len(vectors), self.train_sample, replace=False)
+            ]
+        self.centroids = sample[
+            rng.choice(len(sample), nlist, replace=False)
+        ].copy()
+        for _ in range(self.kmeans_iter):
+            assign = self._nearest_centroid(sample)
+            order = np.argsort(assign, kind="stable")
+            counts = np.bincount(assign, minlength=nlist)
+            starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+            non_empty = counts > 0
+            sums = np.add.reduceat(sample[order], starts[non_empty], axis=0)
+            self.centroids[non_empty] = sums
+            # re-seed empty clusters with random samples
+            empty = np.flatnonzero(~non_empty)
+            if len(empty):
+                self.centroids[empty] = sample[
+                    rng.choice(len(sample), len(empty), replace=False)
+                ]
+            self.centroids /= np.maximum(
+                np.linalg.norm(self.centroids, axis=1, keepdims=True), 1e-12
+            )
+        self._assign = self._nearest_centroid(vectors)
+        self.trained_size = len(vectors)
+        self._lists = None
+
+    def add(self, rows: np.ndarray, vectors: np.ndarray):
+        """assign new or updated rows to their nearest centroid"""
+        if not self.is_trained or len(rows) == 0:
+            return
+        size = int(rows.max()) + 1
+        if size > len(self._assign):
+            assign = np.zeros(max(size, 2 * len(self._assign)), np.int32)
+            assign[:len(self._assign)] = self._assign
+            self._assign = assign
+        self._assign[rows] = self._nearest_centroid(vectors)
+        self._lists = None
+
+    def move(self, src: int, dst: int):
+        """mirror a row move of the store (used when deleting rows)"""
+        if self.is_trained:
+            self._assign[dst] = self._assign[src]
+            self._lists = None
+
+    def remove(self):
+        """mirror the removal of rows from the store, the inverted lists
+        are rebuilt for the new size on the next search"""
+        self._lists = None
+
+    def candidates(self, query: np.ndarray, size: int) -> np.ndarray:
+        """rows of the `nprobe` lists closest to `query`"""
+        if self._lists is None:
+            # (re)build the inverted lists from the row assignments
+            order = np.argsort(self._assign[:size], kind="stable")
+            bounds = np.searchsorted(
+                self._assign[:size][order],
+                np.arange(len(self.centroids) + 1)
+            )
+            self._lists = (order, bounds)
+        order, bounds = self._lists
+        nprobe = min(self.nprobe, len(self.centroids))
+        centroid_scores = self.centroids @ query
+        probe = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        rows = np.concatenate(
+            [order[bounds[c]:bounds[c + 1]] for c in probe]
+        )
+        # lists built for a larger store may hold removed rows
+        return rows[rows < size]
+
+    def get_config(self) -> dict:
+        return {
+            "nlist": self.nlist,
+            "nprobe": self.nprobe,
+            "min_size": self.min_size,
+            "kmeans_iter": self.kmeans_iter,
+            "train_sample": self.train_sample,
+            "retrain_growth": self.retrain_growth,
+            "seed": self.seed,
+        }
+
+
+class NumpyVectorStore(VectorStore):
+    """In-memory vector store that keeps all embeddings in one contiguous
+    float32 matrix of L2-normalized rows plus an id / text / metadata side
+    table. A query is scored against all documents with a single
+    matrix-vector product, the top-k are selected with argpartition.
+    Drop-in replacement for langchain's InMemoryVectorStore
+    (scores are cosine similarities as well).
+    Optionally an IVFIndex restricts the scan to the closest clusters.
+    Rows are partitioned by the `type` metadata (category ids), so a search
+    restricted to `types` only scans the vectors of these types.
+    """
+
+    def __init__(
+        self,
+        embedding: Embeddings,
+        index: str = "exact",
+        keyword_index: bool = False,
+        **kwargs
+    ):
+        """`index` is either "exact" (brute force scan) or "ivf"
+        (approximate search, see IVFIndex for the keyword arguments).
+        If `keyword_index` is True, a BM25 index over the document texts
+        is kept in sync for hybrid_search_with_score."""
+        self.embedding = embedding
+        self.keyword_index = BM25Index() if keyword_index else None
+        if index == "ivf":
+            self.index = IVFIndex(**kwargs)
+        elif index == "exact":
+            self.index = None
+        else:
+            raise ValueError(f"Unknown index type '{index}'")
+        self._vectors = np.empty((0, 0), dtype=np.float32)
+        self._size = 0
+        self._ids: list[str] = []
+        self._texts: list[str] = []
+        self._metadatas: list[dict] = []
+        self._id_index: dict[str, int] = {}
+        self._type_rows: dict[str, set[int]] = {}
+        self._type_arrays: dict[str, np.ndarray] = {}
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding
+
+    def __len__(self):
+        return self._size
+
+    @staticmethod
+    def _normalize(vectors) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    @staticmethod
+    def _get_types(metadata: dict) -> list[str]:
+        types = (metadata or {}).get("type") or []
+        if isinstance(types, str):
+            types = [types]
+        return types
+
+    def _add_type_rows(self, row: int, metadata: dict):
+        for type_id in self._get_types(metadata):
+            self._type_rows.setdefault(type_id, set()).add(row)
+            self._type_arrays.pop(type_id, None)
+
+    def _remove_type_rows(self, row: int, metadata: dict):
+        for type_id in self._get_types(metadata):
+            rows = self._type_rows.get(type_id)
+            if rows is not None:
+                rows.discard(row)
+                if not rows:
+                    del self._type_rows[type_id]
+            self._type_arrays.pop(type_id, None)
+
+    def _rows_of_types(self, types) -> np.ndarray:
+        """sorted rows of all documents having one of the given types"""
+        arrays = []
+        for type_id in types:
+            if type_id not in self._type_rows:
+                continue
+            if type_id not in self._type_arrays:
+                self._type_arrays[type_id] = np.array(
+                    sorted(self._type_rows[type_id]), dtype=np.int64
+                )
+            arrays.append(self._type_arrays[type_id])
+        if not arrays:
+            return np.empty(0, dtype=np.int64)
+        if len(arrays) == 1:
+            return arrays[0]
+        return np.unique(np.concatenate(arrays))
+
+    def get_types(self) -> dict[str, int]:
+        """number of documents per type"""
+        return {
+            type_id: len(rows) for type_id, rows in self._type_rows.items()
+        }
+
+    def _reserve(self, capacity: int, dim: int):
+        """grow the matrix geometrically so appends are amortized O(1)"""
+        if self._vectors.shape[1] not in (0, dim):
+            raise ValueError(
+                f"Embedding dimension {dim} does not match "
+                f"store dimension {self._vectors.shape[1]}"
+            )
+        if capacity <= self._vectors.shape[0]:
+            return
+        new_capacity = max(capacity, 2 * self._vectors.shape[0], 1024)
+        vectors = np.empty((new_capacity, dim), dtype=np.float32)
+        if self._size:
+            vectors[:self._size] = self._vectors[:self._size]
+        self._vectors = vectors
+
+    def add_vectors(
+        self, vectors, documents: list[Document], ids: list[str] = None
+    ) -> list[str]:
+        """add documents with precomputed embeddings.
+        Documents with an already stored id are replaced.
+        """
+        vectors = self._normalize(vectors)
+        if len(vectors) != len(documents):
+            raise ValueError(
+                f"Got {len(vectors)} vectors and {len(documents)} documents"
+            )
+        if ids is None:
+            ids = [doc.id or str(uuid.uuid4()) for doc in documents]
+        if len(documents):
+            self._reserve(self._size + len(documents), vectors.shape[1])
+
+        rows = np.empty(len(documents), dtype=np.int64)
+        for i, (doc_id, vector, doc) in enumerate(
+            zip(ids, vectors, documents)
+        ):
+            row = self._id_index.get(doc_id)
+            if row is None:
+                row = self._size
+                self._size += 1
+                self._id_index[doc_id] = row
+                self._ids.append(doc_id)
+                self._texts.append(doc.page_content)
+                self._metadatas.append(doc.metadata)
+            else:
+                self._remove_type_rows(row, self._metadatas[row])
+                self._texts[row] = doc.page_content
+                self._metadatas[row] = doc.metadata
+            self._add_type_rows(row, doc.metadata)
+            self._vectors[row] = vector
+            rows[i] = row
+            if self.keyword_index is not None:
+                self.keyword_index.add(doc_id, doc.page_content)
+        if self.index is not None:
+            self.index.add(rows, vectors)
+        return list(ids)
+
+    def add_documents(
+        self, documents: list[Document], ids: list[str] = None, **kwargs
+    ) -> list[str]:
+        if ids and len(ids) != len(documents):
+            raise ValueError(
+                f"ids must be the same length as documents. "
+                f"Got {len(ids)} ids and {len(documents)} documents."
+            )
+        vectors = self.embedding.embed_documents(
+            [doc.page_content for doc in documents]
+        )
+        return self.add_vectors(vectors, documents, ids=ids)
+
+    def add_texts(
+        self, texts, metadatas: list[dict] = None, ids: list[str] = None,
+        **kwargs
+    ) -> list[str]:
+        texts = list(texts)
+        metadatas = metadatas or [{} for _ in texts]
+        documents = [
+            Document(page_content=text, metadata=metadata)
+            for text, metadata in zip(texts, metadatas)
+        ]
+        return self.add_documents(documents, ids=ids)
+
+    def delete(self, ids: list[str] = None, **kwargs) -> None:
+        """remove documents by moving the last row into the freed slot"""
+        removed = False
+        for doc_id in ids or []:
+            row = self._id_index.pop(doc_id, None)
+            if row is None:
+                continue
+            if self.keyword_index is not None:
+                self.keyword_index.remove(doc_id)
+            self._remove_type_rows(row, self._metadatas[row])
+            last = self._size - 1
+            if row != last:
+                self._remove_type_rows(last, self._metadatas[last])
+                self._add_type_rows(row, self._metadatas[last])
+                self._vectors[row] = self._vectors[last]
+                self._ids[row] = self._ids[last]
+                self._texts[row] = self._texts[last]
+                self._metadatas[row] = self._metadatas[last]
+                self._id_index[self._ids[row]] = row
+                if self.index is not None:
+                    self.index.move(last, row)
+            self._ids.pop()
+            self._texts.pop()
+            self._metadatas.pop()
+            self._size = last
+            removed = True
+        if removed and self.index is not None:
+            self.index.remove()
+
+    def _document(self, row: int) -> Document:
+        return Document(
+            id=self._ids[row],
+            page_content=self._texts[row],
+            metadata=self._metadatas[row],
+        )
+
+    def get_by_ids(self, ids, /) -> list[Document]:
+        return [
+            self._document(self._id_index[doc_id])
+            for doc_id in ids if doc_id in self._id_index
+        ]
+
+    def _top_k(self, scores: np.ndarray, k: int) -> np.ndarray:
+        """indices of the k highest scores, sorted descending"""
+        if k < len(scores):
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(len(scores))
+        return top[np.argsort(-scores[top])]
+
+    def similarity_search_with_score_by_vector(
+        self, embedding: list[float], k: int = 4, filter=None, types=None,
+        **kwargs
+    ) -> list[tuple[Document, float]]:
+        """return the k most similar documents with their cosine similarity.
+        `types` restricts the search to documents with one of the given
+        `type` metadata values, `filter` is an additional predicate
+        on the documents."""
+        if self._size == 0 or k <= 0:
+            return []
+        query = self._normalize(embedding)
+        rows = self._candidate_rows(query, types, k)
+        if rows is not None and len(rows) == 0:
+            return []
+        if rows is None:
+            scores = self._vectors[:self._size] @ query
+        else:
+            scores = self._vectors[rows] @ query
+        if filter is not None:
+            # filter is applied on the documents in order of their score,
+            # same as InMemoryVectorStore
+            top = np.argsort(-scores)
+        else:
+            top = self._top_k(scores, k)
+
+        results = []
+        for i in top:
+            row = i if rows is None else rows[i]
+            doc = self._document(row)
+            if filter is None or filter(doc):
+                results.append((doc, float(scores[i])))
+                if len(results) == k:
+                    break
+        return results
+
+    def build_index(self):
+        """(re)train the approximate index if the store has grown enough,
+        otherwise this happens lazily on the next search"""
+        if self.index is not None and self.index.needs_training(self._size):
+            print(f"Training IVF index on {self._size} vectors...")
+            self.index.train(self._vectors[:self._size])
+
+    def hybrid_search_with_score(
+        self, query: str, k: int = 4, fetch_k: int = 20, rrf_k: int = 60,
+        filter=None, types=None, **kwargs
+    ) -> list[tuple[Document, float]]:
+        """combine the `fetch_k` best vector and BM25 matches with
+        reciprocal rank fusion. The results are ordered by their fused rank,
+        the returned scores are the cosine similarities to the query.
+        Falls back to vector search if there is no keyword index.
+        """
+        embedding = self.embedding.embed_query(query)
+        dense = self.similarity_search_with_score_by_vector(
+            embedding, k=fetch_k, filter=filter, types=types, **kwargs
+        )
+        if self.keyword_index is None:
+            return dense[:k]
+        return self._fuse(
+            query, embedding, dense, k, fetch_k, rrf_k, filter, types
+        )
+
+    def hybrid_search_with_score_by_vectors(
+        self, queries: list[str], embeddings, k: int = 4, fetch_k: int = 20,
+        rrf_k: int = 60, filter=None, types=None, **kwargs
+    ) -> list[list[tuple[Document, float]]]:
+        """batch variant of hybrid_search_with_score for queries with
+        their (query) `embeddings`, the vector matches of all queries are
+        scored with similarity_search_with_score_by_vectors"""
+        all_dense = self.similarity_search_with_score_by_vectors(
+            embeddings, k=fetch_k, filter=filter, types=types, **kwargs
+        )
+        if self.keyword_index is None:
+            return [dense[:k] for dense in all_dense]
+        return [
+            self._fuse(
+                query, embedding, dense, k, fetch_k, rrf_k, filter, types
+            )
+            for query, embedding, dense in zip(queries, embeddings, all_dense)
+        ]
+
+    def _fuse(
+        self, query, embedding, dense, k, fetch_k, rrf_k, filter, types
+    ) -> list[tuple[Document, float]]:
+        """reciprocal rank fusion of the `dense` vector matches with the
+        `fetch_k` best BM25 matches of `query`"""
+        sparse = [
+            doc_id for doc_id, _ in self.keyword_index.search(query, fetch_k)
+        ]
+        if types is not None:
+            type_rows = set(self._rows_of_types(types).tolist())
+            sparse = [
+                doc_id for doc_id in sparse
+                if self._id_index[doc_id] in type_rows
+            ]
+        if filter is not None:
+            sparse = [
+                doc_id for doc_id in sparse
+                if filter(self._document(self._id_index[doc_id]))
+            ]
+
+        fused: dict[str, float] = {}
+        for rank, doc_id in enumerate(doc.id for doc, _ in dense):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1 / (rrf_k + rank + 1)
+        for rank, doc_id in enumerate(sparse):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1 / (rrf_k + rank + 1)
+        top = sorted(fused, key=fused.get, reverse=True)[:k]
+
+        query_vector = self._normalize(embedding)
+        rows = [self._id_index[doc_id] for doc_id in top]
+        scores = self._vectors[rows] @ query_vector if rows else []
+        return [
+            (self._document(row), float(score))
+            for row, score in zip(rows, scores)
+        ]
+
+    def similarity_search_with_score_by_vectors(
+        self, embeddings, k: int = 4, types=None, **kwargs
+    ) -> list[list[tuple[Document, float]]]:
+        """batch variant of similarity_search_with_score_by_vector,
+        scores a block of queries with a single matrix product"""
+        if self.index is not None or kwargs.get("filter") is not None:
+            return [
+                self.similarity_search_with_score_by_vector(
+                    embedding, k=k, types=types, **kwargs
+                )
+                for embedding in embeddings
+            ]
+        rows = None if types is None else self._rows_of_types(types)
+        n_rows = self._size if rows is None else len(rows)
+        if n_rows == 0 or k <= 0:
+            return [[] for _ in embeddings]
+        vectors = (
+            self._vectors[:self._size] if rows is None else self._vectors[rows]
+        )
+
+        queries = self._normalize(embeddings)
+        k = min(k, n_rows)
+        # limit the score matrix to ~64M entries
+        block = max(1, 2 ** 26 // n_rows)
+        results = []
+        for i in range(0, len(queries), block):
+            scores = queries[i:i + block] @ vectors.T
+            if k < n_rows:
+                top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            else:
+                top = np.tile(np.arange(n_rows), (len(scores), 1))
+            order = np.argsort(
+                -np.take_along_axis(scores, top, axis=1), axis=1
+            )
+            top = np.take_along_axis(top, order, axis=1)
+            for query_scores, top_rows in zip(scores, top):
+                results.append([
+                    (
+                        self._document(j if rows is None else rows[j]),
+                        float(query_scores[j])
+                    )
+                    for j in top_rows
+                ])
+        return results
+
+    def _candidate_rows(self, query: np.ndarray, types=None, k: int = 0):
+        """rows to score for `query`, None to scan all rows"""
+        type_rows = None if types is None else self._rows_of_types(types)
+        if self.index is None:
+            return type_rows
+        if type_rows is not None and len(type_rows) < self.index.min_size:
+            # small partitions are scanned exactly
+            return type_rows
+        self.build_index()
+        if not self.index.is_trained:
+            return type_rows
+        rows = self.index.candidates(query, self._size)
+        if type_rows is not None:
+            rows = np.intersect1d(rows, type_rows, assume_unique=True)
+            if len(rows) < k:
+                # the probed lists hold too few rows of the requested
+                # types, scan the whole partition instead
+                return type_rows
+        return rows
+
+    def similarity_search_with_score(
+        self, query: str, k: int = 4, **kwargs
+    ) -> list[tuple[Document, float]]:
+        embedding = self.embedding.embed_query(query)
+        return self.similarity_search_with_score_by_vector(
+            embedding, k=k, **kwargs
+        )
+
+    def similarity_search_by_vector(
+        self, embedding: list[float], k: int = 4, **kwargs
+    ) -> list[Document]:
+        return [
+            doc for doc, _ in self.similarity_search_with_score_by_vector(
+                embedding, k=k, **kwargs
+            )
+        ]
+
+    def similarity_search(
+        self, query: str, k: int = 4, **kwargs
+    ) -> list[Document]:
+        return [
+            doc for doc, _ in self.similarity_search_with_score(
+                query, k=k, **kwargs
+            )
+        ]
+
+    def _select_relevance_score_fn(self):
+        return lambda score: score
+
+    @classmethod
+    def from_texts(
+        cls, texts, embedding: Embeddings, metadatas: list[dict] = None,
+        ids: list[str] = None, **kwargs
+    ) -> "NumpyVectorStore":
+        store = cls(embedding=embedding)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
+
+    def dump(self, path: str) -> None:
+        """save the store to a single .npz file at `path`"""
+        side_table = {
+            "ids": self._ids,
+            "texts": self._texts,
+            "metadatas": self._metadatas,
+        }
+        arrays = {}
+        if self.index is not None and self.index.is_trained:
+            side_table["ivf"] = {
+                **self.index.get_config(),
+                "trained_size": self.index.trained_size,
+            }
+            arrays["ivf_centroids"] = self.index.centroids
+            arrays["ivf_assign"] = self.index._assign[:self._size]
+        with open(path, "wb") as f:
+            np.savez(
+                f,
+                vectors=self._vectors[:self._size],
+                side_table=np.array(json.dumps(side_table)),
+                **arrays,
+            )
+
+    @classmethod
+    def load(
+        cls, path: str, embedding: Embeddings, index: str = "exact",
+        keyword_index: bool = False, **kwargs
+    ) -> "NumpyVectorStore":
+        """load a store saved with `dump`.
+        A persisted IVF index is reused if `index` is "ivf",
+        `kwargs` override its persisted settings (e.g. nprobe).
+        """
+        store = cls(
+            embedding=embedding, index=index, keyword_index=keyword_index,
+            **kwargs
+        )
+        with np.load(path, allow_pickle=False) as data:
+            side_table = json.loads(str(data["side_table"]))
+            store._vectors = np.ascontiguousarray(data["vectors"])
+            if store.index is not None and "ivf" in side_table:
+                config = side_table["ivf"]
+                trained_size = config.pop("trained_size")
+                store.index = IVFIndex(**{**config, **kwargs})
+                store.index.centroids = data["ivf_centroids"]
+                store.index._assign = data["ivf_assign"].copy()
+                store.index.trained_size = trained_size
+        store._ids = side_table["ids"]
+        store._texts = side_table["texts"]
+        store._metadatas = side_table["metadatas"]
+        store._size = len(store._ids)
+        store._id_index = {
+            doc_id: row for row, doc_id in enumerate(store._ids)
+        }
+        for row, metadata in enumerate(store._metadatas):
+            store._add_type_rows(row, metadata)
+        if store.keyword_index is not None:
+            # the keyword index is cheap to rebuild, so it is not persisted
+            for doc_id, text in zip(store._ids, store._texts):
+                store.keyword_index.add(doc_id, text)
+        return store